@@ -18,8 +18,8 @@ class MessageAdmin(admin.ModelAdmin):
     """
     Административная панель для сообщений
     """
-    list_display = ('id', 'chat', 'sender', 'content_preview', 'timestamp', 'is_read')
-    list_filter = ('is_read', 'timestamp')
+    list_display = ('id', 'chat', 'sender', 'content_preview', 'timestamp')
+    list_filter = ('timestamp',)
     search_fields = ('content', 'sender__username')
     date_hierarchy = 'timestamp'
     
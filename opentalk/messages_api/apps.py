@@ -5,4 +5,8 @@ from django.utils.translation import gettext_lazy as _
 class MessagesApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'messages_api'
-    verbose_name = _('Чаты и сообщения')
\ No newline at end of file
+    verbose_name = _('Чаты и сообщения')
+    
+    def ready(self):
+        # Подключение обработчиков сигналов (поисковый индекс сообщений)
+        from . import signals  # noqa: F401
@@ -0,0 +1,51 @@
+"""
+История сообщений чата с пагинацией по ключу (ID сообщения).
+
+ID сообщений возрастают вместе со временем отправки, поэтому страница истории -
+это диапазонный скан по индексу (chat_id, id) от опорного сообщения
+без OFFSET. Новые сообщения, пришедшие во время прокрутки, не сдвигают страницы.
+"""
+from django.conf import settings
+
+from .models import Message
+
+# Размер страницы истории по умолчанию и максимальный
+MESSAGE_HISTORY_PAGE_SIZE = getattr(settings, 'MESSAGE_HISTORY_PAGE_SIZE', 50)
+MESSAGE_HISTORY_MAX_PAGE_SIZE = getattr(settings, 'MESSAGE_HISTORY_MAX_PAGE_SIZE', 100)
+
+
+def _page(queryset, limit):
+    results = list(queryset[:limit + 1])
+    return results[:limit], len(results) > limit
+
+
+def message_history(chat, before=None, after=None, around=None, limit=MESSAGE_HISTORY_PAGE_SIZE):
+    """
+    Возвращает страницу сообщений чата от старых к новым и признаки наличия
+    более старых и более новых сообщений: (сообщения, has_more_before, has_more_after).
+    
+    - before: сообщения старше указанного ID;
+    - after: сообщения новее указанного ID;
+    - around: страница, в середине которой находится указанное сообщение;
+    - без параметров: последние сообщения чата.
+    """
+    limit = max(1, min(limit, MESSAGE_HISTORY_MAX_PAGE_SIZE))
+    messages = Message.objects.filter(chat=chat).prefetch_related('attachments')
+    older = messages.order_by('-id')
+    newer = messages.order_by('id')
+    
+    if around is not None:
+        older_page, has_more_before = _page(older.filter(id__lt=around), limit // 2)
+        newer_page, has_more_after = _page(newer.filter(id__gte=around), limit - limit // 2)
+        return older_page[::-1] + newer_page, has_more_before, has_more_after
+    
+    if after is not None:
+        page, has_more_after = _page(newer.filter(id__gt=after), limit)
+        has_more_before = messages.filter(id__lte=after).exists()
+        return page, has_more_before, has_more_after
+    
+    if before is not None:
+        older = older.filter(id__lt=before)
+    page, has_more_before = _page(older, limit)
+    has_more_after = before is not None and messages.filter(id__gte=before).exists()
+    return page[::-1], has_more_before, has_more_after
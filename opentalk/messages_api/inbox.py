@@ -0,0 +1,146 @@
+"""
+Денормализованное состояние чатов участников (InboxState).
+
+Для каждого участника чата хранится последнее сообщение, время последней
+активности и количество непрочитанных сообщений. Состояние обновляется
+в одной транзакции с отправкой сообщения и отметкой о прочтении,
+поэтому список чатов - это чтение по индексу (участник, активность)
+без агрегации по всей таблице сообщений.
+
+Прочтение хранится не флагом в каждом сообщении, а отметкой
+last_read_message_id: прочитать чат - одна запись в InboxState,
+а непрочитанные - это входящие сообщения с ID больше отметки.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, When
+
+from .models import Chat, InboxState, Message
+
+
+def create_inbox_states(chat):
+    """Создает состояния чата для обоих участников"""
+    InboxState.objects.bulk_create([
+        InboxState(chat=chat, user_id=user_id, last_activity=chat.created_at)
+        for user_id in (chat.user1_id, chat.user2_id)
+    ], ignore_conflicts=True)
+
+
+def record_message(message):
+    """
+    Обновляет состояние чата после отправки сообщения:
+    последнее сообщение у обоих участников, +1 непрочитанное у получателя
+    """
+    InboxState.objects.filter(chat_id=message.chat_id).update(
+        last_message=message,
+        last_activity=message.timestamp,
+        unread_count=Case(
+            When(user_id=message.sender_id, then=F('unread_count')),
+            default=F('unread_count') + 1,
+        ),
+    )
+
+
+def mark_read(chat, user, up_to=None):
+    """
+    Сдвигает отметку прочтения участника до сообщения up_to
+    (None - до последнего сообщения чата). Отметка не сдвигается назад.
+    Возвращает количество входящих сообщений, ставших прочитанными,
+    и новую отметку прочтения.
+    """
+    with transaction.atomic():
+        state = inbox_state(chat, user).select_for_update().first()
+        if state is None:
+            rebuild_inbox_states(Chat.objects.filter(pk=chat.pk))
+            state = inbox_state(chat, user).select_for_update().get()
+        
+        last_message_id = state.last_message_id or 0
+        up_to = last_message_id if up_to is None else min(up_to, last_message_id)
+        if up_to <= state.last_read_message_id:
+            return 0, state.last_read_message_id
+        
+        if up_to == last_message_id:
+            # Прочитан весь чат: непрочитанных не остается, считать сообщения не нужно
+            read_count = state.unread_count
+        else:
+            read_count = unread_messages(chat, user, state.last_read_message_id, up_to).count()
+        
+        state.last_read_message_id = up_to
+        state.unread_count = max(state.unread_count - read_count, 0)
+        state.save(update_fields=['last_read_message_id', 'unread_count'])
+        return read_count, up_to
+
+
+def inbox_chats(user):
+    """
+    Чаты пользователя с данными его состояния: непрочитанные, последнее сообщение
+    и время последней активности
+    """
+    return Chat.objects.filter(
+        inbox_states__user=user
+    ).select_related('user1', 'user2').annotate(
+        unread_count=F('inbox_states__unread_count'),
+        last_message_content=F('inbox_states__last_message__content'),
+        last_message_time=F('inbox_states__last_message__timestamp'),
+        last_activity=F('inbox_states__last_activity'),
+    ).order_by('-last_activity', '-id')
+
+
+def inbox_state(chat, user):
+    """Состояние чата участника"""
+    return InboxState.objects.filter(chat=chat, user=user)
+
+
+def incoming_messages(chat, user):
+    """Сообщения чата, отправленные собеседником пользователя"""
+    return Message.objects.filter(chat=chat).exclude(sender=user)
+
+
+def unread_messages(chat, user, last_read_message_id, up_to=None):
+    """Входящие сообщения после отметки прочтения (до сообщения up_to включительно)"""
+    messages = incoming_messages(chat, user).filter(id__gt=last_read_message_id)
+    if up_to is not None:
+        messages = messages.filter(id__lte=up_to)
+    return messages
+
+
+def read_watermarks(chat_ids):
+    """Возвращает отметки прочтения участников чатов: {ID чата: {ID пользователя: ID сообщения}}"""
+    watermarks = defaultdict(dict)
+    states = InboxState.objects.filter(chat_id__in=set(chat_ids)).values_list(
+        'chat_id', 'user_id', 'last_read_message_id'
+    )
+    for chat_id, user_id, last_read_message_id in states:
+        watermarks[chat_id][user_id] = last_read_message_id
+    return watermarks
+
+
+def is_read(message, watermarks):
+    """Прочитано ли сообщение собеседником отправителя"""
+    return any(
+        message.id <= last_read_message_id
+        for user_id, last_read_message_id in watermarks.get(message.chat_id, {}).items()
+        if user_id != message.sender_id
+    )
+
+
+def rebuild_inbox_states(chats=None):
+    """
+    Пересчитывает состояния чатов по сообщениям, сохраняя отметки прочтения.
+    Возвращает количество чатов.
+    """
+    chats = Chat.objects.all() if chats is None else chats
+    rebuilt = 0
+    for chat in chats.iterator():
+        last_message = chat.messages.order_by('-timestamp', '-id').first()
+        watermarks = read_watermarks([chat.id]).get(chat.id, {})
+        for user_id in (chat.user1_id, chat.user2_id):
+            last_read_message_id = watermarks.get(user_id, 0)
+            InboxState.objects.update_or_create(chat=chat, user_id=user_id, defaults={
+                'last_message': last_message,
+                'last_activity': last_message.timestamp if last_message else chat.created_at,
+                'unread_count': unread_messages(chat, user_id, last_read_message_id).count(),
+            })
+        rebuilt += 1
+    return rebuilt
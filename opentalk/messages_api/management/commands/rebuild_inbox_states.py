@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from messages_api.inbox import rebuild_inbox_states
+from messages_api.models import Chat
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает последние сообщения и счетчики непрочитанных в списках чатов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat', type=int, help='ID чата (по умолчанию - все чаты)')
+
+    def handle(self, *args, **options):
+        chats = Chat.objects.all()
+        if options['chat']:
+            chats = chats.filter(id=options['chat'])
+
+        rebuilt = rebuild_inbox_states(chats)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано чатов: {rebuilt}'))
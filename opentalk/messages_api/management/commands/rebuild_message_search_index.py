@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from messages_api.models import Message
+from messages_api.search import message_search_index
+
+
+class Command(BaseCommand):
+    help = 'Переиндексирует все сообщения в полнотекстовом индексе'
+
+    def handle(self, *args, **options):
+        if not message_search_index.is_supported:
+            self.stdout.write(self.style.WARNING('Полнотекстовый индекс не поддерживается этой СУБД'))
+            return
+
+        indexed = 0
+        for message_id, chat_id, content in Message.objects.values_list('id', 'chat_id', 'content').iterator():
+            message_search_index.index(message_id, content, scope_id=chat_id)
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано сообщений: {indexed}'))
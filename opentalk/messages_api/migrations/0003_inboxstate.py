@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_inbox_states(apps, schema_editor):
+    Chat = apps.get_model('messages_api', 'Chat')
+    Message = apps.get_model('messages_api', 'Message')
+    InboxState = apps.get_model('messages_api', 'InboxState')
+    
+    states = []
+    for chat in Chat.objects.iterator():
+        last_message = Message.objects.filter(chat=chat).order_by('-timestamp', '-id').first()
+        unread = dict(
+            Message.objects.filter(chat=chat, is_read=False).values('sender_id')
+            .annotate(count=Count('id')).values_list('sender_id', 'count')
+        )
+        for user_id, other_id in ((chat.user1_id, chat.user2_id), (chat.user2_id, chat.user1_id)):
+            states.append(InboxState(
+                chat=chat, user_id=user_id, last_message=last_message,
+                last_activity=last_message.timestamp if last_message else chat.created_at,
+                unread_count=unread.get(other_id, 0),
+            ))
+    InboxState.objects.bulk_create(states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_api', '0002_message_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField(verbose_name='Последняя активность')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='Непрочитанных сообщений')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_states', to='messages_api.chat', verbose_name='Чат')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messages_api.message', verbose_name='Последнее сообщение')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_states', to=settings.AUTH_USER_MODEL, verbose_name='Участник')),
+            ],
+            options={
+                'verbose_name': 'Состояние чата участника',
+                'verbose_name_plural': 'Состояния чатов участников',
+                'indexes': [models.Index(fields=['user', '-last_activity', '-chat'], name='inbox_user_activity_idx')],
+                'unique_together': {('chat', 'user')},
+            },
+        ),
+        migrations.RunPython(fill_inbox_states, migrations.RunPython.noop),
+    ]
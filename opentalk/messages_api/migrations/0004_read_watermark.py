@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:32
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def fill_read_watermarks(apps, schema_editor):
+    """
+    Переносит флаги is_read в отметки прочтения: отметка ставится перед первым
+    непрочитанным входящим сообщением, а если таких нет - на последнее входящее
+    """
+    InboxState = apps.get_model('messages_api', 'InboxState')
+    Message = apps.get_model('messages_api', 'Message')
+    
+    for state in InboxState.objects.iterator():
+        incoming = Message.objects.filter(chat_id=state.chat_id).exclude(sender_id=state.user_id)
+        first_unread = incoming.filter(is_read=False).aggregate(id=Min('id'))['id']
+        if first_unread is not None:
+            watermark = incoming.filter(id__lt=first_unread).aggregate(id=Max('id'))['id'] or 0
+        else:
+            watermark = incoming.aggregate(id=Max('id'))['id'] or 0
+        state.last_read_message_id = watermark
+        state.unread_count = incoming.filter(id__gt=watermark).count()
+        state.save(update_fields=['last_read_message_id', 'unread_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_api', '0003_inboxstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxstate',
+            name='last_read_message_id',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='ID последнего прочитанного сообщения'),
+        ),
+        migrations.RunPython(fill_read_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from opentalk.search import FullTextIndex
+
+message_search_index = FullTextIndex('messages_api_message_search', scoped=True)
+
+
+def rebuild_index(apps, schema_editor):
+    # Чат сообщения становится частью ключа индекса: пересоздаем таблицу и индексируем заново
+    message_search_index.drop(schema_editor)
+    message_search_index.create(schema_editor)
+    
+    if message_search_index.is_supported:
+        Message = apps.get_model('messages_api', 'Message')
+        for message_id, chat_id, content in Message.objects.values_list('id', 'chat_id', 'content').iterator():
+            message_search_index.index(message_id, content, scope_id=chat_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_api', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_index, migrations.RunPython.noop),
+    ]
@@ -130,15 +130,69 @@ class Message(models.Model):
         auto_now_add=True,
         verbose_name=_("Дата отправки")
     )
-    is_read = models.BooleanField(
-        default=False,
-        verbose_name=_("Прочитано")
-    )
     
     class Meta:
         verbose_name = _("Сообщение")
         verbose_name_plural = _("Сообщения")
         ordering = ['-timestamp']
+        indexes = [
+            # История чата и непрочитанные сообщения выше отметки прочтения
+            models.Index(fields=['chat', 'id'], name='message_chat_id_idx'),
+            # Последнее сообщение чата
+            models.Index(fields=['chat', '-timestamp', '-id'], name='message_chat_timestamp_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Сообщение от {self.sender.username} в {self.chat}"
+
+class InboxState(models.Model):
+    """
+    Состояние чата для одного участника: последнее сообщение, количество непрочитанных
+    и отметка прочтения. Денормализовано, чтобы список чатов читался по индексу
+    без агрегации сообщений.
+    
+    Отметка прочтения last_read_message_id - ID последнего прочитанного сообщения:
+    все сообщения собеседника с меньшим или равным ID считаются прочитанными.
+    """
+    chat = models.ForeignKey(
+        Chat,
+        on_delete=models.CASCADE,
+        related_name='inbox_states',
+        verbose_name=_("Чат")
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='inbox_states',
+        verbose_name=_("Участник")
+    )
+    last_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_("Последнее сообщение")
+    )
+    last_activity = models.DateTimeField(
+        verbose_name=_("Последняя активность")
+    )
+    unread_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Непрочитанных сообщений")
+    )
+    last_read_message_id = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_("ID последнего прочитанного сообщения")
+    )
+    
+    class Meta:
+        verbose_name = _("Состояние чата участника")
+        verbose_name_plural = _("Состояния чатов участников")
+        unique_together = ('chat', 'user')
+        indexes = [
+            models.Index(fields=['user', '-last_activity', '-chat'], name='inbox_user_activity_idx'),
+        ]
     
     def __str__(self):
-        return f"Сообщение от {self.sender.username} в {self.chat}"
\ No newline at end of file
+        return f"{self.user.username} в {self.chat}"
@@ -0,0 +1,11 @@
+from django.db import models
+from opentalk.pagination import KeysetPagination
+
+
+class ChatCursorPagination(KeysetPagination):
+    """
+    Курсорная пагинация списка чатов по последней активности (last_activity, id)
+    """
+    ordering = ('-last_activity', '-id')
+    field_types = {'last_activity': models.DateTimeField()}
+    page_size = 20
@@ -0,0 +1,12 @@
+from opentalk.search import FullTextIndex
+
+# Полнотекстовый индекс сообщений, scope_id - ID чата
+message_search_index = FullTextIndex('messages_api_message_search', scoped=True)
+
+
+def index_message(message):
+    message_search_index.index(message.id, message.content, scope_id=message.chat_id)
+
+
+def remove_message(message_id):
+    message_search_index.remove(message_id)
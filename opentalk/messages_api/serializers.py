@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import models
 from users.serializers import UserMiniSerializer
 from .models import Chat, Message, Attachment
+from . import inbox
 
 User = get_user_model()
 
@@ -24,17 +26,46 @@ class AttachmentSerializer(serializers.ModelSerializer):
         return None
 
 
+class MessageListSerializer(serializers.ListSerializer):
+    """
+    Списочный сериализатор сообщений.
+    
+    Загружает отметки прочтения участников всех чатов страницы одним запросом.
+    """
+    def to_representation(self, data):
+        messages = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.preload(messages)
+        return super().to_representation(messages)
+
+
 class MessageSerializer(serializers.ModelSerializer):
     """
     Сериализатор для сообщений
     """
     sender = UserMiniSerializer(read_only=True)
     attachments = AttachmentSerializer(many=True, read_only=True)
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = ['id', 'chat', 'sender', 'content', 'timestamp', 'is_read', 'attachments']
-        read_only_fields = ['chat', 'sender', 'timestamp', 'is_read']
+        read_only_fields = ['chat', 'sender', 'timestamp']
+        list_serializer_class = MessageListSerializer
+    
+    def preload(self, messages):
+        """
+        Загружает отметки прочтения для списка сообщений
+        """
+        self._watermarks = inbox.read_watermarks(message.chat_id for message in messages)
+    
+    def get_is_read(self, obj):
+        """
+        Сообщение прочитано, если отметка прочтения собеседника не меньше его ID
+        """
+        watermarks = getattr(self, '_watermarks', None)
+        if watermarks is None:
+            watermarks = inbox.read_watermarks([obj.chat_id])
+        return inbox.is_read(obj, watermarks)
 
 
 class MessageCreateSerializer(serializers.ModelSerializer):
@@ -114,7 +145,14 @@ class ChatListSerializer(serializers.ModelSerializer):
         """
         Возвращает последнее сообщение в чате
         """
-        last_message = obj.messages.order_by('-timestamp').first()
+        if hasattr(obj, 'last_message_time'):
+            # Последнее сообщение уже выбрано соединением с InboxState в ChatViewSet.get_inbox_queryset
+            # (inbox.inbox_chats), отдельный запрос к сообщениям не нужен
+            if obj.last_message_time is None:
+                return None
+            last_message = Message(content=obj.last_message_content, timestamp=obj.last_message_time)
+        else:
+            last_message = obj.messages.order_by('-timestamp').first()
         if last_message:
             return LastMessageSerializer(last_message).data
         return None
\ No newline at end of file
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Message
+from .search import index_message, remove_message
+
+
+@receiver(post_save, sender=Message)
+def index_saved_message(sender, instance, raw=False, **kwargs):
+    """Обновляет сообщение в полнотекстовом индексе"""
+    if not raw:
+        index_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def remove_deleted_message(sender, instance, **kwargs):
+    """Удаляет сообщение из полнотекстового индекса"""
+    remove_message(instance.id)
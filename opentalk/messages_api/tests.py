@@ -0,0 +1,191 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from opentalk.testing import OpenTalkTestCase
+from users.models import User
+from .inbox import rebuild_inbox_states
+from .models import Attachment, Chat, InboxState, Message
+
+
+class MessageSearchTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='x')
+        self.friend = User.objects.create_user('friend', password='x')
+        self.stranger = User.objects.create_user('stranger', password='x')
+        self.chat = Chat.objects.create(user1=self.user, user2=self.friend)
+        self.other_chat = Chat.objects.create(user1=self.stranger, user2=self.user)
+        self.foreign_chat = Chat.objects.create(user1=self.friend, user2=self.stranger)
+        Message.objects.create(chat=self.chat, sender=self.user, content='Привет, как <дела>?')
+        Message.objects.create(chat=self.foreign_chat, sender=self.friend, content='Привет всем')
+        self.greeting = Message.objects.create(chat=self.other_chat, sender=self.stranger,
+                                               content='приветствую, приветы')
+        self.client = self.client_for(self.user)
+
+    def search(self, **params):
+        return self.client.get('/api/messages/search/', params)
+
+    def test_search_is_limited_to_own_chats(self):
+        with CaptureQueriesContext(connection) as queries:
+            found = self.search(q='привет').json()
+        self.assertEqual([message['id'] for message in found][0], self.greeting.id)
+        self.assertEqual(len(found), 2)
+        self.assertIn('<mark>Привет</mark>, как &lt;дела&gt;?', [message['snippet'] for message in found])
+
+        # Чат проверяется внутри MATCH, а не фильтром по совпадениям из всех чатов
+        search_sql = [query['sql'] for query in queries if 'messages_api_message_search' in query['sql']]
+        self.assertEqual(len(search_sql), 1)
+        self.assertNotIn('scope_id IN', search_sql[0])
+
+    def test_search_in_one_chat(self):
+        self.assertEqual(len(self.search(q='привет', chatId=self.chat.id).json()), 1)
+        self.assertEqual(self.search(q='привет', chatId=self.foreign_chat.id).json(), [])
+        self.assertEqual(self.search(q='привет', chatId='abc').status_code, 400)
+
+    def test_deleted_messages_leave_the_index(self):
+        self.greeting.delete()
+        self.assertEqual(len(self.search(q='привет').json()), 1)
+
+    def test_limit_is_validated(self):
+        self.assertEqual(len(self.search(q='привет', limit=1).json()), 1)
+        self.assertEqual(len(self.search(q='привет', limit='abc').json()), 2)
+        self.assertEqual(len(self.search(q='привет', limit=-1).json()), 1)
+
+
+class ChatListTests(OpenTalkTestCase):
+    def test_chat_list_in_constant_queries(self):
+        user = User.objects.create_user('user', password='x')
+        chats = []
+        for i in range(30):
+            other = User.objects.create_user(f'other{i}', password='x')
+            chat = Chat.objects.create(user1=user if i % 2 else other, user2=other if i % 2 else user)
+            chats.append(chat)
+            if i % 3:
+                Message.objects.create(chat=chat, sender=other, content=f'first{i}')
+                Message.objects.create(chat=chat, sender=user, content=f'last{i}')
+                if i % 5 == 0:
+                    Message.objects.create(chat=chat, sender=other, content=f'reply{i}')
+        # Чаты созданы в обход API, без состояния входящих
+        rebuild_inbox_states()
+        client = self.client_for(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            page = client.get('/api/chats/').json()
+        self.assertLessEqual(len(queries), 3)
+        self.assertEqual(len(page['results']), 20)
+        latest = page['results'][0]
+        self.assertEqual((latest['user']['username'], latest['last_message']['content'], latest['unread_count']),
+                         ('other29', 'last29', 1))
+        replied = next(chat for chat in page['results'] if chat['user']['username'] == 'other25')
+        self.assertEqual((replied['last_message']['content'], replied['unread_count']), ('reply25', 2))
+
+        next_page = client.get(page['next']).json()
+        self.assertEqual(sorted(chat['id'] for chat in page['results'] + next_page['results']),
+                         sorted(chat.id for chat in chats))
+        self.assertIsNone(next_page['results'][-1]['last_message'])
+
+
+class ChatTestCase(OpenTalkTestCase):
+    """Чат двух пользователей, созданный через API"""
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='x')
+        self.friend = User.objects.create_user('friend', password='x')
+        self.user_client = self.client_for(self.user)
+        self.friend_client = self.client_for(self.friend)
+        self.chat_id = self.user_client.post('/api/chats/', {'userId': self.friend.id}, format='json').json()['id']
+
+    def send(self, client, content):
+        return client.post(f'/api/chats/{self.chat_id}/send_message/', {'content': content}, format='json').json()
+
+    def inbox(self, client):
+        return client.get('/api/chats/').json()['results'][0]
+
+
+class InboxTests(ChatTestCase):
+    def test_inbox_state_follows_messages(self):
+        self.assertIsNone(self.inbox(self.friend_client)['last_message'])
+        for i in range(3):
+            self.send(self.user_client, f'hello{i}')
+        self.send(self.friend_client, 'reply')
+
+        friend_inbox = self.inbox(self.friend_client)
+        self.assertEqual((friend_inbox['unread_count'], friend_inbox['last_message']['content']), (3, 'reply'))
+        self.assertEqual(self.inbox(self.user_client)['unread_count'], 1)
+
+    def test_inbox_states_are_rebuilt(self):
+        self.send(self.user_client, 'hello')
+        InboxState.objects.all().delete()
+        rebuild_inbox_states()
+        self.assertEqual(self.inbox(self.friend_client)['unread_count'], 1)
+        self.assertEqual(self.inbox(self.user_client)['last_message']['content'], 'hello')
+
+
+class ReadWatermarkTests(ChatTestCase):
+    def test_reads_move_the_watermark(self):
+        ids = [self.send(self.user_client, f'hello{i}')['id'] for i in range(3)]
+        self.send(self.friend_client, 'reply')
+        url = f'/api/chats/{self.chat_id}/messages/read/'
+
+        response = self.friend_client.put(url, {'message_ids': ids[:2]}, format='json').json()
+        self.assertEqual(response['updated_count'], 2)
+        self.assertEqual(self.inbox(self.friend_client)['unread_count'], 1)
+        history = self.user_client.get(f'/api/chats/{self.chat_id}/messages/').json()['results']
+        self.assertEqual([message['is_read'] for message in history], [True, True, False, False])
+
+        # Уже прочитанные сообщения повторно не учитываются
+        response = self.friend_client.put(url, {'message_ids': [ids[0]]}, format='json').json()
+        self.assertEqual(response['updated_count'], 0)
+
+        response = self.friend_client.put(url, {}, format='json').json()
+        self.assertEqual(response['updated_count'], 1)
+        self.assertEqual(self.inbox(self.friend_client)['unread_count'], 0)
+        # Свои сообщения собеседника остаются непрочитанными для отправителя
+        self.assertEqual(self.inbox(self.user_client)['unread_count'], 1)
+
+
+class MessageHistoryTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('user', password='x')
+        friend = User.objects.create_user('friend', password='x')
+        chat = Chat.objects.create(user1=user, user2=friend)
+        self.ids = []
+        for i in range(250):
+            message = Message.objects.create(chat=chat, sender=user if i % 2 else friend, content=str(i))
+            if i % 10 == 0:
+                message.attachments.add(Attachment.objects.create(file='file.txt', file_name='file.txt', uploader=user))
+            self.ids.append(message.id)
+        rebuild_inbox_states()
+        self.client = self.client_for(user)
+        self.url = f'/api/chats/{chat.id}/messages/'
+
+    def history(self, **params):
+        return self.client.get(self.url, params).json()
+
+    def test_latest_page(self):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.history()
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(len(page['results']), 50)
+        self.assertEqual(page['results'][-1]['content'], '249')
+        self.assertEqual((page['has_more_before'], page['has_more_after']), (True, False))
+
+    def test_pages_around_anchor(self):
+        page = self.history(before=self.ids[50], limit=1000)
+        self.assertEqual(len(page['results']), 50)
+        self.assertEqual(page['results'][0]['content'], '0')
+        self.assertEqual((page['has_more_before'], page['has_more_after']), (False, True))
+
+        page = self.history(after=self.ids[200], limit=100)
+        self.assertEqual([message['content'] for message in page['results']][:2], ['201', '202'])
+        self.assertEqual((page['has_more_before'], page['has_more_after']), (True, False))
+
+        page = self.history(around=self.ids[100], limit=10)
+        self.assertEqual([message['content'] for message in page['results']], [str(i) for i in range(95, 105)])
+        page = self.history(around=self.ids[100], limit=10, sortOrder='desc')
+        self.assertEqual(page['results'][0]['content'], '104')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'before': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'before': 1, 'after': 2}).status_code, 400)
@@ -6,7 +6,16 @@ from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Count, Max, F, Value, BooleanField
 from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from opentalk.pagination import get_limit
+from opentalk.routers import ReplicaReadMixin, use_primary
+from opentalk.search import highlight
 from .models import Chat, Message, Attachment
+from .search import message_search_index
+from .pagination import ChatCursorPagination
+from .history import message_history
+from . import inbox
+from realtime import events
 from .serializers import (
     ChatSerializer, MessageSerializer, AttachmentSerializer,
     ChatListSerializer, MessageCreateSerializer, MessageReadSerializer
@@ -15,35 +24,32 @@ from .serializers import (
 User = get_user_model()
 
 
-class ChatViewSet(viewsets.ModelViewSet):
+class ChatViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с чатами
     """
     serializer_class = ChatSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ChatCursorPagination
     
     def get_queryset(self):
         """
-        Возвращает все чаты пользователя с дополнительной информацией:
-        - количество непрочитанных сообщений
-        - последнее сообщение
+        Возвращает все чаты пользователя
         """
         user = self.request.user
         
         # Находим все чаты, где участвует пользователь
-        chats = Chat.objects.filter(
+        return Chat.objects.filter(
             Q(user1=user) | Q(user2=user)
-        ).annotate(
-            # Количество непрочитанных сообщений
-            unread_count=Count(
-                'messages',
-                filter=Q(messages__is_read=False) & ~Q(messages__sender=user)
-            ),
-            # Последнее сообщение
-            last_message_time=Max('messages__timestamp')
-        ).order_by('-last_message_time')
-        
-        return chats
+        ).select_related('user1', 'user2')
+    
+    def get_inbox_queryset(self):
+        """
+        Возвращает чаты пользователя с дополнительной информацией из InboxState:
+        - количество непрочитанных сообщений
+        - последнее сообщение
+        """
+        return inbox.inbox_chats(self.request.user)
     
     def retrieve(self, request, *args, **kwargs):
         """
@@ -66,13 +72,14 @@ class ChatViewSet(viewsets.ModelViewSet):
         """
         Получение списка всех чатов пользователя
         """
-        queryset = self.get_queryset()
+        queryset = self.get_inbox_queryset()
+        page = self.paginate_queryset(queryset)
         serializer = ChatListSerializer(
-            queryset, 
+            page, 
             many=True, 
             context={'request': request}
         )
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
     
     def create(self, request, *args, **kwargs):
         """
@@ -106,15 +113,20 @@ class ChatViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
         
         # Создаем новый чат
-        chat = Chat.objects.create(user1=user, user2=other_user)
+        with transaction.atomic():
+            chat = Chat.objects.create(user1=user, user2=other_user)
+            inbox.create_inbox_states(chat)
         
         serializer = self.get_serializer(chat)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['get'])
+    @use_primary
     def messages(self, request, pk=None):
         """
-        Получение сообщений конкретного чата
+        Получение сообщений конкретного чата.
+        Читается из основной базы: клиент запрашивает историю сразу после
+        WebSocket-события о новом сообщении, реплика может еще не получить его.
         """
         chat = self.get_object()
         user = request.user
@@ -126,25 +138,38 @@ class ChatViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Параметры пагинации и сортировки
-        limit = int(request.query_params.get('limit', 50))
-        offset = int(request.query_params.get('offset', 0))
-        sort_order = request.query_params.get('sortOrder', 'asc')
+        # Опорное сообщение и размер страницы
+        params = {}
+        for name in ('before', 'after', 'around', 'limit'):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            try:
+                params[name] = int(value)
+            except ValueError:
+                return Response(
+                    {"detail": f"Параметр {name} должен быть целым числом."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
-        # Получаем сообщения
-        messages = chat.messages.all()
+        if len({'before', 'after', 'around'} & params.keys()) > 1:
+            return Response(
+                {"detail": "Можно указать только один из параметров before, after и around."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Сортировка
-        if sort_order == 'asc':
-            messages = messages.order_by('timestamp')
-        else:
-            messages = messages.order_by('-timestamp')
+        messages, has_more_before, has_more_after = message_history(chat, **params)
         
-        # Пагинация
-        messages = messages[offset:offset + limit]
+        # Сортировка
+        if request.query_params.get('sortOrder', 'asc') != 'asc':
+            messages.reverse()
         
         serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        return Response({
+            "results": serializer.data,
+            "has_more_before": has_more_before,
+            "has_more_after": has_more_after,
+        })
     
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -164,24 +189,30 @@ class ChatViewSet(viewsets.ModelViewSet):
         # Создание сериализатора с данными запроса
         serializer = MessageCreateSerializer(data=request.data)
         if serializer.is_valid():
-            # Сохраняем сообщение
-            message = serializer.save(chat=chat, sender=user)
+            with transaction.atomic():
+                # Сохраняем сообщение
+                message = serializer.save(chat=chat, sender=user)
+                
+                # Обработка вложений, если есть
+                attachments = request.data.get('attachments', [])
+                if attachments:
+                    for attachment_id in attachments:
+                        try:
+                            attachment = Attachment.objects.get(id=attachment_id, uploader=user)
+                            message.attachments.add(attachment)
+                        except Attachment.DoesNotExist:
+                            pass
+                
+                # Последнее сообщение и счетчик непрочитанных в списке чатов
+                inbox.record_message(message)
+            
+            data = MessageSerializer(message).data
             
-            # Обработка вложений, если есть
-            attachments = request.data.get('attachments', [])
-            if attachments:
-                for attachment_id in attachments:
-                    try:
-                        attachment = Attachment.objects.get(id=attachment_id, uploader=user)
-                        message.attachments.add(attachment)
-                    except Attachment.DoesNotExist:
-                        pass
+            # Новое сообщение участникам чата через WebSocket
+            events.message_created(message, data)
             
             # Возвращаем данные созданного сообщения
-            return Response(
-                MessageSerializer(message).data,
-                status=status.HTTP_201_CREATED
-            )
+            return Response(data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -204,21 +235,19 @@ class ChatViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             message_ids = serializer.validated_data.get('message_ids', [])
             
-            # Если список ID пуст, отмечаем все непрочитанные сообщения
+            # Если список ID пуст, отмечаем весь чат прочитанным
             if not message_ids:
-                updated_count = Message.objects.filter(
-                    chat=chat,
-                    is_read=False,
-                    sender__ne=user
-                ).update(is_read=True)
+                updated_count, last_read_message_id = inbox.mark_read(chat, user)
             else:
-                # Отмечаем указанные сообщения как прочитанные
-                updated_count = Message.objects.filter(
-                    id__in=message_ids,
-                    chat=chat,
-                    is_read=False,
-                    sender__ne=user
-                ).update(is_read=True)
+                # Сдвигаем отметку прочтения до последнего из указанных входящих сообщений
+                up_to = inbox.incoming_messages(chat, user).filter(
+                    id__in=message_ids
+                ).aggregate(id=Max('id'))['id']
+                updated_count, last_read_message_id = inbox.mark_read(chat, user, up_to) if up_to else (0, None)
+            
+            # Отметка о прочтении собеседнику через WebSocket
+            if updated_count:
+                events.messages_read(chat, user.id, last_read_message_id)
             
             return Response({
                 "status": "success",
@@ -228,7 +257,7 @@ class ChatViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MessageViewSet(viewsets.ReadOnlyModelViewSet):
+class MessageViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для работы с сообщениями (только для чтения)
     """
@@ -254,23 +283,42 @@ class MessageViewSet(viewsets.ReadOnlyModelViewSet):
         user = request.user
         query = request.query_params.get('q', '')
         chat_id = request.query_params.get('chatId')
-        limit = int(request.query_params.get('limit', 20))
+        limit = get_limit(request)
         
-        if not query:
+        if not query.strip():
             return Response({"detail": "Поисковый запрос не может быть пустым."}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        messages = self.get_queryset().filter(content__icontains=query)
+        if chat_id and not chat_id.isdigit():
+            return Response({"detail": "Параметр chatId должен быть целым числом."},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        # Если указан ID чата, ограничиваем поиск этим чатом
-        if chat_id:
-            messages = messages.filter(chat_id=chat_id)
-        
-        # Ограничение количества результатов
-        messages = messages[:limit]
+        if not message_search_index.is_supported:
+            messages = self.get_queryset().filter(content__icontains=query)
+            
+            # Если указан ID чата, ограничиваем поиск этим чатом
+            if chat_id:
+                messages = messages.filter(chat_id=chat_id)
+            
+            # Ограничение количества результатов
+            messages = messages.prefetch_related('attachments')[:limit]
+        else:
+            # Поиск в индексе ограничен чатами пользователя
+            chat_ids = Chat.objects.filter(Q(user1=user) | Q(user2=user)).values_list('id', flat=True)
+            if chat_id:
+                chat_ids = chat_ids.filter(id=chat_id)
+            
+            hits = message_search_index.search(query, limit=limit, scope=chat_ids)
+            messages_by_id = Message.objects.select_related('sender').prefetch_related(
+                'attachments'
+            ).in_bulk([hit.doc_id for hit in hits])
+            messages = [messages_by_id[hit.doc_id] for hit in hits if hit.doc_id in messages_by_id]
         
         serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        data = serializer.data
+        for item, message in zip(data, messages):
+            item['snippet'] = highlight(message.content, query)
+        return Response(data)
 
 
 class AttachmentViewSet(viewsets.ModelViewSet):
@@ -30,6 +30,14 @@ class Notification(models.Model):
         verbose_name = _("Уведомление")
         verbose_name_plural = _("Уведомления")
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notification_user_created_idx'),
+            # Непрочитанные уведомления пользователя
+            models.Index(
+                fields=['user', '-created_at'], condition=models.Q(is_read=False),
+                name='notification_unread_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_type_display()} для {self.user.username}"
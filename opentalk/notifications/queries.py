@@ -0,0 +1,17 @@
+"""
+Запросы уведомлений, которые выполняются при каждом открытии списка уведомлений.
+
+Представления строят выборки только через эти функции: по ним же команда
+check_query_plans проверяет планы выполнения.
+"""
+from .models import Notification
+
+
+def user_notifications(user):
+    """Уведомления пользователя от новых к старым"""
+    return Notification.objects.filter(user=user).order_by('-created_at')
+
+
+def unread_notifications(user):
+    """Непрочитанные уведомления пользователя"""
+    return Notification.objects.filter(user=user, is_read=False)
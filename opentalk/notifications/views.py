@@ -5,11 +5,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from datetime import datetime, timedelta
+from opentalk.routers import ReplicaReadMixin
 from .models import Notification, PremiumSubscription
+from .queries import unread_notifications, user_notifications
 from .serializers import NotificationSerializer, PremiumSubscriptionSerializer, PremiumPlanSerializer
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с уведомлениями пользователя
     """
@@ -18,7 +20,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Возвращает уведомления текущего пользователя"""
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        return user_notifications(self.request.user)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -26,7 +28,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['put'], permission_classes=[IsAuthenticated])
     def read_all(self, request):
         """Отметить все уведомления как прочитанные"""
-        notifications = self.get_queryset().filter(is_read=False)
+        notifications = unread_notifications(request.user)
         notifications.update(is_read=True)
         return Response({"status": "Все уведомления отмечены как прочитанные"}, status=status.HTTP_200_OK)
     
@@ -144,7 +146,7 @@ class PremiumViewSet(viewsets.ModelViewSet):
         
         # Обновление флага премиум-пользователя
         user.is_premium = True
-        user.save()
+        user.save(update_fields=['is_premium'])
         
         serializer = PremiumSubscriptionSerializer(subscription)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -173,6 +175,6 @@ class PremiumViewSet(viewsets.ModelViewSet):
         # Если срок подписки истек, убираем флаг премиум
         if subscription.expires_at <= datetime.now():
             user.is_premium = False
-            user.save()
+            user.save(update_fields=['is_premium'])
         
         return Response({"status": "Подписка успешно отменена"}, status=status.HTTP_200_OK)
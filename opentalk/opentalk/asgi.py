@@ -2,6 +2,7 @@
 ASGI config for opentalk project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are handled by Django, WebSocket connections by realtime.gateway.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +14,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'opentalk.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после инициализации Django: шлюз использует модели
+from realtime.gateway import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,107 @@
+"""
+Буфер отложенной записи (write-behind) для частых мелких изменений.
+
+Изменения накапливаются в памяти процесса и записываются в базу пачкой:
+раз в flush_interval_ms миллисекунд или после flush_events изменений.
+Хвост изменений без новых событий записывает фоновый таймер; поток таймера
+закрывает свои соединения с базой после записи.
+
+Ошибка записи не передается вызывающему коду: запрос, который вызвал сброс,
+уже зафиксировал свои данные. Ошибка пишется в лог, а изменения возвращаются
+в буфер и записываются при следующем сбросе (не позже чем через flush_interval_ms).
+
+Подкласс хранит изменения в структуре, которую создает empty(), и определяет
+record() - добавление изменения, write() - запись пачки в базу
+и restore() - возврат незаписанной пачки в буфер.
+"""
+import logging
+import threading
+import time
+
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Основа буферов отложенной записи"""
+    def __init__(self, flush_interval_ms, flush_events):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_events = flush_events
+        self._lock = threading.Lock()
+        self._pending = self.empty()
+        self._events = 0
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def empty(self):
+        """Пустая пачка изменений"""
+        raise NotImplementedError
+
+    def record(self, pending, *change):
+        """Добавляет изменение в пачку"""
+        raise NotImplementedError
+
+    def write(self, pending):
+        """Записывает пачку в базу. Возвращает количество обновленных объектов"""
+        raise NotImplementedError
+
+    def restore(self, pending):
+        """Возвращает незаписанную пачку в буфер (вызывается под блокировкой)"""
+        raise NotImplementedError
+
+    def add(self, *change):
+        """Добавляет изменение в буфер"""
+        with self._lock:
+            self.record(self._pending, *change)
+            self._events += 1
+            due = (
+                self._events >= self.flush_events
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if not due:
+                # Гарантируем запись хвоста изменений, даже если новых событий не будет
+                self._schedule()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Записывает накопленные изменения в базу.
+        Возвращает количество обновленных объектов, при ошибке - 0.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, self.empty()
+            self._events = 0
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return 0
+        try:
+            # Точка сохранения: сбой записи не ломает транзакцию запроса, вызвавшего сброс
+            with transaction.atomic():
+                return self.write(pending)
+        except Exception:
+            logger.exception('Не удалось записать буфер %s, изменения сохранены до следующего сброса',
+                             type(self).__name__)
+            with self._lock:
+                self.restore(pending)
+                self._schedule()
+            return 0
+
+    def _schedule(self):
+        """Запускает таймер сброса, если он еще не запущен (вызывается под блокировкой)"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            # Соединения с базой привязаны к потоку таймера, который сейчас завершится
+            connections.close_all()
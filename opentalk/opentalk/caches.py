@@ -0,0 +1,73 @@
+"""
+Настройки кеша из переменных окружения.
+
+Кеш должен быть общим для всех процессов: в нем хранятся сессии входа по QR-коду,
+присутствие пользователей, рекомендации и кеш ответов API. Бэкенд выбирается схемой CACHE_URL:
+
+- file:///var/tmp/opentalk_cache (по умолчанию - каталог во временной папке) -
+  общий для процессов одной машины, для разработки;
+- db://opentalk_cache - таблица в базе данных (создается командой createcachetable);
+- redis://host:6379/0 - для продакшена (нужен пакет redis);
+- memcached://host:11211 - для продакшена (нужен пакет pymemcache);
+- locmem:// - память процесса, только для тестов.
+
+CACHE_KEY_PREFIX отделяет ключи нескольких окружений в одном сервере кеша.
+
+Бэкенды file, db и locmem сами ограничивают число записей и при переполнении
+удаляют часть из них (по умолчанию уже после 300). Присутствие и сессии входа
+не должны пропадать раньше своего времени жизни, поэтому лимит поднят до
+CACHE_MAX_ENTRIES; redis и memcached вытесняют записи по своей настройке памяти.
+"""
+import os
+import tempfile
+from urllib.parse import unquote, urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .databases import env_int
+
+BACKENDS = {
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+
+# Бэкенды, которые удаляют записи сверх OPTIONS['MAX_ENTRIES']
+CULLING_BACKENDS = ('file', 'db', 'locmem')
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'opentalk_cache')
+
+
+def cache_config(url):
+    """Возвращает словарь для settings.CACHES по URL кеша"""
+    parts = urlsplit(url or f'file://{DEFAULT_CACHE_DIR}')
+    if parts.scheme not in BACKENDS:
+        raise ImproperlyConfigured(
+            f'Неподдерживаемая схема CACHE_URL: {parts.scheme!r}. '
+            f'Используйте одну из: {", ".join(sorted(BACKENDS))}'
+        )
+
+    if parts.scheme == 'file':
+        location = unquote(parts.path)
+    elif parts.scheme == 'db':
+        location = parts.netloc or 'opentalk_cache'
+    elif parts.scheme in ('redis', 'rediss'):
+        location = url
+    elif parts.scheme == 'memcached':
+        location = parts.netloc
+    else:
+        location = parts.netloc or 'opentalk'
+
+    config = {
+        'BACKEND': BACKENDS[parts.scheme],
+        'LOCATION': location,
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'opentalk'),
+        'TIMEOUT': 300,
+    }
+    if parts.scheme in CULLING_BACKENDS:
+        # Присутствие, мини-профили и версии ответов - по записи на пользователя и объект
+        config['OPTIONS'] = {'MAX_ENTRIES': env_int('CACHE_MAX_ENTRIES', 200_000)}
+    return config
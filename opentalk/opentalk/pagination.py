@@ -0,0 +1,167 @@
+"""
+Общие классы пагинации проекта
+"""
+import json
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация по составному ключу (по умолчанию (created_at, id)).
+
+    В отличие от PageNumberPagination не выполняет COUNT(*) и OFFSET:
+    каждая страница - это диапазонный скан по индексу от позиции курсора,
+    поэтому 500-я страница стоит столько же, сколько первая.
+    Курсоры непрозрачны для клиента, общее количество не возвращается.
+
+    Для сортировки по аннотированному значению укажите его тип в field_types:
+
+        field_types = {'last_activity': models.DateTimeField()}
+    """
+    ordering = ('-created_at', '-id')
+    field_types = {}
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.descending = self.ordering[0].startswith('-')
+
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        results = list(self.page_queryset(queryset, position, reverse))
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.next_position = self._position(results[-1]) if results and self.has_next else None
+        self.previous_position = self._position(results[0]) if results and self.has_previous else None
+        return results
+
+    def page_queryset(self, queryset, position=None, reverse=False):
+        """
+        Запрос страницы от позиции курсора: page_size + 1 записей,
+        лишняя запись показывает, есть ли следующая страница
+        """
+        if not hasattr(self, 'fields'):
+            self.fields = [field.lstrip('-') for field in self.ordering]
+            self.descending = self.ordering[0].startswith('-')
+
+        # При движении назад сканируем в обратном порядке и затем разворачиваем страницу
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(*[prefix + field for field in self.fields])
+        if position is not None:
+            queryset = queryset.filter(self._after(position, descending))
+        return queryset[:self.page_size + 1]
+
+    def _after(self, position, descending):
+        """Условие "строго после позиции" в порядке сортировки для составного ключа"""
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            equal = {name: value for name, value in zip(self.fields[:index], position[:index])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[index]})
+        return condition
+
+    def _position(self, instance):
+        return [getattr(instance, field) for field in self.fields]
+
+    def decode_cursor(self, request, model=None):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = data['p']
+            reverse = bool(data.get('r'))
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                self._get_field(model, field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _get_field(self, model, name):
+        if name in self.field_types:
+            return self.field_types[name]
+        return model._meta.get_field(name)
+
+    def encode_cursor(self, position, reverse=False):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        data = {'p': values}
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class ActionPaginationMixin:
+    """
+    Позволяет задать отдельный класс пагинации для действий ViewSet:
+
+        action_pagination_classes = {'feed': TimelineCursorPagination}
+    """
+    action_pagination_classes = {}
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.action_pagination_classes.get(self.action, self.pagination_class)
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
+
+
+def get_limit(request, default=20, maximum=100):
+    """
+    Размер выдачи из параметра ?limit= для действий без пагинатора.
+    Как page_size у пагинации: нечисловое значение заменяется значением
+    по умолчанию, число ограничивается диапазоном 1..maximum.
+    """
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
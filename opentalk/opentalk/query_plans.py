@@ -0,0 +1,156 @@
+"""
+Проверка планов выполнения "горячих" запросов.
+
+Каталог hot_queries() вызывает те же функции, через которые строят выборки
+представления ленты, профиля, чата, уведомлений и входа по коду
+(posts/queries.py, users/queries.py, messages_api/inbox.py и другие).
+Функции выполняются в откатываемой транзакции, выполненные ими SELECT-запросы
+перехватываются, и для каждого строится план через EXPLAIN: проверяется ровно
+тот SQL, который уходит в базу, а не его копия.
+
+Проверяется, что ни одна таблица не читается целиком.
+Обход таблицы по индексу в порядке сортировки допускается только для запросов
+с LIMIT: такой обход останавливается на первой странице.
+Сортировка во временной структуре (filesort) не считается ошибкой: она допустима,
+если перед ней выполнен поиск по индексу, но выводится как предупреждение.
+
+Поддерживаются SQLite и PostgreSQL. Используется командой check_query_plans.
+"""
+import re
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.settings import api_settings
+
+# Вместо реальных ID подставляется любое значение: план от него не зависит
+SAMPLE_ID = 1
+SAMPLE_PHONE = '79990000000'
+
+# SQLite: "SCAN posts_post" - полный просмотр, "SCAN ... USING INDEX" - обход всего индекса
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)(?: AS \S+)?( USING (?:COVERING )?INDEX \S+)?$')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\S+)()')
+POSTGRES_SORT = re.compile(r'\bSort\b')
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+# Шаблоны полного просмотра и сортировки и префикс EXPLAIN для поддерживаемых баз
+PLAN_PATTERNS = {
+    'sqlite': (SQLITE_FULL_SCAN, SQLITE_SORT),
+    'postgresql': (POSTGRES_FULL_SCAN, POSTGRES_SORT),
+}
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+
+def is_supported():
+    """Поддерживается ли проверка планов для текущей базы"""
+    return connection.vendor in PLAN_PATTERNS
+
+
+def hot_queries():
+    """
+    Возвращает список (название, функция). Функция выполняет запросы эндпоинта
+    через те же функции, что и представление, включая страницу пагинации
+    """
+    from django.contrib.auth import get_user_model
+    from messages_api import inbox
+    from messages_api.history import message_history
+    from messages_api.models import Chat
+    from messages_api.pagination import ChatCursorPagination
+    from notifications.queries import unread_notifications, user_notifications
+    from posts import queries as post_queries
+    from posts.pagination import PostCursorPagination, TimelineCursorPagination
+    from posts.timeline import timeline_entries
+    from users import queries as user_queries
+    from users.counters import following_ids
+    from users.pagination import SubscriptionCursorPagination
+
+    # Несохраненные объекты с ID годятся для фильтров по связям и не требуют данных в базе
+    user = get_user_model()(pk=SAMPLE_ID)
+    chat = Chat(pk=SAMPLE_ID, user1_id=SAMPLE_ID, user2_id=SAMPLE_ID + 1)
+    sample_ids = [SAMPLE_ID, SAMPLE_ID + 1, SAMPLE_ID + 2]
+
+    def page(pagination_class, queryset):
+        return lambda: list(pagination_class().page_queryset(queryset))
+
+    def fetch(queryset):
+        return lambda: list(queryset)
+
+    return [
+        # posts/views.py
+        ('Общая лента постов', page(PostCursorPagination, post_queries.post_list())),
+        ('Посты по имени пользователя', page(PostCursorPagination, post_queries.post_list(username='username'))),
+        ('Посты по названию хештега', page(PostCursorPagination, post_queries.post_list(hashtag='hashtag'))),
+        ('Домашняя лента', page(TimelineCursorPagination, timeline_entries(user))),
+        ('Комментарии поста', fetch(post_queries.post_comments(SAMPLE_ID)[:api_settings.PAGE_SIZE])),
+        ('Ответы на комментарий', fetch(post_queries.comment_replies(SAMPLE_ID)[:api_settings.PAGE_SIZE])),
+        ('Лайки пользователя', fetch(post_queries.liked_ids(user, 'post', sample_ids))),
+        ('Посты по хештегу', page(PostCursorPagination, post_queries.hashtag_posts(SAMPLE_ID))),
+
+        # messages_api/views.py
+        ('Список чатов', page(ChatCursorPagination, inbox.inbox_chats(user))),
+        ('Состояние чата', fetch(inbox.inbox_state(chat, user))),
+        ('История чата', lambda: message_history(chat, before=SAMPLE_ID)),
+        ('Непрочитанные сообщения', lambda: inbox.unread_messages(chat, user, SAMPLE_ID, SAMPLE_ID + 1).count()),
+        ('Отметки прочтения', lambda: inbox.read_watermarks([chat.id])),
+
+        # notifications/views.py
+        ('Уведомления', fetch(user_notifications(user)[:api_settings.PAGE_SIZE])),
+        ('Непрочитанные уведомления', fetch(unread_notifications(user))),
+
+        # users/serializers.py, users/views.py
+        ('Действующий код подтверждения', lambda: user_queries.active_verification_code(SAMPLE_PHONE)),
+        ('Посты пользователя', page(PostCursorPagination, post_queries.user_posts(user))),
+        ('Подписчики', page(SubscriptionCursorPagination, user_queries.followers(user))),
+        ('Подписки', page(SubscriptionCursorPagination, user_queries.following(user))),
+        ('Подписки на пользователей списка', lambda: following_ids(user, sample_ids)),
+    ]
+
+
+def captured_queries(func):
+    """
+    Выполняет функцию в транзакции, которая затем откатывается,
+    и возвращает SQL выполненных ею SELECT-запросов
+    """
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as context:
+            func()
+        transaction.set_rollback(True)
+    return [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].lstrip().upper().startswith('SELECT')
+    ]
+
+
+def explain(sql):
+    """Возвращает план SQL-запроса в текстовом виде"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Последовательный просмотр выбирается и при наличии индекса, если таблица маленькая:
+                # запрещаем его, чтобы в плане остался только тот, без которого не обойтись
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(EXPLAIN_PREFIXES[connection.vendor] + sql)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def is_limited(sql):
+    """Есть ли у запроса LIMIT"""
+    return bool(LIMIT.search(sql))
+
+
+def check_plan(plan, limited=False):
+    """
+    Анализирует план запроса; limited - есть ли у запроса LIMIT.
+    Возвращает (таблицы, прочитанные целиком, есть ли сортировка во временной структуре)
+    """
+    full_scan, sort = PLAN_PATTERNS[connection.vendor]
+
+    tables = []
+    for line in plan.splitlines():
+        match = full_scan.search(line)
+        if match and not (limited and match.group(2)):
+            tables.append(match.group(1))
+    return tables, bool(sort.search(plan))
@@ -0,0 +1,81 @@
+"""
+Кеш ответов API для действий DRF.
+
+Ответ кешируется в пространстве имен, у которого есть версия. Сброс пространства
+(invalidate) заменяет версию, поэтому все его ответы перестают использоваться сразу,
+без перебора ключей; старые записи вытесняются по истечении времени жизни.
+
+Пространство имен может зависеть от объекта запроса: 'post:{pk}' подставляет
+аргументы URL представления, и сбрасывается отдельно для каждого поста.
+Ответы, зависящие от пользователя (is_liked, is_following), кешируются
+отдельно для каждого пользователя (vary_on_user=True, по умолчанию).
+
+Сброс выполняется после фиксации текущей транзакции: иначе параллельный запрос
+успел бы прочитать еще не зафиксированное старое состояние и снова закешировать его.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60)
+
+VERSION_KEY = 'response:version:{namespace}'
+RESPONSE_KEY = 'response:{namespace}:{version}:{user}:{path}'
+
+
+def get_version(namespace):
+    """Текущая версия пространства имен"""
+    key = VERSION_KEY.format(namespace=namespace)
+    version = cache.get(key)
+    if version is None:
+        # Версия из времени, а не с единицы: после вытеснения ключа версии
+        # старые ответы не должны снова стать актуальными
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*namespaces):
+    """Сбрасывает все кешированные ответы пространств имен после фиксации транзакции"""
+    transaction.on_commit(lambda: cache.set_many(
+        {VERSION_KEY.format(namespace=namespace): time.time_ns() for namespace in namespaces}, None
+    ))
+
+
+def cache_response(namespace, timeout=None, vary_on_user=True):
+    """
+    Декоратор действия ViewSet: кеширует успешные ответы на GET-запросы.
+
+        @cache_response('post:{pk}')
+        def retrieve(self, request, *args, **kwargs):
+            return super().retrieve(request, *args, **kwargs)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return func(self, request, *args, **kwargs)
+
+            name = namespace.format(**self.kwargs)
+            key = RESPONSE_KEY.format(
+                namespace=name,
+                version=get_version(name),
+                user=request.user.id if vary_on_user and request.user.is_authenticated else 'all',
+                path=hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest(),
+            )
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = func(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT if timeout is None else timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,126 @@
+"""
+Маршрутизация чтения на реплики базы данных.
+
+Чтение уходит на реплику только внутри безопасного (GET, HEAD, OPTIONS) запроса
+к ViewSet с ReplicaReadMixin. Все остальное - запись, транзакции, админка,
+команды управления, фоновые потоки - работает с основной базой.
+
+Чтобы пользователь сразу видел результат своих действий, несмотря на задержку
+репликации, чтение "прилипает" к основной базе:
+- до конца запроса после первой записи в нем;
+- на REPLICA_STICKY_SECONDS для пользователя, который что-то записал.
+
+Для действий, которым нужны самые свежие данные, есть декоратор use_primary.
+
+Реплики перечислены в settings.DATABASE_REPLICAS (см. DATABASE_REPLICA_URLS
+в opentalk/databases.py); без реплик маршрутизатор ничего не меняет.
+"""
+import functools
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+STICKY_CACHE_KEY = 'db:primary:{user_id}'
+
+
+class RoutingState:
+    """Состояние маршрутизации текущего запроса"""
+    def __init__(self, replica):
+        self.replica = replica  # можно ли читать из реплики
+        self.wrote = False  # была ли запись в этом запросе
+
+
+_routing = ContextVar('db_routing', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter:
+    """
+    Маршрутизатор баз данных: чтение в безопасных запросах - на случайную реплику,
+    все остальное - на основную базу
+    """
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.replica or state.wrote:
+            return None
+        replicas = get_replicas()
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Чтение внутри транзакции должно видеть ее изменения
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик обновляется репликацией, а не миграциями
+        if db in get_replicas():
+            return False
+        return None
+
+
+def use_primary(func):
+    """
+    Декоратор: во время вызова все чтение идет в основную базу.
+    Применяется к действиям ViewSet, которым нужны самые свежие данные.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        state = _routing.get()
+        if state is None:
+            return func(*args, **kwargs)
+        replica, state.replica = state.replica, False
+        try:
+            return func(*args, **kwargs)
+        finally:
+            state.replica = replica
+    return wrapper
+
+
+def wrote_recently(user):
+    """Записывал ли пользователь что-то в последние REPLICA_STICKY_SECONDS секунд"""
+    return user.is_authenticated and bool(cache.get(STICKY_CACHE_KEY.format(user_id=user.id)))
+
+
+class ReplicaReadMixin:
+    """
+    Безопасные запросы к ViewSet читают из реплик.
+    Аутентификация и проверка прав выполняются до переключения, на основной базе.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        replica = (
+            bool(get_replicas())
+            and request.method in SAFE_METHODS
+            and not wrote_recently(request.user)
+        )
+        self._routing_token = _routing.set(RoutingState(replica))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_routing_token', None)
+        if token is not None:
+            state = _routing.get()
+            if state.wrote and get_replicas() and request.user.is_authenticated:
+                cache.set(STICKY_CACHE_KEY.format(user_id=request.user.id), True, REPLICA_STICKY_SECONDS)
+            _routing.reset(token)
+            self._routing_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,347 @@
+"""
+Полнотекстовый поиск.
+
+FullTextIndex - инвертированный индекс в отдельной таблице рядом с основной моделью.
+Реализации для разных СУБД:
+
+- SQLite: виртуальная таблица FTS5 (токенизатор porter - английская морфология);
+- PostgreSQL: таблица с колонкой tsvector и GIN-индексом.
+
+Русская морфология учитывается на стороне приложения: слова запроса приводятся
+к основе стеммером Snowball, а поиск идет по префиксу основы, поэтому запрос
+"книгами" находит "книга", "книги" и "книгу". Префиксный поиск работает и для
+незаконченного слова, которое пользователь еще набирает.
+
+Фрагменты с подсветкой совпадений (highlight) строятся по исходному тексту
+документа, а не по нормализованному тексту индекса.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.utils.html import escape
+
+SearchHit = namedtuple('SearchHit', ['doc_id', 'rank'])
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_WORDS = 24
+
+
+# Стеммер Snowball для русского языка
+# https://snowballstem.org/algorithms/russian/stemmer.html
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('вшись', 'вши', 'в'),  # после а или я
+    ('ывшись', 'ившись', 'ывши', 'ивши', 'ыв', 'ив'),
+)
+REFLEXIVE = ('ся', 'сь')
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+    'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),  # после а или я
+    ('ивш', 'ывш', 'ующ'),
+)
+VERB = (
+    ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н'),
+    ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют', 'ены',
+     'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю'),
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой',
+    'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у',
+    'ы', 'ь', 'ю', 'я',
+)
+DERIVATIONAL = ('ость', 'ост')
+SUPERLATIVE = ('ейше', 'ейш')
+
+
+def _region(word, start=0):
+    """Позиция после первой согласной, следующей за гласной (регионы R1/R2)"""
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def _strip(word, endings, start, preceded=False):
+    """Удаляет самое длинное окончание из endings, лежащее не раньше позиции start"""
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            if preceded and not word[:-len(ending)].endswith(('а', 'я')):
+                continue
+            return word[:-len(ending)]
+    return None
+
+
+def _strip_grouped(word, groups, start):
+    """Удаляет окончание из пары групп: первая группа требует предшествующей а/я"""
+    candidates = []
+    for preceded, endings in zip((True, False), groups):
+        stripped = _strip(word, endings, start, preceded=preceded)
+        if stripped is not None:
+            candidates.append(stripped)
+    return min(candidates, key=len) if candidates else None
+
+
+def stem_russian(word):
+    """Возвращает основу русского слова (слово в нижнем регистре)"""
+    word = word.replace('ё', 'е')
+    rv = next((index + 1 for index, char in enumerate(word) if char in VOWELS), len(word))
+    r2 = _region(word, _region(word))
+
+    # Шаг 1
+    stripped = _strip_grouped(word, PERFECTIVE_GERUND, rv)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, REFLEXIVE, rv) or word
+        adjective = _strip(word, ADJECTIVE, rv)
+        if adjective is not None:
+            word = _strip_grouped(adjective, PARTICIPLE, rv) or adjective
+        else:
+            word = _strip_grouped(word, VERB, rv) or _strip(word, NOUN, rv) or word
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, DERIVATIONAL, r2) or word
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        word = word[:-1]
+    else:
+        superlative = _strip(word, SUPERLATIVE, rv)
+        if superlative is not None:
+            word = superlative[:-1] if superlative.endswith('нн') else superlative
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def _matches(word, terms):
+    word = normalize_text(word)
+    # Для латиницы основа слова может быть короче запроса: "book" для "books"
+    return any(word.startswith(term) or (len(word) >= 3 and term.startswith(word)) for term in terms)
+
+
+def highlight(text, query, max_words=SNIPPET_WORDS):
+    """
+    Возвращает фрагмент текста вокруг первого совпадения с запросом,
+    совпавшие слова обернуты в <mark>. Остальной текст экранируется.
+    """
+    words = list(WORD_RE.finditer(text))
+    if not words:
+        return escape(text)
+
+    terms = query_terms(query)
+    matched = {index for index, word in enumerate(words) if _matches(word.group(), terms)}
+
+    first = min(matched) if matched else 0
+    start = max(0, first - max_words // 3)
+    end = min(len(words), start + max_words)
+
+    parts = ['…' if start > 0 else '']
+    position = words[start].start() if start > 0 else 0
+    for index in range(start, end):
+        word = words[index]
+        parts.append(escape(text[position:word.start()]))
+        if index in matched:
+            parts.append(f'{SNIPPET_START}{escape(word.group())}{SNIPPET_END}')
+        else:
+            parts.append(escape(word.group()))
+        position = word.end()
+    if end < len(words):
+        parts.append(escape(text[position:words[end].start()]).rstrip() + '…')
+    else:
+        parts.append(escape(text[position:]))
+    return ''.join(parts)
+
+
+def normalize_text(text):
+    """Подготовка текста документа к индексации"""
+    return text.lower().replace('ё', 'е')
+
+
+def query_terms(query):
+    """Разбивает поисковый запрос на основы слов"""
+    terms = []
+    for word in WORD_RE.findall(normalize_text(query)):
+        if CYRILLIC_RE.search(word):
+            word = stem_russian(word) or word
+        terms.append(word)
+    return list(dict.fromkeys(terms))
+
+
+class SqliteBackend:
+    """
+    Полнотекстовый индекс на виртуальной таблице SQLite FTS5.
+
+    Область документа (scope_id) индексируется как слово "s<id>" в отдельной колонке
+    и проверяется внутри MATCH вместе со словами запроса: FTS5 пересекает списки
+    документов области и слов, а не перебирает совпадения из всех областей.
+    """
+    scope_token = 's{}'
+
+    def create(self, schema_editor, table, scoped):
+        scope_column = ', scope_id' if scoped else ''
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {table} USING fts5("
+            f"body{scope_column}, tokenize='porter unicode61 remove_diacritics 2')"
+        )
+
+    def drop(self, schema_editor, table):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def index(self, cursor, table, doc_id, text, scope_id):
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [doc_id])
+        if scope_id is None:
+            cursor.execute(f"INSERT INTO {table} (rowid, body) VALUES (%s, %s)", [doc_id, text])
+        else:
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, body, scope_id) VALUES (%s, %s, %s)",
+                [doc_id, text, self.scope_token.format(scope_id)]
+            )
+
+    def remove(self, cursor, table, doc_id):
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [doc_id])
+
+    def search(self, cursor, table, terms, limit, scope_ids):
+        match = 'body : (' + ' '.join(f'"{term}"*' for term in terms) + ')'
+        if scope_ids is not None:
+            scopes = ' OR '.join(f'"{self.scope_token.format(int(scope_id))}"' for scope_id in scope_ids)
+            match = f'scope_id : ({scopes}) AND {match}'
+        cursor.execute(
+            f"SELECT rowid, bm25({table}) FROM {table} "
+            f"WHERE {table} MATCH %s ORDER BY bm25({table}) LIMIT %s",
+            [match, limit]
+        )
+        # bm25 в SQLite отрицательный: чем меньше, тем релевантнее
+        return [SearchHit(doc_id, -rank) for doc_id, rank in cursor.fetchall()]
+
+
+class PostgresBackend:
+    """Полнотекстовый индекс на колонке tsvector с GIN-индексом"""
+    config = 'english'
+
+    def create(self, schema_editor, table, scoped):
+        scope_column = ', scope_id bigint' if scoped else ''
+        schema_editor.execute(
+            f"CREATE TABLE {table} (doc_id bigint PRIMARY KEY, body text NOT NULL, "
+            f"document tsvector NOT NULL{scope_column})"
+        )
+        schema_editor.execute(f"CREATE INDEX {table}_document_idx ON {table} USING GIN (document)")
+        if scoped:
+            schema_editor.execute(f"CREATE INDEX {table}_scope_idx ON {table} (scope_id)")
+
+    def drop(self, schema_editor, table):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def index(self, cursor, table, doc_id, text, scope_id):
+        cursor.execute(
+            f"INSERT INTO {table} (doc_id, body, document, scope_id) "
+            f"VALUES (%s, %s, to_tsvector('{self.config}', %s), %s) "
+            f"ON CONFLICT (doc_id) DO UPDATE SET body = EXCLUDED.body, "
+            f"document = EXCLUDED.document, scope_id = EXCLUDED.scope_id"
+            if scope_id is not None else
+            f"INSERT INTO {table} (doc_id, body, document) "
+            f"VALUES (%s, %s, to_tsvector('{self.config}', %s)) "
+            f"ON CONFLICT (doc_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document",
+            [doc_id, text, text] + ([scope_id] if scope_id is not None else [])
+        )
+
+    def remove(self, cursor, table, doc_id):
+        cursor.execute(f"DELETE FROM {table} WHERE doc_id = %s", [doc_id])
+
+    def search(self, cursor, table, terms, limit, scope_ids):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        where = "document @@ query"
+        params = [tsquery]
+        if scope_ids is not None:
+            # Планировщик объединяет GIN-индекс документа и индекс scope_id (BitmapAnd)
+            where += " AND scope_id = ANY(%s)"
+            params.append(list(scope_ids))
+        cursor.execute(
+            f"SELECT doc_id, ts_rank(document, query) AS rank "
+            f"FROM {table}, to_tsquery('{self.config}', %s) query "
+            f"WHERE {where} ORDER BY rank DESC LIMIT %s",
+            params + [limit]
+        )
+        return [SearchHit(doc_id, rank) for doc_id, rank in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SqliteBackend(),
+    'postgresql': PostgresBackend(),
+}
+
+
+class FullTextIndex:
+    """
+    Полнотекстовый индекс документов (постов, сообщений) в отдельной таблице.
+
+    Для СУБД без поддержки (backend is None) индекс не ведется,
+    а вызывающий код должен использовать обычный поиск по подстроке.
+    scoped=True добавляет колонку scope_id для ограничения поиска (например, по чату).
+    """
+    def __init__(self, table, scoped=False):
+        self.table = table
+        self.scoped = scoped
+
+    @property
+    def backend(self):
+        return BACKENDS.get(connection.vendor)
+
+    @property
+    def is_supported(self):
+        return self.backend is not None
+
+    def create(self, schema_editor):
+        backend = BACKENDS.get(schema_editor.connection.vendor)
+        if backend is not None:
+            backend.create(schema_editor, self.table, self.scoped)
+
+    def drop(self, schema_editor):
+        backend = BACKENDS.get(schema_editor.connection.vendor)
+        if backend is not None:
+            backend.drop(schema_editor, self.table)
+
+    def index(self, doc_id, text, scope_id=None):
+        """Добавляет или обновляет документ в индексе"""
+        if self.is_supported:
+            with connection.cursor() as cursor:
+                self.backend.index(cursor, self.table, doc_id, normalize_text(text), scope_id)
+
+    def remove(self, doc_id):
+        """Удаляет документ из индекса"""
+        if self.is_supported:
+            with connection.cursor() as cursor:
+                self.backend.remove(cursor, self.table, doc_id)
+
+    def search(self, query, limit=100, scope=None):
+        """
+        Ищет документы по запросу, от более релевантных к менее релевантным.
+        scope - допустимые scope_id (например, ID чатов пользователя), проверяются
+        в самом индексе. Возвращает список SearchHit.
+        """
+        terms = query_terms(query)
+        if not terms or not self.is_supported:
+            return []
+
+        scope_ids = None
+        if scope is not None:
+            scope_ids = list(scope)
+            if not scope_ids:
+                return []
+
+        with connection.cursor() as cursor:
+            return self.backend.search(cursor, self.table, terms, limit, scope_ids)
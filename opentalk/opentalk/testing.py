@@ -0,0 +1,49 @@
+"""
+Общая основа тестов приложений.
+
+Тесты работают с отдельным кешем в памяти процесса: общий кеш окружения
+(CACHE_URL) не должен ни влиять на результат, ни портиться тестами.
+"""
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'opentalk-tests',
+    },
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OpenTalkTestCase(TestCase):
+    """Тест с чистым кешем и клиентом API для пользователей"""
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def client_for(self, user):
+        """Клиент API, аутентифицированный как user"""
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class PresenceTestCase(OpenTalkTestCase):
+    """Тест с буфером присутствия без таймера: записью статусов в базу управляет сам тест"""
+    def setUp(self):
+        super().setUp()
+        from users import presence
+
+        self.buffer = presence.PresenceBuffer(60 * 1000, 1000)
+        patcher = mock.patch.object(presence, 'presence_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cancel_timer)
+
+    def cancel_timer(self):
+        if self.buffer._timer is not None:
+            self.buffer._timer.cancel()
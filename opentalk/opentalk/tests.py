@@ -0,0 +1,181 @@
+import os
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from . import routers
+from .caches import cache_config
+from posts.models import Hashtag
+from .databases import ENGINES, database_config, replica_configs, sqlite_config
+from .testing import TEST_CACHES
+
+
+@mock.patch.dict(os.environ, {}, clear=True)
+class DatabaseConfigTests(SimpleTestCase):
+    def test_sqlite_profile(self):
+        config = database_config('', '/srv/db.sqlite3')
+        self.assertEqual((config['ENGINE'], config['NAME']), (ENGINES['sqlite'], '/srv/db.sqlite3'))
+        self.assertIn('PRAGMA journal_mode=WAL', config['OPTIONS']['init_command'])
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+        self.assertEqual(database_config('sqlite:///local.sqlite3', 'default')['NAME'], 'local.sqlite3')
+        self.assertEqual(database_config('sqlite:////var/db.sqlite3', 'default')['NAME'], '/var/db.sqlite3')
+
+    def test_server_profile(self):
+        config = database_config('postgres://user:p%40ss@db:5433/opentalk?sslmode=require', 'default')
+        self.assertEqual(config['ENGINE'], ENGINES['postgres'])
+        self.assertEqual((config['USER'], config['PASSWORD'], config['HOST'], config['PORT'], config['NAME']),
+                         ('user', 'p@ss', 'db', '5433', 'opentalk'))
+        self.assertEqual(config['OPTIONS'], {'sslmode': 'require'})
+        self.assertEqual((config['CONN_MAX_AGE'], config['CONN_HEALTH_CHECKS']), (60, True))
+
+    def test_connection_pool(self):
+        with mock.patch.dict(os.environ, {'DATABASE_POOL_MAX_SIZE': '20'}):
+            config = database_config('postgresql://db/opentalk', 'default')
+            self.assertEqual(config['CONN_MAX_AGE'], 0)
+            self.assertEqual(config['OPTIONS']['pool'], {'min_size': 2, 'max_size': 20, 'timeout': 10})
+            with self.assertRaises(ImproperlyConfigured):
+                database_config('mysql://db/opentalk', 'default')
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_config('oracle://db/opentalk', 'default')
+
+    def test_replicas_mirror_default_in_tests(self):
+        replicas = replica_configs('postgres://r1/opentalk, ,postgres://r2/opentalk', 'default')
+        self.assertEqual(list(replicas), ['replica1', 'replica2'])
+        self.assertEqual(replicas['replica2']['HOST'], 'r2')
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+
+
+@mock.patch.dict(os.environ, {}, clear=True)
+class CacheConfigTests(SimpleTestCase):
+    def test_local_backends_keep_all_entries(self):
+        self.assertEqual(cache_config('')['OPTIONS'], {'MAX_ENTRIES': 200_000})
+        self.assertNotIn('OPTIONS', cache_config('redis://cache:6379/0'))
+
+        config = cache_config('locmem://opentalk-cache-config')
+        local = LocMemCache(config['LOCATION'], config)
+        # Присутствие тысяч пользователей не вытесняется стандартным лимитом в 300 записей
+        local.set_many({f'presence:{user_id}': 'online' for user_id in range(1000)})
+        self.assertEqual(len(local.get_many([f'presence:{user_id}' for user_id in range(1000)])), 1000)
+        local.clear()
+
+        with mock.patch.dict(os.environ, {'CACHE_MAX_ENTRIES': '5000'}):
+            self.assertEqual(cache_config('file:///tmp/cache')['OPTIONS'], {'MAX_ENTRIES': 5000})
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], CACHES=TEST_CACHES)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+
+    def route(self, replica):
+        token = routers._routing.set(routers.RoutingState(replica))
+        self.addCleanup(routers._routing.reset, token)
+
+    def test_reads_outside_views_use_primary(self):
+        self.assertIsNone(self.router.db_for_read(None))
+        self.assertEqual(self.router.db_for_write(None), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'users'))
+        self.assertIsNone(self.router.allow_migrate('default', 'users'))
+
+    def test_safe_reads_stick_to_primary_after_write(self):
+        self.route(True)
+        self.assertEqual(self.router.db_for_read(None), 'replica1')
+        self.router.db_for_write(None)
+        self.assertIsNone(self.router.db_for_read(None))
+
+    def test_use_primary(self):
+        self.route(True)
+        read = routers.use_primary(lambda: self.router.db_for_read(None))
+        self.assertIsNone(read())
+        self.assertEqual(self.router.db_for_read(None), 'replica1')
+
+    def test_writer_reads_from_primary_for_a_while(self):
+        router = self.router
+
+        class View(routers.ReplicaReadMixin, APIView):
+            def get(self, request):
+                return Response({'db': router.db_for_read(None)})
+
+            def post(self, request):
+                router.db_for_write(None)
+                return Response({'db': router.db_for_read(None)})
+
+        user = mock.Mock(is_authenticated=True, id=7)
+        factory = APIRequestFactory()
+
+        def call(method):
+            request = getattr(factory, method)('/')
+            force_authenticate(request, user)
+            return View.as_view()(request).data['db']
+
+        self.assertEqual(call('get'), 'replica1')
+        self.assertIsNone(call('post'))
+        self.assertIsNone(call('get'))
+        cache.delete(routers.STICKY_CACHE_KEY.format(user_id=user.id))
+        self.assertEqual(call('get'), 'replica1')
+        self.assertIsNone(routers._routing.get())
+
+
+# Отдельная база реплики для ReplicaDatabaseTests. В отличие от реплик из
+# DATABASE_REPLICA_URLS у нее нет TEST MIRROR: тестовый раннер создает для нее
+# собственную тестовую базу, и строки в ней не совпадают со строками основной
+SEPARATE_REPLICA = 'separate_replica'
+connections.settings.setdefault(SEPARATE_REPLICA, connections.configure_settings(
+    {'default': {}, SEPARATE_REPLICA: sqlite_config(':memory:')}
+)[SEPARATE_REPLICA])
+
+
+@override_settings(DATABASE_REPLICAS=[SEPARATE_REPLICA], CACHES=TEST_CACHES)
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Строка есть только в одной из баз, поэтому по результату видно, откуда было чтение"""
+    databases = {'default', SEPARATE_REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        Hashtag.objects.create(name='primary')
+        Hashtag.objects.using(SEPARATE_REPLICA).create(name='replica')
+        # Маршрутизатор запрещает миграции реплик, поэтому между тестами она не очищается
+        self.addCleanup(Hashtag.objects.using(SEPARATE_REPLICA).all().delete)
+    def call(self, method, user_id=7):
+        class View(routers.ReplicaReadMixin, APIView):
+            def get(self, request):
+                return Response(list(Hashtag.objects.order_by('name').values_list('name', flat=True)))
+
+            def post(self, request):
+                Hashtag.objects.create(name='written')
+                return self.get(request)
+
+            @routers.use_primary
+            def put(self, request):
+                return self.get(request)
+
+        request = getattr(APIRequestFactory(), method)('/')
+        force_authenticate(request, mock.Mock(is_authenticated=True, id=user_id))
+        return View.as_view()(request).data
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.call('get'), ['replica'])
+        self.assertEqual(list(Hashtag.objects.values_list('name', flat=True)), ['primary'])
+
+    def test_writer_reads_from_primary(self):
+        # Чтение после записи в том же запросе и следующие запросы автора - из основной базы
+        self.assertEqual(self.call('post'), ['primary', 'written'])
+        self.assertEqual(self.call('get'), ['primary', 'written'])
+        self.assertEqual(self.call('get', user_id=8), ['replica'])
+
+        cache.delete(routers.STICKY_CACHE_KEY.format(user_id=7))
+        self.assertEqual(self.call('get'), ['replica'])
+
+    def test_use_primary_reads_from_primary(self):
+        self.assertEqual(self.call('put'), ['primary'])
@@ -29,7 +29,7 @@ from drf_yasg import openapi
 from rest_framework import permissions
 
 from users.views import (
-    UserViewSet, RegisterView, ChangePasswordView, UpdateStatusView, LogoutView, OnlineStatusView,
+    UserViewSet, RegisterView, ChangePasswordView, UpdateStatusView, LogoutView, OnlineStatusView, HeartbeatView,
     SendVerificationCodeView, VerifyCodeView, PhoneLoginView, CreateUserByPhoneView, CheckUsernameView,
     QRCodeView, QRStatusView, AuthenticateByQRView
 )
@@ -70,6 +70,7 @@ urlpatterns = [
     path('api/logout/', LogoutView.as_view(), name='logout'),
     path('api/update-status/', UpdateStatusView.as_view(), name='update_status'),
     path('api/online-status/', OnlineStatusView.as_view(), name='online_status'),
+    path('api/heartbeat/', HeartbeatView.as_view(), name='heartbeat'),
     # Маршруты для авторизации по телефону
     path('api/send-verification-code/', SendVerificationCodeView.as_view(), name='send_verification_code'),
     path('api/verify-code/', VerifyCodeView.as_view(), name='verify_code'),
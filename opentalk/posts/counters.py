@@ -0,0 +1,212 @@
+"""
+Счетчики лайков, репостов и комментариев.
+
+Все изменения выполняются атомарным инкрементом в базе данных
+(UPDATE ... SET likes_count = likes_count + 1) с обновлением только одной колонки,
+без чтения-изменения-записи всей строки через save().
+
+Для "горячих" объектов (значение счетчика не меньше HOT_COUNTER_THRESHOLD)
+изменения пишутся в одну из COUNTER_SHARDS строк CounterShard, выбранную случайно,
+поэтому параллельные лайки не выстраиваются в очередь за блокировкой строки поста.
+Шарды суммируются при чтении и периодически сворачиваются в колонки
+командой fold_counter_shards.
+
+При включенном COUNTER_BUFFER_ENABLED изменения не пишутся в базу сразу,
+а накапливаются в буфере процесса и сбрасываются одним UPDATE на модель
+раз в COUNTER_BUFFER_FLUSH_INTERVAL_MS миллисекунд или после
+COUNTER_BUFFER_FLUSH_EVENTS изменений.
+"""
+import atexit
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from opentalk.buffers import WriteBehindBuffer
+from .models import Post, Comment, CounterShard
+
+# Количество шардов на один счетчик
+COUNTER_SHARDS = getattr(settings, 'COUNTER_SHARDS', 8)
+
+# Порог, начиная с которого счетчик объекта шардируется (None - шардирование выключено)
+HOT_COUNTER_THRESHOLD = getattr(settings, 'HOT_COUNTER_THRESHOLD', None)
+
+# Отложенная запись счетчиков через буфер процесса
+COUNTER_BUFFER_ENABLED = getattr(settings, 'COUNTER_BUFFER_ENABLED', False)
+COUNTER_BUFFER_FLUSH_INTERVAL_MS = getattr(settings, 'COUNTER_BUFFER_FLUSH_INTERVAL_MS', 1000)
+COUNTER_BUFFER_FLUSH_EVENTS = getattr(settings, 'COUNTER_BUFFER_FLUSH_EVENTS', 500)
+
+CONTENT_TYPES = {
+    Post: 'post',
+    Comment: 'comment',
+}
+MODELS = {content_type: model for model, content_type in CONTENT_TYPES.items()}
+
+
+def is_hot(obj, field):
+    """Проверяет, нужно ли писать изменения счетчика объекта в шарды"""
+    if HOT_COUNTER_THRESHOLD is None:
+        return False
+    return getattr(obj, field) >= HOT_COUNTER_THRESHOLD
+
+
+def increment(obj, field, delta=1):
+    """
+    Атомарно изменяет счетчик поста или комментария на delta
+    """
+    if COUNTER_BUFFER_ENABLED:
+        counter_buffer.add(CONTENT_TYPES[type(obj)], obj.pk, field, delta)
+    elif is_hot(obj, field):
+        _increment_shard(CONTENT_TYPES[type(obj)], obj.pk, field, delta)
+    else:
+        _increment_column(type(obj), obj.pk, field, delta)
+
+
+def decrement(obj, field, delta=1):
+    """Атомарно уменьшает счетчик, не опуская его ниже нуля"""
+    increment(obj, field, -delta)
+
+
+def _increment_column(model, pk, field, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        # Счетчик не может стать отрицательным
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def _increment_shard(content_type, content_id, field, delta):
+    lookup = {
+        'content_type': content_type,
+        'content_id': content_id,
+        'field': field,
+        'shard': random.randrange(COUNTER_SHARDS),
+    }
+    if not CounterShard.objects.filter(**lookup).update(delta=F('delta') + delta):
+        CounterShard.objects.bulk_create([CounterShard(**lookup)], ignore_conflicts=True)
+        CounterShard.objects.filter(**lookup).update(delta=F('delta') + delta)
+
+
+def shard_deltas(objects):
+    """
+    Возвращает несвернутые изменения счетчиков из шардов для списка объектов:
+    {(тип контента, id): {поле: изменение}}
+    """
+    deltas = defaultdict(dict)
+    if HOT_COUNTER_THRESHOLD is None or not objects:
+        return deltas
+
+    ids_by_type = defaultdict(list)
+    for obj in objects:
+        ids_by_type[CONTENT_TYPES[type(obj)]].append(obj.pk)
+
+    for content_type, ids in ids_by_type.items():
+        rows = CounterShard.objects.filter(
+            content_type=content_type, content_id__in=ids
+        ).values('content_id', 'field').annotate(total=Sum('delta'))
+        for row in rows:
+            deltas[(content_type, row['content_id'])][row['field']] = row['total']
+    return deltas
+
+
+def pending_deltas(objects):
+    """
+    Возвращает все еще не записанные в колонки изменения счетчиков:
+    суммы шардов и изменения из буфера текущего процесса
+    """
+    deltas = shard_deltas(objects)
+    if COUNTER_BUFFER_ENABLED:
+        for obj in objects:
+            key = (CONTENT_TYPES[type(obj)], obj.pk)
+            for field, delta in counter_buffer.pending(*key).items():
+                deltas[key][field] = deltas[key].get(field, 0) + delta
+    return deltas
+
+
+def apply_deltas(data, obj, deltas):
+    """Добавляет несвернутые изменения к значениям счетчиков в сериализованных данных"""
+    for field, delta in deltas.get((CONTENT_TYPES[type(obj)], obj.pk), {}).items():
+        if field in data:
+            data[field] = max(0, data[field] + delta)
+    return data
+
+
+def fold_counter_shards():
+    """
+    Сворачивает накопленные в шардах изменения в колонки счетчиков.
+    Возвращает количество обновленных объектов.
+    """
+    shards = list(CounterShard.objects.exclude(delta=0).values_list(
+        'id', 'content_type', 'content_id', 'field', 'delta'
+    ))
+
+    totals = defaultdict(int)
+    for _, content_type, content_id, field, delta in shards:
+        totals[(content_type, content_id, field)] += delta
+
+    with transaction.atomic():
+        for (content_type, content_id, field), total in totals.items():
+            MODELS[content_type].objects.filter(pk=content_id).update(
+                **{field: Greatest(F(field) + total, 0)}
+            )
+        # Вычитаем ровно свернутое значение: изменения, пришедшие во время свертки, сохраняются
+        for shard_id, _, _, _, delta in shards:
+            CounterShard.objects.filter(pk=shard_id).update(delta=F('delta') - delta)
+
+    CounterShard.objects.filter(delta=0).delete()
+    return len(totals)
+
+
+class CounterBuffer(WriteBehindBuffer):
+    """
+    Буфер отложенной записи счетчиков.
+    
+    Объединяет изменения счетчиков по объектам и сбрасывает их в базу пачкой:
+    один UPDATE с CASE на каждую модель вместо отдельной записи на каждый лайк.
+    Несброшенные изменения доступны через pending(), чтобы пользователь сразу
+    видел результат своего действия.
+    """
+    def empty(self):
+        return defaultdict(lambda: defaultdict(int))  # (тип контента, id) -> {поле: изменение}
+    
+    def record(self, pending, content_type, content_id, field, delta):
+        pending[(content_type, content_id)][field] += delta
+    
+    def restore(self, pending):
+        for key, changes in pending.items():
+            for field, delta in changes.items():
+                self._pending[key][field] += delta
+    
+    def pending(self, content_type, content_id):
+        """Возвращает несброшенные изменения счетчиков объекта: {поле: изменение}"""
+        with self._lock:
+            changes = self._pending.get((content_type, content_id), {})
+            return {field: delta for field, delta in changes.items() if delta}
+    
+    def write(self, pending):
+        by_type = defaultdict(lambda: defaultdict(dict))
+        for (content_type, content_id), changes in pending.items():
+            for field, delta in changes.items():
+                if delta:
+                    by_type[content_type][field][content_id] = delta
+        
+        updated = 0
+        for content_type, fields in by_type.items():
+            ids = {content_id for changes in fields.values() for content_id in changes}
+            MODELS[content_type].objects.filter(pk__in=ids).update(**{
+                field: Greatest(F(field) + Case(
+                    *[When(pk=content_id, then=Value(delta)) for content_id, delta in changes.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ), 0)
+                for field, changes in fields.items()
+            })
+            updated += len(ids)
+        return updated
+
+
+counter_buffer = CounterBuffer(COUNTER_BUFFER_FLUSH_INTERVAL_MS, COUNTER_BUFFER_FLUSH_EVENTS)
+atexit.register(counter_buffer.flush)
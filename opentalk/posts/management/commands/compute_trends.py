@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from posts.trends import TREND_MATERIALIZE_INTERVAL, engine
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает тренды по хештегам постов за последнее окно TREND_WINDOW. '
+        'Единственный процесс, который пишет в таблицу Trend'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--follow', action='store_true',
+            help='Не завершаться: учитывать новые посты и пересчитывать тренды '
+                 'раз в TREND_MATERIALIZE_INTERVAL секунд',
+        )
+
+    def handle(self, *args, **options):
+        engine.rebuild()
+        created = engine.materialize()
+        self.stdout.write(self.style.SUCCESS(f'Сохранено трендов: {created}'))
+
+        while options['follow']:
+            time.sleep(TREND_MATERIALIZE_INTERVAL)
+            close_old_connections()
+            posts = engine.catch_up()
+            created = engine.materialize()
+            self.stdout.write(f'Учтено новых постов: {posts}, сохранено трендов: {created}')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from posts.counters import fold_counter_shards
+
+
+class Command(BaseCommand):
+    help = 'Сворачивает шарды счетчиков в колонки likes_count, reposts_count и comments_count'
+
+    def handle(self, *args, **options):
+        updated = fold_counter_shards()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено объектов: {updated}'))
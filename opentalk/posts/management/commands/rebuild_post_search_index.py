@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.search import post_search_index
+
+
+class Command(BaseCommand):
+    help = 'Переиндексирует все посты в полнотекстовом индексе'
+
+    def handle(self, *args, **options):
+        if not post_search_index.is_supported:
+            self.stdout.write(self.style.WARNING('Полнотекстовый индекс не поддерживается этой СУБД'))
+            return
+
+        indexed = 0
+        for post_id, content in Post.objects.values_list('id', 'content').iterator():
+            post_search_index.index(post_id, content)
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано постов: {indexed}'))
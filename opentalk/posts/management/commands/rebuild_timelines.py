@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает или обрезает материализованные домашние ленты пользователей. '
+        'С --trim-only запускается периодически (например, cron раз в несколько минут): '
+        'раскладка новых постов ленты не обрезает'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='ID пользователя (по умолчанию - все пользователи)')
+        parser.add_argument('--trim-only', action='store_true',
+                            help='Только обрезать переполненные ленты до TIMELINE_MAX_LENGTH, не пересобирая их')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        if options['trim_only']:
+            deleted, batch = 0, []
+            for user_id in users.values_list('id', flat=True).iterator(chunk_size=timeline.FANOUT_BATCH_SIZE):
+                batch.append(user_id)
+                if len(batch) >= timeline.FANOUT_BATCH_SIZE:
+                    deleted += timeline.trim_timelines(batch)
+                    batch = []
+            if batch:
+                deleted += timeline.trim_timelines(batch)
+            self.stdout.write(self.style.SUCCESS(f'Удалено записей лент: {deleted}'))
+            return
+
+        processed = 0
+        for user in users.iterator():
+            timeline.rebuild_timeline(user)
+            processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано лент: {processed}'))
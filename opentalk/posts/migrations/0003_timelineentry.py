@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+TIMELINE_MAX_LENGTH = getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+
+def backfill_timelines(apps, schema_editor):
+    # Ленты существующих пользователей: собственные посты и посты подписок,
+    # не больше TIMELINE_MAX_LENGTH последних (то же, что rebuild_timelines)
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Subscription = apps.get_model('users', 'Subscription')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+
+    for user_id in User.objects.order_by('id').values_list('id', flat=True).iterator():
+        author_ids = [user_id, *Subscription.objects.filter(follower_id=user_id).values_list('followed_id', flat=True)]
+        posts = Post.objects.filter(user_id__in=author_ids).order_by('-created_at', '-id').values_list(
+            'id', 'user_id', 'created_at'
+        )[:TIMELINE_MAX_LENGTH]
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, author_id, created_at in posts
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания поста')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор поста')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL, verbose_name='Владелец ленты')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'indexes': [models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_created_idx'), models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('post', 'Пост'), ('comment', 'Комментарий')], max_length=10, verbose_name='Тип контента')),
+                ('content_id', models.PositiveIntegerField(verbose_name='ID контента')),
+                ('field', models.CharField(choices=[('likes_count', 'Лайки'), ('reposts_count', 'Репосты'), ('comments_count', 'Комментарии')], max_length=20, verbose_name='Счетчик')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Номер шарда')),
+                ('delta', models.IntegerField(default=0, verbose_name='Накопленное изменение')),
+            ],
+            options={
+                'verbose_name': 'Шард счетчика',
+                'verbose_name_plural': 'Шарды счетчиков',
+                'unique_together': {('content_type', 'content_id', 'field', 'shard')},
+            },
+        ),
+    ]
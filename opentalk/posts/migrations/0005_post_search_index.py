@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from opentalk.search import FullTextIndex
+
+post_search_index = FullTextIndex('posts_post_search')
+
+
+def create_index(apps, schema_editor):
+    post_search_index.create(schema_editor)
+    
+    # Индексируем уже существующие посты
+    if post_search_index.is_supported:
+        Post = apps.get_model('posts', 'Post')
+        for post_id, content in Post.objects.values_list('id', 'content').iterator():
+            post_search_index.index(post_id, content)
+
+
+def drop_index(apps, schema_editor):
+    post_search_index.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_countershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -24,6 +24,11 @@ class Post(models.Model):
         verbose_name = _("Пост")
         verbose_name_plural = _("Посты")
         ordering = ['-created_at']
+        indexes = [
+            # Общая лента и посты пользователя: курсорная пагинация по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}: {self.content[:50]}"
@@ -54,6 +59,18 @@ class Comment(models.Model):
         verbose_name = _("Комментарий")
         verbose_name_plural = _("Комментарии")
         ordering = ['created_at']
+        indexes = [
+            # Комментарии верхнего уровня к посту
+            models.Index(
+                fields=['post', 'created_at'], condition=models.Q(parent__isnull=True),
+                name='comment_post_root_idx',
+            ),
+            # Ответы на комментарий
+            models.Index(
+                fields=['parent', 'created_at'], condition=models.Q(parent__isnull=False),
+                name='comment_parent_created_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} on {self.post}: {self.content[:30]}"
@@ -77,11 +94,43 @@ class Like(models.Model):
         verbose_name = _("Лайк")
         verbose_name_plural = _("Лайки")
         unique_together = ('user', 'content_type', 'content_id')  # Пользователь может лайкнуть контент только один раз
+        indexes = [
+            models.Index(fields=['content_type', 'content_id'], name='like_content_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} likes {self.content_type} #{self.content_id}"
 
 
+
+class CounterShard(models.Model):
+    """
+    Шард счетчика "горячего" поста или комментария.
+    
+    Изменения счетчика распределяются по нескольким строкам, чтобы параллельные
+    лайки не ждали блокировку одной строки; значение счетчика - это сумма
+    колонки объекта и всех его шардов. Шарды периодически сворачиваются в колонку.
+    """
+    FIELD_CHOICES = (
+        ('likes_count', 'Лайки'),
+        ('reposts_count', 'Репосты'),
+        ('comments_count', 'Комментарии'),
+    )
+    
+    content_type = models.CharField(_("Тип контента"), max_length=10, choices=Like.CONTENT_TYPES)
+    content_id = models.PositiveIntegerField(_("ID контента"))
+    field = models.CharField(_("Счетчик"), max_length=20, choices=FIELD_CHOICES)
+    shard = models.PositiveSmallIntegerField(_("Номер шарда"))
+    delta = models.IntegerField(_("Накопленное изменение"), default=0)
+    
+    class Meta:
+        verbose_name = _("Шард счетчика")
+        verbose_name_plural = _("Шарды счетчиков")
+        unique_together = ('content_type', 'content_id', 'field', 'shard')
+    
+    def __str__(self):
+        return f"{self.content_type} #{self.content_id} {self.field}[{self.shard}]: {self.delta}"
+
 class Hashtag(models.Model):
     """
     Модель хештега
@@ -130,3 +179,30 @@ class Trend(models.Model):
     
     def __str__(self):
         return f"{self.hashtag.name} - {self.trend_score}"
+
+
+class TimelineEntry(models.Model):
+    """
+    Запись материализованной домашней ленты пользователя
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries',
+                              verbose_name=_("Владелец ленты"))
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries',
+                             verbose_name=_("Пост"))
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+',
+                               verbose_name=_("Автор поста"))
+    created_at = models.DateTimeField(_("Дата создания поста"))
+    
+    class Meta:
+        verbose_name = _("Запись ленты")
+        verbose_name_plural = _("Записи ленты")
+        unique_together = ('owner', 'post')  # Пост попадает в ленту пользователя только один раз
+        indexes = [
+            # Чтение ленты - диапазонный скан по (владелец, дата)
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_created_idx'),
+            # Очистка ленты при отписке
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.owner_id} <- {self.post_id}"
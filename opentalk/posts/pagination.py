@@ -0,0 +1,15 @@
+from opentalk.pagination import KeysetPagination
+
+
+class PostCursorPagination(KeysetPagination):
+    """
+    Курсорная пагинация постов по ключу (created_at, id)
+    """
+    ordering = ('-created_at', '-id')
+
+
+class TimelineCursorPagination(KeysetPagination):
+    """
+    Курсорная пагинация записей домашней ленты по ключу (created_at, post_id)
+    """
+    ordering = ('-created_at', '-post_id')
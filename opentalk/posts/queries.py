@@ -0,0 +1,48 @@
+"""
+Запросы постов, комментариев и лайков, которые выполняются на каждом открытии
+ленты, профиля и поста.
+
+Представления строят выборки только через эти функции: по ним же команда
+check_query_plans проверяет планы выполнения, поэтому проверяется ровно тот
+запрос, который уходит в базу.
+"""
+from .models import Comment, Like, Post
+
+
+def post_list(username=None, hashtag=None):
+    """Посты общей ленты с фильтрами по имени автора и названию хештега"""
+    queryset = Post.objects.all()
+    if username is not None:
+        queryset = queryset.filter(user__username=username)
+    if hashtag is not None:
+        queryset = queryset.filter(hashtags__hashtag__name=hashtag)
+    return queryset
+
+
+def user_posts(user):
+    """Посты пользователя"""
+    return Post.objects.filter(user=user)
+
+
+def hashtag_posts(hashtag):
+    """Посты с хештегом от новых к старым"""
+    return Post.objects.filter(hashtags__hashtag=hashtag).order_by('-created_at', '-id')
+
+
+def post_comments(post):
+    """Комментарии верхнего уровня к посту"""
+    return Comment.objects.filter(post=post, parent=None)
+
+
+def comment_replies(comment):
+    """Ответы на комментарий"""
+    return Comment.objects.filter(parent=comment)
+
+
+def liked_ids(user, content_type, content_ids):
+    """ID объектов из списка, которые лайкнул пользователь"""
+    return Like.objects.filter(
+        user=user,
+        content_type=content_type,
+        content_id__in=content_ids
+    ).values_list('content_id', flat=True)
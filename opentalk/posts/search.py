@@ -0,0 +1,31 @@
+from django.conf import settings
+from rest_framework import filters
+from opentalk.search import FullTextIndex
+
+# Полнотекстовый индекс содержимого постов
+post_search_index = FullTextIndex('posts_post_search')
+
+# Максимальное количество совпадений, которое фильтр ?search= берет из индекса
+POST_SEARCH_MAX_RESULTS = getattr(settings, 'POST_SEARCH_MAX_RESULTS', 1000)
+
+
+class PostSearchFilter(filters.SearchFilter):
+    """
+    Фильтр ?search= по полнотекстовому индексу постов вместо LIKE '%term%'.
+    Если СУБД не поддерживает полнотекстовый индекс, используется обычный SearchFilter.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip() or not post_search_index.is_supported:
+            return super().filter_queryset(request, queryset, view)
+        
+        hits = post_search_index.search(query, limit=POST_SEARCH_MAX_RESULTS)
+        return queryset.filter(id__in=[hit.doc_id for hit in hits])
+
+
+def index_post(post):
+    post_search_index.index(post.id, post.content)
+
+
+def remove_post(post_id):
+    post_search_index.remove(post_id)
@@ -1,6 +1,52 @@
+import re
+from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import F
 from rest_framework import serializers
+from opentalk.response_cache import invalidate
 from .models import Post, Comment, Like, Hashtag, PostHashtag, Trend
 from users.serializers import UserMiniSerializer
+from . import counters, queries
+
+
+# Хештег - слово, начинающееся с #, без пробелов и знаков препинания
+HASHTAG_RE = re.compile(r'(?<!\S)#([^\s!@#$%^&*()+={}\[\]|\\:;"\'<>?,./]+)(?!\S)')
+
+
+def extract_hashtags(content):
+    """Извлекает хештеги из текста в нижнем регистре, без повторов, в порядке появления"""
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG_RE.findall(content)))
+
+
+def save_post_hashtags(post, names):
+    """
+    Привязывает хештеги к посту фиксированным числом запросов:
+    вставка новых хештегов, выборка их ID, общий инкремент post_count и вставка связей
+    """
+    with transaction.atomic():
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+        hashtag_ids = list(Hashtag.objects.filter(name__in=names).values_list('id', flat=True))
+        Hashtag.objects.filter(id__in=hashtag_ids).update(post_count=F('post_count') + 1)
+        PostHashtag.objects.bulk_create(
+            [PostHashtag(post=post, hashtag_id=hashtag_id) for hashtag_id in hashtag_ids],
+            ignore_conflicts=True
+        )
+        # Изменились списки постов этих хештегов и их счетчики
+        invalidate('hashtags', *(f'hashtag:{pk}' for pk in hashtag_ids))
+    return hashtag_ids
+
+
+class CommentListSerializer(serializers.ListSerializer):
+    """
+    Списочный сериализатор комментариев.
+    
+    Загружает лайки текущего пользователя и несвернутые изменения счетчиков
+    сразу для всей страницы, а не отдельным запросом на каждый комментарий.
+    """
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.preload(comments)
+        return super().to_representation(comments)
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -17,8 +63,38 @@ class CommentSerializer(serializers.ModelSerializer):
             'parent', 'likes_count', 'is_liked'
         ]
         read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'likes_count']
+        list_serializer_class = CommentListSerializer
+    
+    def preload(self, comments):
+        """
+        Загружает лайки и изменения счетчиков для списка комментариев пакетными запросами
+        """
+        liked_ids = set()
+        request = self.context.get('request')
+        if comments and request and request.user.is_authenticated:
+            liked_ids = set(queries.liked_ids(request.user, 'comment', [comment.id for comment in comments]))
+        
+        self._preloaded = {
+            'liked_ids': liked_ids,
+            'counter_deltas': counters.pending_deltas(comments),
+        }
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        
+        # Несвернутые изменения счетчиков "горячих" комментариев
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None:
+            deltas = preloaded['counter_deltas']
+        else:
+            deltas = counters.pending_deltas([instance])
+        return counters.apply_deltas(data, instance, deltas)
     
     def get_is_liked(self, obj):
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None:
+            return obj.id in preloaded['liked_ids']
+        
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(
@@ -39,6 +115,20 @@ class HashtagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'post_count']
 
 
+class PostListSerializer(serializers.ListSerializer):
+    """
+    Списочный сериализатор постов.
+    
+    Перед сериализацией страницы загружает лайки текущего пользователя, хештеги,
+    авторов и оригинальные посты сразу для всех постов фиксированным числом запросов,
+    поэтому количество запросов не растет вместе с размером страницы.
+    """
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.preload(posts)
+        return super().to_representation(posts)
+
+
 class PostSerializer(serializers.ModelSerializer):
     """
     Сериализатор для постов
@@ -58,11 +148,55 @@ class PostSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'user', 'created_at', 'updated_at', 
                            'likes_count', 'reposts_count', 'comments_count']
+        list_serializer_class = PostListSerializer
+    
+    def preload(self, posts):
+        """
+        Загружает связанные данные для списка постов пакетными запросами
+        """
+        # Оригинальные посты репостов и их авторы (авторы постов берутся
+        # из кеша мини-профилей в UserMiniSerializer)
+        models.prefetch_related_objects(posts, 'original_post__user')
+        
+        post_ids = [post.id for post in posts]
+        
+        # Лайки текущего пользователя
+        liked_ids = set()
+        request = self.context.get('request')
+        if post_ids and request and request.user.is_authenticated:
+            liked_ids = set(queries.liked_ids(request.user, 'post', post_ids))
+        
+        # Хештеги постов
+        hashtags = defaultdict(list)
+        if post_ids:
+            for post_hashtag in PostHashtag.objects.filter(post_id__in=post_ids).select_related('hashtag'):
+                hashtags[post_hashtag.post_id].append(post_hashtag.hashtag)
+        
+        self._preloaded = {
+            'liked_ids': liked_ids,
+            'hashtags': hashtags,
+            'counter_deltas': counters.pending_deltas(posts),
+        }
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        
+        # Несвернутые изменения счетчиков "горячих" постов
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None:
+            deltas = preloaded['counter_deltas']
+        else:
+            deltas = counters.pending_deltas([instance])
+        return counters.apply_deltas(data, instance, deltas)
     
     def get_media(self, obj):
         return obj.get_media_urls()
     
     def get_is_liked(self, obj):
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None:
+            return obj.id in preloaded['liked_ids']
+        
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(
@@ -73,6 +207,10 @@ class PostSerializer(serializers.ModelSerializer):
         return False
     
     def get_hashtags(self, obj):
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None:
+            return HashtagSerializer(preloaded['hashtags'].get(obj.id, []), many=True).data
+        
         hashtags = Hashtag.objects.filter(
             posts__post=obj
         )
@@ -89,14 +227,7 @@ class PostSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         
         # Обработка хештегов из контента
-        content = validated_data.get('content', '')
-        hashtags = []
-        words = content.split()
-        for word in words:
-            if word.startswith('#') and len(word) > 1:
-                hashtag_name = word[1:]  # Убираем символ # из начала
-                if hashtag_name and not any(char in hashtag_name for char in " !@#$%^&*()+={}[]|\\:;\"'<>?,./"):
-                    hashtags.append(hashtag_name.lower())
+        hashtags = extract_hashtags(validated_data.get('content', ''))
         
         # Обработка медиа, если они есть
         media_urls = self.context['request'].data.get('media', [])
@@ -109,26 +240,17 @@ class PostSerializer(serializers.ModelSerializer):
                 except:
                     media_urls = [media_urls]
         
-        post = Post.objects.create(
-            user=user,
-            **validated_data
-        )
-        
-        # Сохраняем медиа
-        if media_urls:
-            post.set_media_urls(media_urls)
+        with transaction.atomic():
+            post = Post(user=user, **validated_data)
+            
+            # Медиа сохраняем вместе с постом, без повторного save()
+            if media_urls:
+                post.set_media_urls(media_urls)
             post.save()
-        
-        # Сохраняем хештеги
-        for tag in hashtags:
-            hashtag, created = Hashtag.objects.get_or_create(name=tag)
-            if created:
-                hashtag.post_count = 1
-            else:
-                hashtag.post_count += 1
-            hashtag.save()
             
-            PostHashtag.objects.create(post=post, hashtag=hashtag)
+            # Тренды учитывают хештеги из PostHashtag (команда compute_trends)
+            if hashtags:
+                save_post_hashtags(post, hashtags)
         
         return post
 
@@ -156,16 +278,12 @@ class CreateCommentSerializer(serializers.ModelSerializer):
         fields = ['content', 'post', 'parent']
     
     def create(self, validated_data):
-        user = self.context['request'].user
-        comment = Comment.objects.create(
-            user=user,
-            **validated_data
-        )
+        # Автор может быть уже передан из perform_create
+        validated_data.setdefault('user', self.context['request'].user)
+        comment = Comment.objects.create(**validated_data)
         
         # Увеличиваем счетчик комментариев в посте
-        post = validated_data.get('post')
-        post.comments_count += 1
-        post.save()
+        counters.increment(validated_data.get('post'), 'comments_count')
         
         return comment
 
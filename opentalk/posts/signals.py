@@ -0,0 +1,84 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.models import Subscription
+from users import counters as user_counters
+from opentalk.response_cache import invalidate
+from .models import Post, Comment, Like, PostHashtag
+from . import timeline
+from .search import index_post, remove_post
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков"""
+    if created and not raw:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счетчик постов автора"""
+    if created and not raw:
+        user_counters.increment(instance.user_id, 'posts_count')
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    """Обновляет пост в полнотекстовом индексе"""
+    if not raw:
+        index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_deleted_post(sender, instance, **kwargs):
+    """Удаляет пост из полнотекстового индекса и уменьшает счетчик постов автора"""
+    remove_post(instance.id)
+    user_counters.decrement(instance.user_id, 'posts_count')
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_timeline_on_follow(sender, instance, created, raw=False, **kwargs):
+    """Добавляет посты автора в ленту нового подписчика"""
+    if created and not raw:
+        timeline.backfill(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def prune_timeline_on_unfollow(sender, instance, **kwargs):
+    """Убирает посты автора из ленты после отписки"""
+    timeline.prune(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_responses(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кеш ответов поста, его автора и оригинала репоста"""
+    if raw:
+        return
+    # Кеш хештегов сбрасывается только при изменении связей поста с хештегами
+    namespaces = [f'post:{instance.id}', f'user:{instance.user_id}']
+    if instance.original_post_id:
+        namespaces.append(f'post:{instance.original_post_id}')
+    invalidate(*namespaces)
+
+
+@receiver(post_delete, sender=PostHashtag)
+def invalidate_unlinked_hashtag(sender, instance, **kwargs):
+    """Сбрасывает кеш хештега после удаления поста с ним (новые связи сбрасывает save_post_hashtags)"""
+    invalidate('hashtags', f'hashtag:{instance.hashtag_id}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кеш ответов поста после изменения его комментариев"""
+    if not raw:
+        invalidate(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_liked_post(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кеш ответов поста после лайка или его отмены"""
+    if not raw and instance.content_type == 'post':
+        invalidate(f'post:{instance.content_id}')
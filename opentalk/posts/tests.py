@@ -1,3 +1,477 @@
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from opentalk.response_cache import get_version
+from opentalk.testing import OpenTalkTestCase
+from users.models import User, Subscription
+from .models import CounterShard, Hashtag, Post, PostHashtag, TimelineEntry, Trend
+from . import counters, timeline, trends
+
+
+class TimelineTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user('reader', password='x')
+        self.author = User.objects.create_user('author', password='x')
+        self.stranger = User.objects.create_user('stranger', password='x')
+        self.client = self.client_for(self.reader)
+
+    def feed(self):
+        return [post['content'] for post in self.client.get('/api/posts/feed/').json()['results']]
+
+    def test_feed_contains_own_and_followed_posts(self):
+        Post.objects.create(user=self.author, content='before follow')
+        response = self.client.post(f'/api/users/{self.author.id}/follow/')
+        self.assertEqual(response.status_code, 201)
+        Post.objects.create(user=self.author, content='after follow')
+        Post.objects.create(user=self.stranger, content='stranger')
+        response = self.client.post('/api/posts/', {'content': 'own'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(self.feed(), ['own', 'after follow', 'before follow'])
+
+        self.client.delete(f'/api/users/{self.author.id}/unfollow/')
+        self.assertEqual(self.feed(), ['own'])
+
+    def test_celebrity_posts_are_pulled_on_read(self):
+        Subscription.objects.create(follower=self.reader, followed=self.author)
+        with mock.patch.object(timeline, 'CELEBRITY_FOLLOWERS', 1):
+            Post.objects.create(user=self.author, content='celebrity')
+            self.assertFalse(TimelineEntry.objects.filter(owner=self.reader, post__content='celebrity').exists())
+            self.assertEqual(self.feed(), ['celebrity'])
+
+    @mock.patch.object(timeline, 'TIMELINE_MAX_LENGTH', 3)
+    @mock.patch.object(timeline, 'TIMELINE_TRIM_SLACK', 2)
+    def test_timelines_are_trimmed_outside_fan_out(self):
+        Subscription.objects.create(follower=self.reader, followed=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(6):
+                Post.objects.create(user=self.author, content=f'p{i}')
+        # Раскладка только вставляет записи, без подсчета длины лент
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(' in query['sql'].upper()])
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 6)
+
+        # Лента может превысить максимум не больше чем на запас
+        call_command('rebuild_timelines', '--trim-only', stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 3)
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.author).count(), 3)
+        self.assertEqual(self.feed(), ['p5', 'p4', 'p3'])
+        Post.objects.create(user=self.author, content='p6')
+        call_command('rebuild_timelines', '--trim-only', stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 4)
+
+
+class KeysetPaginationTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('author', password='x')
+        self.client = self.client_for(self.user)
+        for i in range(25):
+            Post.objects.create(user=self.user, content=f'p{i}')
+
+    def assert_walks_all_posts(self, url):
+        first = page = self.client.get(url).json()
+        self.assertNotIn('count', page)
+        self.assertIsNone(page['previous'])
+        seen = [post['content'] for post in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            seen += [post['content'] for post in page['results']]
+        self.assertEqual(seen, [f'p{i}' for i in reversed(range(25))])
+
+        previous = self.client.get(page['previous']).json()
+        self.assertEqual([post['content'] for post in previous['results']], [f'p{i}' for i in reversed(range(5, 15))])
+        self.assertEqual(len(first['results']), 10)
+
+    def test_post_lists_use_cursors(self):
+        self.assert_walks_all_posts('/api/posts/')
+        self.assert_walks_all_posts('/api/posts/feed/')
+        self.assert_walks_all_posts(f'/api/users/{self.user.id}/posts/')
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/posts/?cursor=zzz').status_code, 404)
+
+
+class PostListQueryTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('reader', password='x')
+        self.client = self.client_for(self.user)
+        self.reposters = [User.objects.create_user(f'reposter{i}', password='x') for i in range(3)]
+
+    def create_posts(self, count):
+        for i in range(count):
+            post_id = self.client.post('/api/posts/', {'content': f'post #t{i} #common'}, format='json').json()['id']
+            Post.objects.create(user=self.reposters[i % 3], content='repost', is_repost=True, original_post_id=post_id)
+            self.client.post(f'/api/posts/{post_id}/like/')
+
+    def count_list_queries(self):
+        # Мини-профили авторов читаются из кеша, поэтому сравниваем запросы с холодным кешем
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/?page_size=100')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_posts(3)
+        few = self.count_list_queries()
+        self.create_posts(9)
+        self.assertEqual(self.count_list_queries(), few)
+
+
+class CounterTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('reader', password='x')
+        self.author = User.objects.create_user('author', password='x')
+        self.client = self.client_for(self.user)
+        self.post = Post.objects.create(user=self.author, content='post')
+
+    def test_counters_follow_actions(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        # Повторная отмена лайка не уводит счетчик ниже нуля
+        self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+        response = self.client.post('/api/comments/', {'content': 'comment', 'post': self.post.id}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.client.post(f'/api/posts/{self.post.id}/repost/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comments_count, self.post.reposts_count), (1, 1))
+
+    @mock.patch.object(counters, 'HOT_COUNTER_THRESHOLD', 1)
+    def test_hot_counters_are_sharded(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client_for(self.author).post(f'/api/posts/{self.post.id}/like/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(CounterShard.objects.count(), 1)
+        # Ответ API учитывает несвернутые шарды
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.id}/').json()['likes_count'], 2)
+
+        counters.fold_counter_shards()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertFalse(CounterShard.objects.exists())
+
+    def count_comment_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/posts/{self.post.id}/comments/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_comment_page_query_count_does_not_depend_on_sharding(self):
+        from posts.models import Comment
+
+        for i in range(5):
+            Comment.objects.create(post=self.post, user=self.author, content=f'comment{i}', likes_count=10)
+        # Первый запрос заполняет кеш мини-профилей авторов
+        self.count_comment_queries()
+        plain = self.count_comment_queries()
+        with mock.patch.object(counters, 'HOT_COUNTER_THRESHOLD', 1):
+            # Изменения счетчиков загружаются для всей страницы одним запросом
+            self.assertEqual(self.count_comment_queries(), plain + 1)
+            comment = Comment.objects.first()
+            self.client_for(self.author).post(f'/api/comments/{comment.id}/like/')
+            results = self.client.get(f'/api/posts/{self.post.id}/comments/').json()['results']
+        self.assertEqual({item['id']: item['likes_count'] for item in results}[comment.id], 11)
+
+
+class CounterBufferTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='x')
+        self.post = Post.objects.create(user=self.author, content='post')
+        self.buffer = counters.CounterBuffer(60 * 1000, 1000)
+        self.addCleanup(self.cancel_timer)
+
+    def cancel_timer(self):
+        if self.buffer._timer is not None:
+            self.buffer._timer.cancel()
+
+    def test_likes_are_written_in_one_update(self):
+        other = Post.objects.create(user=self.author, content='other')
+        with mock.patch.object(counters, 'COUNTER_BUFFER_ENABLED', True), \
+                mock.patch.object(counters, 'counter_buffer', self.buffer):
+            for i in range(5):
+                client = self.client_for(User.objects.create_user(f'fan{i}', password='x'))
+                client.post(f'/api/posts/{self.post.id}/like/')
+                client.post(f'/api/posts/{other.id}/like/')
+            client.delete(f'/api/posts/{other.id}/unlike/')
+
+            self.post.refresh_from_db()
+            self.assertEqual(self.post.likes_count, 0)
+            # Несброшенные изменения уже видны в ответах API
+            self.assertEqual(client.get(f'/api/posts/{self.post.id}/').json()['likes_count'], 5)
+
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.buffer.flush(), 2)
+        # Точка сохранения и один UPDATE
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.post.likes_count, other.likes_count), (5, 4))
+
+    def test_failed_flush_keeps_changes(self):
+        self.buffer.add('post', self.post.id, 'likes_count', 3)
+        with mock.patch.object(counters.CounterBuffer, 'write', side_effect=DatabaseError), \
+                self.assertLogs('opentalk.buffers', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending('post', self.post.id), {'likes_count': 3})
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 3)
+
+    def test_background_flush_closes_its_connection(self):
+        closed_in = []
+        with mock.patch.object(connections, 'close_all', lambda: closed_in.append(threading.current_thread())):
+            thread = threading.Thread(target=self.buffer._flush_in_background)
+            thread.start()
+            thread.join()
+        self.assertEqual(closed_in, [thread])
+
+
+class HashtagTests(OpenTalkTestCase):
+    def test_hashtags_are_upserted_in_bulk(self):
+        client = self.client_for(User.objects.create_user('author', password='x'))
+        client.post('/api/posts/', {'content': '#One #two'}, format='json')
+        response = client.post('/api/posts/', {'content': '#one #three #one #a,b x#y', 'media': ['image.png']},
+                               format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(sorted(hashtag['name'] for hashtag in response.json()['hashtags']), ['one', 'three'])
+        self.assertEqual(response.json()['media'], ['image.png'])
+        self.assertEqual(dict(Hashtag.objects.values_list('name', 'post_count')), {'one': 2, 'two': 1, 'three': 1})
+
+
+
+class ResponseCacheTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('author', password='x')
+        self.reader = User.objects.create_user('reader', password='x')
+        self.author_client = self.client_for(self.author)
+        self.client = self.client_for(self.reader)
+
+    def publish(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.author_client.post('/api/posts/', {'content': content}, format='json').json()
+
+    def test_post_and_profile_responses(self):
+        post = Post.objects.create(user=self.author, content='hello')
+        url = f'/api/posts/{post.id}/'
+        first = self.client.get(url).json()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).json(), first)
+        self.assertEqual(len(queries), 0)
+
+        # Версия сбрасывается только после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(f'{url}like/')
+            self.assertEqual(self.client.get(url).json(), first)
+        self.assertTrue(callbacks)
+        liked = self.client.get(url).json()
+        self.assertEqual((liked['is_liked'], liked['likes_count']), (True, 1))
+        # Ответы с is_liked кешируются отдельно для каждого пользователя
+        self.assertFalse(self.author_client.get(url).json()['is_liked'])
+
+        self.assertFalse(self.client.get(f'/api/users/{self.author.id}/').json()['is_following'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{self.author.id}/follow/')
+        profile = self.client.get(f'/api/users/{self.author.id}/').json()
+        self.assertEqual((profile['is_following'], profile['followers_count']), (True, 1))
+
+    def test_hashtag_responses_follow_hashtag_links(self):
+        first = self.publish('#one')
+        self.publish('#two')
+        one, two = Hashtag.objects.get(name='one'), Hashtag.objects.get(name='two')
+        posts_url = f'/api/hashtags/{one.id}/posts/'
+        self.assertEqual(len(self.client.get(posts_url).json()['results']), 1)
+        self.assertEqual(self.client.get('/api/hashtags/').status_code, 200)
+
+        # Посты без хештегов и правки постов не сбрасывают кеш хештегов
+        versions = [get_version('hashtags'), get_version(f'hashtag:{one.id}')]
+        plain = self.publish('plain')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author_client.patch(f'/api/posts/{plain["id"]}/', {'content': 'edited'}, format='json')
+        self.assertEqual([get_version('hashtags'), get_version(f'hashtag:{one.id}')], versions)
+
+        second = self.publish('#one again')
+        two_version = get_version(f'hashtag:{two.id}')
+        self.assertEqual(len(self.client.get(posts_url).json()['results']), 2)
+        self.assertEqual(self.client.get(f'/api/hashtags/{one.id}/').json()['post_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.get(pk=second['id']).delete()
+        self.assertEqual(len(self.client.get(posts_url).json()['results']), 1)
+        self.assertEqual(get_version(f'hashtag:{two.id}'), two_version)
+
+        # Лента хештега с is_liked и счетчиками не кешируется
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{first["id"]}/like/')
+        post = self.client.get(posts_url).json()['results'][0]
+        self.assertEqual((post['is_liked'], post['likes_count']), (True, 1))
+
+
+class TrendEngineTests(OpenTalkTestCase):
+    def test_recent_usage_outweighs_old_usage(self):
+        engine = trends.TrendEngine()
+        now = time.time()
+        for _ in range(50):
+            engine.record(['old'], location='msk', timestamp=now - 60 * 60)
+        for _ in range(30):
+            engine.record(['new'], timestamp=now)
+        for i in range(2000):
+            engine.record([f'noise{i}'], timestamp=now)
+
+        top = engine.top(3, now=now)
+        self.assertEqual(top[('', '')][0][0], 'old')
+        self.assertEqual(top[('', 'msk')][0][0], 'old')
+        # Через сутки старые использования затухли сильнее новых
+        self.assertEqual(engine.top(3, now=now + 23.5 * 60 * 60)[('', '')][0][0], 'new')
+
+    def test_categories_are_derived_from_hashtags(self):
+        engine = trends.TrendEngine()
+        with mock.patch.object(trends, 'TREND_CATEGORIES', {'спорт': ['футбол']}):
+            self.assertEqual(trends.post_categories({'футбол', 'матч'}), {'спорт'})
+            engine.record({'футбол', 'матч'}, categories={'спорт'}, location='msk')
+        self.assertEqual(set(engine.groups), {('спорт', 'msk'), ('спорт', ''), ('', 'msk'), ('', '')})
+
+
+@mock.patch.object(trends, 'TREND_CATEGORIES', {'спорт': ['футбол']})
+class ComputeTrendsTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engine = trends.TrendEngine()
+        patcher = mock.patch.object(trends, 'engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('author', password='x', location='msk')
+        self.client = self.client_for(self.user)
+
+    def create_post(self, content):
+        response = self.client.post('/api/posts/', {'content': content}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_command_materializes_groups_with_categories(self):
+        self.create_post('#футбол #матч')
+        self.create_post('#матч')
+        # Создание поста тренды не пересчитывает
+        self.assertFalse(Trend.objects.exists())
+
+        with mock.patch('posts.management.commands.compute_trends.engine', self.engine):
+            call_command('compute_trends', stdout=mock.Mock())
+        groups = set(Trend.objects.values_list('category', 'location').distinct())
+        self.assertEqual(groups, {('спорт', 'msk'), ('спорт', ''), ('', 'msk'), ('', '')})
+
+        response = self.client.get('/api/trends/?location=msk').json()
+        self.assertEqual(response['results'][0]['hashtag']['name'], 'матч')
+        # Без параметров - общая группа, каждый хештег по одному разу
+        response = self.client.get('/api/trends/').json()
+        self.assertEqual([trend['hashtag']['name'] for trend in response['results']], ['матч', 'футбол'])
+        self.assertEqual(len(self.client.get('/api/trends/?category=спорт&location=msk').json()['results']), 2)
+        categories = self.client.get('/api/trends/categories/').json()
+        self.assertEqual(list(categories), ['спорт'])
+        self.assertEqual(sorted(trend['hashtag']['name'] for trend in categories['спорт']), ['матч', 'футбол'])
+        self.assertEqual(list(self.client.get('/api/trends/categories/?location=msk').json()), ['спорт'])
+        self.assertEqual(self.client.get('/api/trends/categories/?location=spb').json(), {})
+
+    def test_materialize_replaces_only_its_groups(self):
+        curated = Trend.objects.create(hashtag=Hashtag.objects.create(name='выборы'), trend_score=1,
+                                       category='новости')
+        self.create_post('#матч')
+        self.engine.rebuild()
+        self.assertEqual(self.engine.materialize(), 2)
+        self.engine.materialize()
+        self.assertTrue(Trend.objects.filter(pk=curated.pk).exists())
+        self.assertEqual(Trend.objects.filter(hashtag__name='матч').count(), 2)
+
+    def test_catch_up_counts_new_posts_once(self):
+        self.create_post('#матч')
+        self.engine.rebuild()
+        self.create_post('#футбол')
+        self.assertEqual(self.engine.catch_up(), 1)
+        self.assertEqual(self.engine.catch_up(), 0)
+        self.assertIn(('спорт', 'msk'), self.engine.groups)
+
+    def test_catch_up_rereads_late_commits(self):
+        self.engine.rebuild()
+        self.create_post('#поздний')
+        # Транзакция с большим ID уже учтена, а эта зафиксировалась позже нее
+        self.engine.last_usage_id = PostHashtag.objects.latest('id').id + 1
+        self.assertEqual(self.engine.catch_up(), 1)
+        self.assertEqual(self.engine.catch_up(), 0)
+        self.assertIn('поздний', dict(self.engine.top()[('', '')]))
+
+
+class TrendCategoriesTests(OpenTalkTestCase):
+    def test_top_trends_of_each_category_in_one_query(self):
+        client = self.client_for(User.objects.create_user('reader', password='x'))
+        hashtags = [Hashtag.objects.create(name=f'tag{i}') for i in range(8)]
+        for category in ['новости', 'спорт', '']:
+            for score, hashtag in enumerate(hashtags):
+                Trend.objects.create(hashtag=hashtag, trend_score=score, category=category)
+
+        with CaptureQueriesContext(connection) as queries:
+            categories = client.get('/api/trends/categories/').json()
+        self.assertEqual(sorted(categories), ['новости', 'спорт'])
+        self.assertEqual([trend['hashtag']['name'] for trend in categories['новости']],
+                         ['tag7', 'tag6', 'tag5', 'tag4', 'tag3'])
+        self.assertEqual(len([query for query in queries if 'posts_trend' in query['sql']]), 1)
+
+        # Повторный ответ берется из кеша
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get('/api/trends/categories/').json(), categories)
+        self.assertFalse([query for query in queries if 'posts_trend' in query['sql']])
+
+
+class PostSearchTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(User.objects.create_user('reader', password='x'))
+
+    def create_post(self, content):
+        return self.client.post('/api/posts/', {'content': content}, format='json').json()['id']
+
+    def search(self, query):
+        return self.client.get('/api/posts/search/', {'q': query}).json()
+
+    def test_search_ranks_word_forms(self):
+        self.create_post('Читаю интересные книги по вечерам')
+        self.create_post('Running in the park with books')
+        post_id = self.create_post('Книгами завалена вся комната, книга за книгой')
+
+        found = self.search('книгу')
+        self.assertEqual(len(found), 2)
+        self.assertEqual(found[0]['id'], post_id)
+        self.assertEqual(len(self.search('run')), 1)
+        self.assertEqual(len(self.client.get('/api/posts/', {'search': 'инте'}).json()['results']), 1)
+
+    def test_index_follows_edits_and_deletes(self):
+        post_id = self.create_post('Книга')
+        self.client.patch(f'/api/posts/{post_id}/', {'content': 'пусто'}, format='json')
+        self.assertEqual(self.search('книга'), [])
+        self.assertEqual(len(self.search('пусто')), 1)
+        self.client.delete(f'/api/posts/{post_id}/')
+        self.assertEqual(self.search('пусто'), [])
+
+    def test_limit_is_validated(self):
+        for i in range(3):
+            self.create_post(f'книга {i}')
+        self.assertEqual(self.client.get('/api/posts/search/?q=').status_code, 400)
+        self.assertEqual(len(self.client.get('/api/posts/search/', {'q': 'книга', 'limit': 2}).json()), 2)
+        self.assertEqual(len(self.client.get('/api/posts/search/', {'q': 'книга', 'limit': 'abc'}).json()), 3)
+        self.assertEqual(len(self.client.get('/api/posts/search/', {'q': 'книга', 'limit': -1}).json()), 1)
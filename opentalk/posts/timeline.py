@@ -0,0 +1,196 @@
+"""
+Материализованная домашняя лента пользователя (fan-out-on-write).
+
+Новый пост раскладывается в ленты всех подписчиков автора в момент создания,
+поэтому чтение ленты - это диапазонный скан по индексу (владелец, дата)
+и не зависит от общего количества постов.
+
+Посты "звезд" (авторов с большим числом подписчиков) не раскладываются
+при создании: их подтягивает в ленту сам читатель при открытии ленты
+(fan-out-on-read), чтобы один пост не порождал миллионы записей.
+
+Раскладка только вставляет записи: ленты подписчиков обрезаются до
+TIMELINE_MAX_LENGTH периодически командой rebuild_timelines --trim-only,
+вне транзакции создания поста. Чтение ленты берет страницу по индексу,
+поэтому лишние старые записи ему не мешают.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from users.models import Subscription
+from .models import Post, TimelineEntry
+
+User = get_user_model()
+
+# Максимальная длина ленты одного пользователя
+TIMELINE_MAX_LENGTH = getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+# Начиная с этого количества подписчиков автор считается "звездой"
+CELEBRITY_FOLLOWERS = getattr(settings, 'TIMELINE_CELEBRITY_FOLLOWERS', 10000)
+
+# Размер пачки при массовой вставке записей ленты
+FANOUT_BATCH_SIZE = getattr(settings, 'TIMELINE_FANOUT_BATCH_SIZE', 1000)
+
+# На сколько записей лента может превысить TIMELINE_MAX_LENGTH, прежде чем ее обрежет rebuild_timelines --trim-only
+TIMELINE_TRIM_SLACK = getattr(settings, 'TIMELINE_TRIM_SLACK', 50)
+
+CELEBRITY_IDS_CACHE_KEY = 'timeline:celebrity_ids'
+CELEBRITY_IDS_TIMEOUT = 600  # 10 минут
+CELEBRITY_PULL_CACHE_KEY = 'timeline:celebrity_pull:{user_id}'
+CELEBRITY_PULL_TIMEOUT = 60 * 60 * 24  # сутки
+
+
+def get_celebrity_ids():
+    """Возвращает множество ID авторов, посты которых читаются через fan-out-on-read"""
+    celebrity_ids = cache.get(CELEBRITY_IDS_CACHE_KEY)
+    if celebrity_ids is None:
+        celebrity_ids = set(
+            User.objects.filter(followers_count__gte=CELEBRITY_FOLLOWERS).values_list('id', flat=True)
+        )
+        cache.set(CELEBRITY_IDS_CACHE_KEY, celebrity_ids, CELEBRITY_IDS_TIMEOUT)
+    return celebrity_ids
+
+
+def _bulk_insert(entries):
+    """Вставка записей ленты пачками, уже существующие записи пропускаются"""
+    TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленту автора и ленты его подписчиков"""
+    def entry(owner_id):
+        return TimelineEntry(owner_id=owner_id, post_id=post.id, author_id=post.user_id,
+                             created_at=post.created_at)
+
+    def insert(owner_ids):
+        _bulk_insert([entry(owner_id) for owner_id in owner_ids])
+
+    # Свой пост автор видит в ленте всегда
+    insert([post.user_id])
+
+    # Посты "звезд" подписчики подтягивают сами при чтении ленты
+    if post.user_id in get_celebrity_ids():
+        return
+
+    follower_ids = Subscription.objects.filter(
+        followed_id=post.user_id
+    ).values_list('follower_id', flat=True).iterator(chunk_size=FANOUT_BATCH_SIZE)
+
+    batch = []
+    for follower_id in follower_ids:
+        batch.append(follower_id)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            insert(batch)
+            batch = []
+    if batch:
+        insert(batch)
+
+
+def backfill(follower_id, followed_id):
+    """Добавляет в ленту подписчика последние посты автора после подписки"""
+    posts = Post.objects.filter(
+        user_id=followed_id
+    ).order_by('-created_at', '-id').values_list('id', 'created_at')[:TIMELINE_MAX_LENGTH]
+
+    _bulk_insert([
+        TimelineEntry(owner_id=follower_id, post_id=post_id, author_id=followed_id, created_at=created_at)
+        for post_id, created_at in posts
+    ])
+    trim_timeline(follower_id)
+
+
+def prune(follower_id, followed_id):
+    """Удаляет посты автора из ленты пользователя после отписки"""
+    TimelineEntry.objects.filter(owner_id=follower_id, author_id=followed_id).delete()
+
+
+def trim_timeline(owner_id):
+    """Обрезает ленту пользователя до TIMELINE_MAX_LENGTH последних записей"""
+    boundary = TimelineEntry.objects.filter(
+        owner_id=owner_id
+    ).order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[
+        TIMELINE_MAX_LENGTH:TIMELINE_MAX_LENGTH + 1
+    ]
+    boundary = list(boundary)
+    if not boundary:
+        return 0
+
+    created_at, post_id = boundary[0]
+    deleted, _ = TimelineEntry.objects.filter(owner_id=owner_id).filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lte=post_id)
+    ).delete()
+    return deleted
+
+
+def trim_timelines(owner_ids):
+    """
+    Обрезает ленты пользователей, длина которых превысила
+    TIMELINE_MAX_LENGTH + TIMELINE_TRIM_SLACK. Запас позволяет обрезать ленту
+    один раз на много новых постов, а не после каждого.
+    Возвращает количество удаленных записей.
+    """
+    overfull = TimelineEntry.objects.filter(owner_id__in=owner_ids).order_by().values('owner_id').annotate(
+        length=Count('pk')
+    ).filter(length__gt=TIMELINE_MAX_LENGTH + TIMELINE_TRIM_SLACK).values_list('owner_id', flat=True)
+    return sum(trim_timeline(owner_id) for owner_id in list(overfull))
+
+
+def pull_celebrity_posts(user):
+    """
+    Подтягивает в ленту пользователя новые посты "звезд", на которых он подписан
+    """
+    celebrity_ids = get_celebrity_ids()
+    if not celebrity_ids:
+        return
+
+    followed_ids = list(Subscription.objects.filter(
+        follower=user, followed_id__in=celebrity_ids
+    ).values_list('followed_id', flat=True))
+    if not followed_ids:
+        return
+
+    # Отметку времени фиксируем до запроса, чтобы не потерять посты, созданные во время чтения
+    pull_key = CELEBRITY_PULL_CACHE_KEY.format(user_id=user.id)
+    pulled_at = cache.get(pull_key)
+    now = timezone.now()
+
+    posts = Post.objects.filter(user_id__in=followed_ids)
+    if pulled_at is not None:
+        posts = posts.filter(created_at__gte=pulled_at)
+    posts = posts.order_by('-created_at', '-id').values_list('id', 'user_id', 'created_at')[:TIMELINE_MAX_LENGTH]
+
+    entries = [
+        TimelineEntry(owner_id=user.id, post_id=post_id, author_id=author_id, created_at=created_at)
+        for post_id, author_id, created_at in posts
+    ]
+    if entries:
+        _bulk_insert(entries)
+        trim_timeline(user.id)
+    cache.set(pull_key, now, CELEBRITY_PULL_TIMEOUT)
+
+
+def home_timeline(user):
+    """
+    Возвращает записи домашней ленты пользователя от новых к старым
+    """
+    pull_celebrity_posts(user)
+    return timeline_entries(user)
+
+
+def timeline_entries(user):
+    """Записи ленты пользователя с постами от новых к старым"""
+    return TimelineEntry.objects.filter(owner=user).select_related('post').order_by('-created_at', '-post_id')
+
+
+def rebuild_timeline(user):
+    """Полностью пересобирает ленту пользователя из его подписок и собственных постов"""
+    TimelineEntry.objects.filter(owner=user).delete()
+    cache.delete(CELEBRITY_PULL_CACHE_KEY.format(user_id=user.id))
+
+    backfill(user.id, user.id)
+    followed_ids = Subscription.objects.filter(follower=user).values_list('followed_id', flat=True)
+    for followed_id in followed_ids:
+        backfill(user.id, followed_id)
@@ -0,0 +1,308 @@
+"""
+Инкрементальный движок трендов.
+
+Каждое использование хештега в посте - событие, которое учитывается
+в группах (категория, местоположение). Для каждой группы движок хранит
+Count-Min Sketch с экспоненциальным затуханием (forward decay) и кучу top-K
+самых частых хештегов, поэтому память ограничена и не зависит от количества
+постов и хештегов. Периодически top-N каждой группы материализуется в таблицу Trend.
+
+Категория поста определяется по его хештегам через словарь TREND_CATEGORIES
+({категория: [хештеги]}): пост с #футбол попадает в категорию "спорт",
+и все его хештеги учитываются в трендах этой категории.
+
+Движок работает в одном процессе - команде compute_trends, которая читает события
+из PostHashtag и единственная пишет в таблицу Trend. Веб-процессы тренды не считают.
+"""
+import hashlib
+import heapq
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from functools import reduce
+from itertools import groupby
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from opentalk.response_cache import invalidate
+
+from .models import Hashtag, PostHashtag, Trend
+
+# Период полураспада веса события, секунды
+TREND_HALF_LIFE = getattr(settings, 'TREND_HALF_LIFE', 6 * 60 * 60)
+
+# Хештеги, не встречавшиеся дольше окна, выпадают из трендов, секунды
+TREND_WINDOW = getattr(settings, 'TREND_WINDOW', 24 * 60 * 60)
+
+# Размер кучи кандидатов и количество трендов, сохраняемых в Trend, для каждой группы
+TREND_TOP_K = getattr(settings, 'TREND_TOP_K', 100)
+TREND_TOP_N = getattr(settings, 'TREND_TOP_N', 10)
+
+# Как часто команда compute_trends --follow пересчитывает таблицу Trend, секунды
+TREND_MATERIALIZE_INTERVAL = getattr(settings, 'TREND_MATERIALIZE_INTERVAL', 5 * 60)
+
+# За сколько последних секунд посты просматриваются повторно при догоняющем учете:
+# транзакция поста может зафиксироваться позже транзакций с большими ID
+TREND_CATCH_UP_WINDOW = getattr(settings, 'TREND_CATCH_UP_WINDOW', 10 * 60)
+
+# Параметры Count-Min Sketch и максимальное количество групп (категория, местоположение)
+TREND_SKETCH_WIDTH = getattr(settings, 'TREND_SKETCH_WIDTH', 2048)
+TREND_SKETCH_DEPTH = getattr(settings, 'TREND_SKETCH_DEPTH', 4)
+TREND_MAX_GROUPS = getattr(settings, 'TREND_MAX_GROUPS', 200)
+
+# Категории трендов и хештеги, по которым пост относится к категории
+TREND_CATEGORIES = getattr(settings, 'TREND_CATEGORIES', {})
+
+# Время жизни кеша ответа /api/trends/categories/; кеш ответов трендов
+# сбрасывается при каждой материализации
+TREND_CATEGORIES_TIMEOUT = getattr(settings, 'TREND_CATEGORIES_TIMEOUT', 60 * 60)
+
+# Предел показателя степени веса, после которого счетчики перенормируются
+MAX_DECAY_EXPONENT = 256
+
+
+class CountMinSketch:
+    """
+    Вероятностный счетчик частот фиксированного размера.
+    Оценка никогда не бывает меньше настоящего значения.
+    """
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.salt = os.urandom(16)
+        self.rows = [array('d', bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, key):
+        # Двойное хеширование: индексы строк независимы при одном вычислении хеша
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16, salt=self.salt).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, weight):
+        """Добавляет вес ключу и возвращает новую оценку"""
+        estimate = math.inf
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += weight
+            estimate = min(estimate, row[index])
+        return estimate
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def scale(self, factor):
+        for row in self.rows:
+            for index in range(self.width):
+                row[index] *= factor
+
+
+class TopK:
+    """
+    K ключей с наибольшей оценкой. Куча обновляется лениво:
+    устаревшие записи отбрасываются при извлечении минимума.
+    """
+    def __init__(self, k):
+        self.k = k
+        self.scores = {}
+        self.last_seen = {}
+        self.heap = []
+
+    def update(self, key, score, now):
+        if key in self.scores:
+            self.scores[key] = score
+        elif len(self.scores) < self.k:
+            self.scores[key] = score
+        else:
+            min_key, min_score = self._peek_min()
+            if score <= min_score:
+                return
+            heapq.heappop(self.heap)
+            del self.scores[min_key]
+            self.last_seen.pop(min_key, None)
+            self.scores[key] = score
+
+        self.last_seen[key] = now
+        heapq.heappush(self.heap, (score, key))
+        if len(self.heap) > 4 * self.k:
+            self.heap = [(score, key) for key, score in self.scores.items()]
+            heapq.heapify(self.heap)
+
+    def _peek_min(self):
+        # Пропускаем записи, оценка которых с тех пор выросла
+        while self.heap[0][0] != self.scores.get(self.heap[0][1]):
+            heapq.heappop(self.heap)
+        score, key = self.heap[0]
+        return key, score
+
+    def scale(self, factor):
+        self.scores = {key: score * factor for key, score in self.scores.items()}
+        self.heap = [(score, key) for key, score in self.scores.items()]
+        heapq.heapify(self.heap)
+
+
+class TrendGroup:
+    """
+    Затухающие счетчики хештегов одной группы (категория, местоположение)
+    """
+    def __init__(self, now):
+        self.sketch = CountMinSketch(TREND_SKETCH_WIDTH, TREND_SKETCH_DEPTH)
+        self.top = TopK(TREND_TOP_K)
+        self.landmark = now
+
+    def add(self, name, now):
+        exponent = (now - self.landmark) / TREND_HALF_LIFE
+        if exponent > MAX_DECAY_EXPONENT:
+            # Переносим точку отсчета, чтобы веса не переполнялись
+            factor = 2 ** -exponent
+            self.sketch.scale(factor)
+            self.top.scale(factor)
+            self.landmark = now
+            exponent = 0
+        score = self.sketch.add(name, 2 ** exponent)
+        self.top.update(name, score, now)
+
+    def top_n(self, n, now):
+        """Возвращает n самых популярных хештегов с затухшими к текущему моменту оценками"""
+        decay = 2 ** (-(now - self.landmark) / TREND_HALF_LIFE)
+        alive = [
+            (name, score * decay) for name, score in self.top.scores.items()
+            if now - self.top.last_seen[name] <= TREND_WINDOW
+        ]
+        return heapq.nlargest(n, alive, key=lambda item: item[1])
+
+
+def post_categories(names):
+    """Категории поста по его хештегам"""
+    return {
+        category for category, category_names in TREND_CATEGORIES.items()
+        if not names.isdisjoint(category_names)
+    }
+
+
+class TrendEngine:
+    """
+    Движок трендов: принимает события использования хештегов
+    и материализует top-N каждой группы в таблицу Trend
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.groups = OrderedDict()
+        self.last_usage_id = 0  # последняя учтенная запись PostHashtag
+        self.recent_posts = {}  # {ID поста: время создания} учтенных постов за TREND_CATCH_UP_WINDOW
+
+    def record(self, names, categories=(), location='', timestamp=None):
+        """Учитывает использование хештегов в посте"""
+        now = timestamp if timestamp is not None else time.time()
+        keys = {
+            (category, group_location)
+            for category in {*categories, ''}
+            for group_location in {location, ''}
+        }
+        with self._lock:
+            for key in keys:
+                group = self.groups.get(key)
+                if group is None:
+                    group = self.groups[key] = TrendGroup(now)
+                    if len(self.groups) > TREND_MAX_GROUPS:
+                        # Вытесняем группу, которая дольше всех не обновлялась (глобальную не трогаем)
+                        for old_key in self.groups:
+                            if old_key != ('', ''):
+                                del self.groups[old_key]
+                                break
+                self.groups.move_to_end(key)
+                for name in names:
+                    group.add(name, now)
+
+    def top(self, n=TREND_TOP_N, now=None):
+        """Возвращает {(категория, местоположение): [(хештег, оценка), ...]}"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            return {key: group.top_n(n, now) for key, group in self.groups.items()}
+
+    def materialize(self, n=TREND_TOP_N):
+        """
+        Записывает текущие тренды в таблицу Trend. Возвращает количество трендов.
+
+        Строки каждой группы (категория, местоположение) заменяются в одной транзакции,
+        поэтому читатели не видят пустую таблицу. Группы, которые движок больше не ведет,
+        удаляются, когда их строки становятся старше окна TREND_WINDOW.
+        """
+        result = self.top(n)
+        if not result:
+            return 0
+        names = {name for trends in result.values() for name, _ in trends}
+        hashtag_ids = dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+
+        trends = [
+            Trend(hashtag_id=hashtag_ids[name], trend_score=round(score, 4),
+                  category=category, location=location)
+            for (category, location), group_trends in result.items()
+            for name, score in group_trends
+            if name in hashtag_ids
+        ]
+        groups = reduce(or_, (Q(category=category, location=location) for category, location in result))
+        stale_before = timezone.now() - timezone.timedelta(seconds=TREND_WINDOW)
+        with transaction.atomic():
+            Trend.objects.filter(groups | Q(created_at__lt=stale_before)).delete()
+            Trend.objects.bulk_create(trends)
+            invalidate('trends')
+        return len(trends)
+
+    def rebuild(self):
+        """Заполняет движок хештегами постов за последнее окно TREND_WINDOW"""
+        since = timezone.now() - timezone.timedelta(seconds=TREND_WINDOW)
+        with self._lock:
+            self.groups.clear()
+            self.last_usage_id = 0
+        self.recent_posts = {}
+        self._record_usages(
+            PostHashtag.objects.filter(post__created_at__gte=since).order_by('post_id', 'id')
+        )
+
+    def catch_up(self):
+        """
+        Учитывает хештеги постов, появившихся после последнего пересчета.
+        Возвращает количество учтенных постов.
+
+        Кроме записей с новыми ID повторно читаются посты за последние
+        TREND_CATCH_UP_WINDOW секунд: так учитываются транзакции, зафиксированные
+        позже транзакций с большими ID. Уже учтенные посты пропускаются.
+        """
+        since = time.time() - TREND_CATCH_UP_WINDOW
+        self.recent_posts = {
+            post_id: created for post_id, created in self.recent_posts.items() if created >= since
+        }
+        return self._record_usages(
+            PostHashtag.objects.filter(
+                Q(id__gt=self.last_usage_id)
+                | Q(post__created_at__gte=timezone.now() - timezone.timedelta(seconds=TREND_CATCH_UP_WINDOW))
+            ).order_by('post_id', 'id')
+        )
+
+    def _record_usages(self, usages):
+        usages = usages.values_list('id', 'post_id', 'hashtag__name', 'post__user__location', 'post__created_at')
+        since = time.time() - TREND_CATCH_UP_WINDOW
+        posts = 0
+        # Хештеги поста вставляются в одной транзакции с ним, поэтому пост учитывается целиком
+        for post_id, rows in groupby(usages.iterator(), key=lambda row: row[1]):
+            rows = list(rows)
+            self.last_usage_id = max(self.last_usage_id, max(row[0] for row in rows))
+            if post_id in self.recent_posts:
+                continue
+            names = {row[2] for row in rows}
+            _, _, _, location, created_at = rows[0]
+            created = created_at.timestamp()
+            self.record(names, categories=post_categories(names), location=location or '', timestamp=created)
+            if created >= since:
+                self.recent_posts[post_id] = created
+            posts += 1
+        return posts
+
+
+engine = TrendEngine()
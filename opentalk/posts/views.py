@@ -3,51 +3,62 @@ from rest_framework import viewsets, status, permissions, generics, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db.models import Q
+from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q, F, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from .models import Post, Comment, Like, Hashtag, Trend
 from .serializers import (
     PostSerializer, CommentSerializer, CreateCommentSerializer,
     LikeSerializer, HashtagSerializer, TrendSerializer
 )
+from .timeline import home_timeline
+from .trends import TREND_CATEGORIES_TIMEOUT
+from .search import PostSearchFilter, post_search_index
+from . import counters, queries
+from .pagination import PostCursorPagination, TimelineCursorPagination
+from opentalk.pagination import ActionPaginationMixin, get_limit
+from opentalk.response_cache import cache_response
+from opentalk.routers import ReplicaReadMixin
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(ReplicaReadMixin, ActionPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с постами
     """
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.SearchFilter]
+    pagination_class = PostCursorPagination
+    action_pagination_classes = {
+        'feed': TimelineCursorPagination,
+        'comments': PageNumberPagination,
+    }
+    filter_backends = [PostSearchFilter]
     search_fields = ['content']
     
     def get_queryset(self):
         """
         Фильтрация результатов на основе параметров запроса
         """
-        queryset = Post.objects.all()
-        
         # Получение параметров фильтрации из запроса
         username = self.request.query_params.get('username', None)
         hashtag = self.request.query_params.get('hashtag', None)
         
-        if username is not None:
-            queryset = queryset.filter(user__username=username)
-        
-        if hashtag is not None:
-            queryset = queryset.filter(hashtags__hashtag__name=hashtag)
-        
-        return queryset
+        return queries.post_list(username=username, hashtag=hashtag)
     
     def perform_create(self, serializer):
         serializer.save()
     
+    @cache_response('post:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def comments(self, request, pk=None):
         """Получение комментариев поста"""
         post = self.get_object()
-        comments = Comment.objects.filter(post=post, parent=None)  # Только родительские комментарии
+        comments = queries.post_comments(post)  # Только родительские комментарии
         page = self.paginate_queryset(comments)
         if page is not None:
             serializer = CommentSerializer(page, many=True, context={'request': request})
@@ -68,8 +79,7 @@ class PostViewSet(viewsets.ModelViewSet):
         )
         
         if created:
-            post.likes_count += 1
-            post.save()
+            counters.increment(post, 'likes_count')
             return Response({"status": "Лайк добавлен"}, status=status.HTTP_201_CREATED)
         
         return Response({"status": "Пост уже лайкнут"}, status=status.HTTP_200_OK)
@@ -89,9 +99,7 @@ class PostViewSet(viewsets.ModelViewSet):
             like.delete()
             
             # Уменьшаем счетчик лайков
-            if post.likes_count > 0:
-                post.likes_count -= 1
-                post.save()
+            counters.decrement(post, 'likes_count')
             
             return Response({"status": "Лайк удален"}, status=status.HTTP_200_OK)
         except Like.DoesNotExist:
@@ -119,35 +127,49 @@ class PostViewSet(viewsets.ModelViewSet):
         )
         
         # Увеличиваем счетчик репостов у оригинального поста
-        original_post.reposts_count += 1
-        original_post.save()
+        counters.increment(original_post, 'reposts_count')
         
         serializer = PostSerializer(repost, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
-    def feed(self, request):
-        """Получение ленты постов"""
-        user = request.user
+    def search(self, request):
+        """Полнотекстовый поиск постов с ранжированием по релевантности"""
+        query = request.query_params.get('q', '')
+        limit = get_limit(request)
         
-        # Получаем ID пользователей, на которых подписан текущий пользователь
-        following_ids = user.following.values_list('followed_id', flat=True)
+        if not query.strip():
+            return Response({"detail": "Поисковый запрос не может быть пустым."},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        # Получаем посты пользователей, на которых подписан текущий пользователь, и его собственные посты
-        posts = Post.objects.filter(
-            Q(user_id__in=following_ids) | Q(user=user)
-        ).order_by('-created_at')
+        if post_search_index.is_supported:
+            hits = post_search_index.search(query, limit=limit)
+            posts_by_id = Post.objects.in_bulk([hit.doc_id for hit in hits])
+            posts = [posts_by_id[hit.doc_id] for hit in hits if hit.doc_id in posts_by_id]
+        else:
+            posts = list(Post.objects.filter(content__icontains=query).order_by('-created_at')[:limit])
         
-        page = self.paginate_queryset(posts)
+        serializer = PostSerializer(posts, many=True, context={'request': request})
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Получение ленты постов"""
+        # Лента читается из материализованного хранилища, а не собирается по таблице постов
+        entries = home_timeline(request.user)
+        
+        page = self.paginate_queryset(entries)
         if page is not None:
-            serializer = PostSerializer(page, many=True, context={'request': request})
+            posts = [entry.post for entry in page]
+            serializer = PostSerializer(posts, many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
         
+        posts = [entry.post for entry in entries]
         serializer = PostSerializer(posts, many=True, context={'request': request})
         return Response(serializer.data)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с комментариями
     """
@@ -167,7 +189,7 @@ class CommentViewSet(viewsets.ModelViewSet):
     def replies(self, request, pk=None):
         """Получение ответов на комментарий"""
         comment = self.get_object()
-        replies = Comment.objects.filter(parent=comment)
+        replies = queries.comment_replies(comment)
         page = self.paginate_queryset(replies)
         if page is not None:
             serializer = CommentSerializer(page, many=True, context={'request': request})
@@ -188,8 +210,7 @@ class CommentViewSet(viewsets.ModelViewSet):
         )
         
         if created:
-            comment.likes_count += 1
-            comment.save()
+            counters.increment(comment, 'likes_count')
             return Response({"status": "Лайк добавлен"}, status=status.HTTP_201_CREATED)
         
         return Response({"status": "Комментарий уже лайкнут"}, status=status.HTTP_200_OK)
@@ -209,9 +230,7 @@ class CommentViewSet(viewsets.ModelViewSet):
             like.delete()
             
             # Уменьшаем счетчик лайков
-            if comment.likes_count > 0:
-                comment.likes_count -= 1
-                comment.save()
+            counters.decrement(comment, 'likes_count')
             
             return Response({"status": "Лайк удален"}, status=status.HTTP_200_OK)
         except Like.DoesNotExist:
@@ -221,21 +240,33 @@ class CommentViewSet(viewsets.ModelViewSet):
             )
 
 
-class HashtagViewSet(viewsets.ReadOnlyModelViewSet):
+class HashtagViewSet(ReplicaReadMixin, ActionPaginationMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для работы с хештегами (только чтение)
     """
     queryset = Hashtag.objects.all()
     serializer_class = HashtagSerializer
     permission_classes = [IsAuthenticated]
+    action_pagination_classes = {'posts': PostCursorPagination}
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
     
+    @cache_response('hashtags', vary_on_user=False)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cache_response('hashtag:{pk}', vary_on_user=False)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def posts(self, request, pk=None):
-        """Получение постов по хештегу"""
+        """
+        Получение постов по хештегу. Не кешируется: лайки и счетчики постов
+        меняются чаще, чем список постов хештега
+        """
         hashtag = self.get_object()
-        posts = Post.objects.filter(hashtags__hashtag=hashtag).order_by('-created_at')
+        posts = queries.hashtag_posts(hashtag)
         page = self.paginate_queryset(posts)
         if page is not None:
             serializer = PostSerializer(page, many=True, context={'request': request})
@@ -244,7 +275,7 @@ class HashtagViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class TrendViewSet(viewsets.ReadOnlyModelViewSet):
+class TrendViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для работы с трендами (только чтение)
     """
@@ -258,27 +289,47 @@ class TrendViewSet(viewsets.ReadOnlyModelViewSet):
         """
         queryset = Trend.objects.all().order_by('-trend_score')
         
-        # Получение параметров фильтрации из запроса
-        category = self.request.query_params.get('category', None)
-        location = self.request.query_params.get('location', None)
-        
-        if category is not None:
-            queryset = queryset.filter(category=category)
-        
-        if location is not None:
-            queryset = queryset.filter(location=location)
+        if self.action == 'list':
+            # Движок пишет тренды каждой группы (категория, местоположение) отдельно:
+            # без параметров отдается общая группа, иначе хештег повторялся бы по разу на группу
+            queryset = queryset.filter(
+                category=self.request.query_params.get('category', ''),
+                location=self.request.query_params.get('location', ''),
+            )
         
         return queryset
     
+    @cache_response('trends', vary_on_user=False)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cache_response('trends', vary_on_user=False)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @cache_response('trends', timeout=TREND_CATEGORIES_TIMEOUT, vary_on_user=False)
     def categories(self, request):
-        """Получение трендов по категориям"""
-        categories = Trend.objects.values_list('category', flat=True).distinct()
-        result = {}
+        """
+        Получение трендов по категориям. Тренды категорий считаются отдельно для каждого
+        местоположения: по умолчанию отдаются общие, ?location= - тренды местоположения
+        """
+        location = request.query_params.get('location', '')
+        # Топ-5 трендов каждой категории одним запросом через оконную функцию
+        trends = Trend.objects.exclude(category='').filter(location=location).select_related('hashtag').annotate(
+            rank=Window(
+                expression=RowNumber(),
+                partition_by=F('category'),
+                order_by=[F('trend_score').desc(), F('id').asc()]
+            )
+        ).filter(rank__lte=5).order_by('category', 'rank')
         
-        for category in categories:
-            if category:  # Проверка на None и пустую строку
-                trends = Trend.objects.filter(category=category).order_by('-trend_score')[:5]
-                result[category] = TrendSerializer(trends, many=True).data
+        by_category = {}
+        for trend in trends:
+            by_category.setdefault(trend.category, []).append(trend)
         
+        result = {
+            category: TrendSerializer(category_trends, many=True).data
+            for category, category_trends in by_category.items()
+        }
         return Response(result)
@@ -0,0 +1,75 @@
+"""
+Локальный брокер событий - замена Redis Pub/Sub для разработки и тестов.
+
+Клиенты подключаются по TCP и обмениваются JSON-объектами, по одному на строку:
+
+    {"op": "sub", "channel": "user:1"}
+    {"op": "unsub", "channel": "user:1"}
+    {"op": "pub", "channel": "user:1", "data": {...}}
+
+Подписчики получают {"channel": "user:1", "data": {...}}.
+"""
+import asyncio
+import json
+import logging
+
+# Подписчик, не забирающий события, отключается при таком размере буфера отправки
+MAX_WRITE_BUFFER = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    def __init__(self):
+        self.subscribers = {}  # канал -> множество writer
+
+    async def handle(self, reader, writer):
+        channels = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    op, channel = message['op'], message['channel']
+                except (ValueError, KeyError, TypeError):
+                    logger.warning('Неверное сообщение брокера: %r', line[:200])
+                    continue
+
+                if op == 'sub':
+                    channels.add(channel)
+                    self.subscribers.setdefault(channel, set()).add(writer)
+                elif op == 'unsub':
+                    channels.discard(channel)
+                    self.subscribers.get(channel, set()).discard(writer)
+                elif op == 'pub':
+                    self.publish(channel, message.get('data'))
+        except ConnectionError:
+            pass
+        finally:
+            for channel in channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(writer)
+                    if not subscribers:
+                        del self.subscribers[channel]
+            writer.close()
+
+    def publish(self, channel, data):
+        line = (json.dumps({'channel': channel, 'data': data}, ensure_ascii=False) + '\n').encode('utf-8')
+        for writer in list(self.subscribers.get(channel, ())):
+            if writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                logger.warning('Подписчик канала %s не успевает читать события, соединение закрыто', channel)
+                writer.close()
+                continue
+            writer.write(line)
+
+
+async def serve(host='127.0.0.1', port=8765):
+    broker = Broker()
+    server = await asyncio.start_server(broker.handle, host, port)
+    async with server:
+        await server.serve_forever()
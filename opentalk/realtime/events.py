@@ -0,0 +1,56 @@
+"""
+События, которые WebSocket-шлюз доставляет участникам чатов.
+
+Каждый пользователь подписан на свой канал user:<id>, события публикуются
+в каналы получателей. Функции вызываются из представлений после фиксации
+транзакции, ошибка доставки не влияет на результат запроса.
+"""
+import logging
+
+from .pubsub import get_pubsub
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def publish_to_users(user_ids, event):
+    """Публикует событие в каналы пользователей"""
+    pubsub = get_pubsub()
+    for user_id in set(user_ids):
+        try:
+            pubsub.publish(user_channel(user_id), event)
+        except Exception:
+            logger.exception('Не удалось опубликовать событие %s', event.get('type'))
+
+
+def message_created(message, data):
+    """Новое сообщение - обоим участникам чата"""
+    chat = message.chat
+    publish_to_users([chat.user1_id, chat.user2_id], {
+        'type': 'message.new',
+        'chat_id': chat.id,
+        'message': data,
+    })
+
+
+def messages_read(chat, reader_id, last_read_message_id):
+    """Отметка о прочтении - собеседнику прочитавшего"""
+    recipient_id = chat.user2_id if chat.user1_id == reader_id else chat.user1_id
+    publish_to_users([recipient_id], {
+        'type': 'messages.read',
+        'chat_id': chat.id,
+        'user_id': reader_id,
+        'last_read_message_id': last_read_message_id,
+    })
+
+
+def typing(chat_id, user_id, recipient_id):
+    """Пользователь набирает сообщение - собеседнику"""
+    publish_to_users([recipient_id], {
+        'type': 'typing',
+        'chat_id': chat_id,
+        'user_id': user_id,
+    })
@@ -0,0 +1,156 @@
+"""
+WebSocket-шлюз: ASGI-приложение для соединений ws://<host>/ws/?token=<access token>.
+
+Клиент аутентифицируется access-токеном SimpleJWT (параметр token или заголовок
+Authorization: Bearer ...) и получает события своих чатов:
+
+    {"type": "message.new", "chat_id": 1, "message": {...}}
+    {"type": "messages.read", "chat_id": 1, "user_id": 2, "last_read_message_id": 15}
+    {"type": "typing", "chat_id": 1, "user_id": 2}
+
+Клиент может отправлять:
+
+    {"type": "typing", "chat_id": 1}
+    {"type": "ping"}  -> {"type": "pong"}
+
+Подключение и каждый ping продлевают присутствие пользователя онлайн (users.presence).
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from messages_api.models import Chat
+from users import presence
+from . import events
+from .pubsub import encode, get_pubsub
+
+WEBSOCKET_PATH = '/ws/'
+
+# Коды закрытия соединения
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+
+logger = logging.getLogger(__name__)
+
+
+def _get_token(scope):
+    token = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    if token:
+        return token[0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0] == 'Bearer':
+                return parts[1]
+    return None
+
+
+@sync_to_async
+def authenticate(raw_token):
+    """Возвращает пользователя по access-токену или None"""
+    authentication = JWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active else None
+
+
+@sync_to_async
+def get_recipient_id(chat_id, user):
+    """Возвращает ID собеседника в чате или None, если пользователь не участник чата"""
+    chat = Chat.objects.filter(Q(user1=user) | Q(user2=user), id=chat_id).values_list(
+        'user1_id', 'user2_id'
+    ).first()
+    if chat is None:
+        return None
+    return chat[1] if chat[0] == user.id else chat[0]
+
+
+heartbeat = sync_to_async(presence.heartbeat, thread_sensitive=False)
+
+
+class Connection:
+    """Одно WebSocket-соединение пользователя"""
+    def __init__(self, user, send):
+        self.user = user
+        self.send = send
+        self.recipients = {}  # ID чата -> ID собеседника (None - нет доступа)
+
+    async def send_json(self, data):
+        await self.send({'type': 'websocket.send', 'text': encode(data)})
+
+    async def forward(self, subscription):
+        """Пересылает клиенту события из канала пользователя"""
+        while True:
+            await self.send_json(await subscription.get())
+
+    async def handle(self, text):
+        try:
+            data = json.loads(text)
+            event_type = data.get('type')
+        except (ValueError, AttributeError):
+            return
+
+        if event_type == 'ping':
+            await heartbeat(self.user.id)
+            await self.send_json({'type': 'pong'})
+        elif event_type == 'typing':
+            try:
+                chat_id = int(data.get('chat_id'))
+            except (TypeError, ValueError):
+                return
+            if chat_id not in self.recipients:
+                self.recipients[chat_id] = await get_recipient_id(chat_id, self.user)
+            recipient_id = self.recipients[chat_id]
+            if recipient_id is not None:
+                await sync_to_async(events.typing, thread_sensitive=False)(chat_id, self.user.id, recipient_id)
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI-приложение WebSocket-шлюза"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    if scope['path'] != WEBSOCKET_PATH:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    raw_token = _get_token(scope)
+    user = await authenticate(raw_token) if raw_token else None
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+
+    subscription = await get_pubsub().subscribe(events.user_channel(user.id))
+    await send({'type': 'websocket.accept'})
+    await heartbeat(user.id)
+
+    connection = Connection(user, send)
+    forwarder = asyncio.create_task(connection.forward(subscription))
+    try:
+        while True:
+            receiving = asyncio.ensure_future(receive())
+            done, _ = await asyncio.wait({receiving, forwarder}, return_when=asyncio.FIRST_COMPLETED)
+            if forwarder in done:
+                # Подписка оборвалась (например, брокер недоступен) - клиент переподключится
+                receiving.cancel()
+                forwarder.result()
+            message = receiving.result()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] == 'websocket.receive' and message.get('text'):
+                await connection.handle(message['text'])
+    except Exception:
+        logger.exception('Ошибка WebSocket-соединения пользователя %s', user.id)
+        await send({'type': 'websocket.close', 'code': 1011})
+    finally:
+        forwarder.cancel()
+        await subscription.close()
@@ -0,0 +1,22 @@
+import asyncio
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand
+from realtime.broker import serve
+from realtime.pubsub import REALTIME_BROKER_URL
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальный брокер событий для WebSocket-шлюза (замена Redis при разработке)'
+
+    def add_arguments(self, parser):
+        parsed = urlparse(REALTIME_BROKER_URL)
+        parser.add_argument('--host', default=parsed.hostname or '127.0.0.1')
+        parser.add_argument('--port', type=int, default=parsed.port or 8765)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"Брокер событий слушает {options['host']}:{options['port']}"))
+        try:
+            asyncio.run(serve(options['host'], options['port']))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,156 @@
+"""
+Публикация событий и подписка на каналы.
+
+Бэкенд выбирается настройкой REALTIME_PUBSUB_BACKEND:
+
+- InMemoryPubSub - подписчики в памяти текущего процесса (тесты, один воркер);
+- BrokerPubSub - подписчики в любом процессе через локальный брокер
+  (команда runbroker), который заменяет Redis при разработке.
+
+publish() синхронный и потокобезопасный: его вызывают обычные представления DRF.
+subscribe() асинхронный: его вызывает WebSocket-шлюз в цикле событий ASGI.
+"""
+import asyncio
+import json
+import logging
+import socket
+import threading
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+REALTIME_PUBSUB_BACKEND = getattr(settings, 'REALTIME_PUBSUB_BACKEND', 'realtime.pubsub.InMemoryPubSub')
+REALTIME_BROKER_URL = getattr(settings, 'REALTIME_BROKER_URL', 'tcp://127.0.0.1:8765')
+
+# Максимальное количество неотправленных событий одного подписчика
+SUBSCRIPTION_QUEUE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def encode(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+class InMemorySubscription:
+    """Подписка на каналы в памяти процесса"""
+    def __init__(self, pubsub, channels):
+        self.pubsub = pubsub
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(SUBSCRIPTION_QUEUE_SIZE)
+
+    def put(self, data):
+        # Вызывается из любого потока, очередь принадлежит циклу событий подписчика
+        self.loop.call_soon_threadsafe(self._put, data)
+
+    def _put(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            logger.warning('Подписчик не успевает читать события, событие отброшено')
+
+    async def get(self):
+        """Ожидает следующее событие"""
+        return await self.queue.get()
+
+    async def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class InMemoryPubSub:
+    """Публикация событий подписчикам в памяти текущего процесса"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # канал -> множество подписок
+
+    def publish(self, channel, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(data)
+
+    async def subscribe(self, *channels):
+        subscription = InMemorySubscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+
+class BrokerSubscription:
+    """Подписка на каналы через соединение с брокером"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def get(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError('Брокер закрыл соединение')
+        return json.loads(line)['data']
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class BrokerPubSub:
+    """
+    Публикация событий через локальный брокер (см. realtime/broker.py).
+    Протокол - JSON-объекты, по одному на строку.
+    """
+    def __init__(self, url=REALTIME_BROKER_URL):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 8765)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = socket.create_connection(self.address, timeout=5)
+        return connection
+
+    def publish(self, channel, data):
+        line = (encode({'op': 'pub', 'channel': channel, 'data': data}) + '\n').encode('utf-8')
+        try:
+            self._connection().sendall(line)
+        except OSError:
+            # Соединение могло быть закрыто брокером - переподключаемся один раз
+            self._local.connection = None
+            self._connection().sendall(line)
+
+    async def subscribe(self, *channels):
+        reader, writer = await asyncio.open_connection(*self.address)
+        for channel in channels:
+            writer.write((encode({'op': 'sub', 'channel': channel}) + '\n').encode('utf-8'))
+        await writer.drain()
+        return BrokerSubscription(reader, writer)
+
+
+_pubsub = None
+_pubsub_lock = threading.Lock()
+
+
+def get_pubsub():
+    """Возвращает бэкенд публикации событий, настроенный в REALTIME_PUBSUB_BACKEND"""
+    global _pubsub
+    if _pubsub is None:
+        with _pubsub_lock:
+            if _pubsub is None:
+                _pubsub = import_string(REALTIME_PUBSUB_BACKEND)()
+    return _pubsub
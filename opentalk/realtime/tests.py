@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+
+from messages_api.inbox import create_inbox_states
+from messages_api.models import Chat
+from opentalk.testing import OpenTalkTestCase, PresenceTestCase
+from users.models import User
+from .broker import Broker
+from .gateway import websocket_application
+from .pubsub import BrokerPubSub, get_pubsub
+
+
+class GatewayTests(PresenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='x')
+        self.friend = User.objects.create_user('friend', password='x')
+        self.chat = Chat.objects.create(user1=self.user, user2=self.friend)
+        create_inbox_states(self.chat)
+
+    async def connect(self, token):
+        communicator = ApplicationCommunicator(websocket_application, {
+            'type': 'websocket', 'path': '/ws/', 'query_string': f'token={token}'.encode(), 'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(2)
+
+    async def receive_json(self, communicator):
+        return json.loads((await communicator.receive_output(2))['text'])
+
+    async def send_json(self, communicator, data):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def test_invalid_token_is_rejected(self):
+        _, output = await self.connect('invalid')
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 4401})
+
+    async def test_chat_events_reach_participants(self):
+        user_socket, output = await self.connect(AccessToken.for_user(self.user))
+        self.assertEqual(output['type'], 'websocket.accept')
+        friend_socket, _ = await self.connect(AccessToken.for_user(self.friend))
+
+        await self.send_json(friend_socket, {'type': 'ping'})
+        self.assertEqual(await self.receive_json(friend_socket), {'type': 'pong'})
+
+        await self.send_json(user_socket, {'type': 'typing', 'chat_id': self.chat.id})
+        self.assertEqual(await self.receive_json(friend_socket),
+                         {'type': 'typing', 'chat_id': self.chat.id, 'user_id': self.user.id})
+
+        def send_message():
+            return self.client_for(self.user).post(
+                f'/api/chats/{self.chat.id}/send_message/', {'content': 'hello'}, format='json'
+            ).json()
+
+        message = await sync_to_async(send_message)()
+        for socket in (user_socket, friend_socket):
+            event = await self.receive_json(socket)
+            self.assertEqual((event['type'], event['message']['content']), ('message.new', 'hello'))
+
+        def read_messages():
+            self.client_for(self.friend).put(f'/api/chats/{self.chat.id}/messages/read/', {}, format='json')
+
+        await sync_to_async(read_messages)()
+        self.assertEqual(await self.receive_json(user_socket), {
+            'type': 'messages.read', 'chat_id': self.chat.id,
+            'user_id': self.friend.id, 'last_read_message_id': message['id'],
+        })
+        self.assertTrue(await friend_socket.receive_nothing(0.2))
+
+        for socket in (user_socket, friend_socket):
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(2)
+        # После отключения подписки на каналы пользователей освобождены
+        self.assertEqual(get_pubsub()._subscriptions, {})
+
+
+class BrokerTests(OpenTalkTestCase):
+    async def test_events_are_delivered_to_channel_subscribers(self):
+        server = await asyncio.start_server(Broker().handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        pubsub = BrokerPubSub(f'tcp://127.0.0.1:{port}')
+        async with server:
+            subscription = await pubsub.subscribe('user:1')
+            await asyncio.sleep(0.1)
+            # Публикация - короткая синхронная запись в сокет
+            pubsub.publish('user:2', {'text': 'чужое'})
+            pubsub.publish('user:1', {'text': 'привет'})
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 2), {'text': 'привет'})
+            await subscription.close()
+            pubsub._local.connection.close()
+            await asyncio.sleep(0.1)
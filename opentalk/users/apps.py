@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+    
+    def ready(self):
+        # Подключение обработчиков сигналов (счетчики подписчиков и подписок)
+        from . import signals  # noqa: F401
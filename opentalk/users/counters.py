@@ -0,0 +1,58 @@
+"""
+Денормализованные счетчики пользователя: подписчики, подписки и посты.
+
+Значения хранятся в колонках User и меняются атомарным инкрементом
+(UPDATE ... SET followers_count = followers_count + 1) при подписке, отписке,
+создании и удалении поста, поэтому профиль не выполняет COUNT по таблицам
+подписок и постов. Изменения в обход сигналов (массовые операции, правки в базе)
+исправляет reconcile_user_counters.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Subscription
+
+User = get_user_model()
+
+
+def increment(user_id, field, delta=1):
+    """Атомарно изменяет счетчик пользователя, не опуская его ниже нуля"""
+    queryset = User.objects.filter(pk=user_id)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def decrement(user_id, field, delta=1):
+    return increment(user_id, field, -delta)
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(count=Count('id')).values('count')
+    ), 0)
+
+
+def reconcile_user_counters(users=None):
+    """
+    Пересчитывает счетчики пользователей по подпискам и постам одним UPDATE.
+    Возвращает количество обновленных пользователей.
+    """
+    from posts.models import Post
+
+    users = User.objects.all() if users is None else users
+    return users.update(
+        followers_count=_count(Subscription.objects, 'followed'),
+        following_count=_count(Subscription.objects, 'follower'),
+        posts_count=_count(Post.objects, 'user'),
+    )
+
+
+def following_ids(user, user_ids):
+    """Возвращает ID пользователей из списка, на которых подписан user, одним запросом"""
+    if not user or not user.is_authenticated:
+        return set()
+    return set(Subscription.objects.filter(
+        follower=user, followed_id__in=set(user_ids)
+    ).values_list('followed_id', flat=True))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from opentalk.query_plans import captured_queries, check_plan, explain, hot_queries, is_limited, is_supported
+
+
+class Command(BaseCommand):
+    help = 'Проверяет через EXPLAIN, что горячие запросы не читают таблицы целиком'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help='Выводить планы запросов')
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError(
+                f'Проверка планов запросов поддерживается только для SQLite и PostgreSQL, '
+                f'текущая база: {connection.vendor}'
+            )
+
+        failed = []
+        for name, func in hot_queries():
+            queries = captured_queries(func)
+            if not queries:
+                raise CommandError(f'{name}: не выполнено ни одного запроса')
+            for number, sql in enumerate(queries, 1):
+                label = name if len(queries) == 1 else f'{name} ({number})'
+                plan = explain(sql)
+                tables, sort = check_plan(plan, limited=is_limited(sql))
+                if tables:
+                    failed.append(label)
+                    self.stdout.write(self.style.ERROR(f'{label}: полный просмотр {", ".join(tables)}'))
+                elif sort:
+                    self.stdout.write(self.style.WARNING(f'{label}: сортировка без индекса'))
+                else:
+                    self.stdout.write(f'{label}: OK')
+                if options['plans']:
+                    self.stdout.write(sql + '\n' + plan + '\n')
+
+        if failed:
+            raise CommandError(f'Запросы без подходящего индекса: {len(failed)}')
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from users.models import User
+from users.suggestions import precompute_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Рассчитывает рекомендации пользователей для подписки и сохраняет их в кеш'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='ID пользователя (по умолчанию - все активные пользователи)')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        computed = precompute_suggestions(users.values_list('id', flat=True).iterator())
+        self.stdout.write(self.style.SUCCESS(f'Рассчитаны рекомендации для пользователей: {computed}'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from users.presence import PRESENCE_EXPIRE_INTERVAL, expire_presence, presence_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        'Записывает статусы присутствия в базу и переводит в офлайн пользователей без heartbeat. '
+        'Без этого процесса поле status в базе не возвращается в офлайн'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--follow', action='store_true',
+            help='Не завершаться: переводить в офлайн раз в PRESENCE_EXPIRE_INTERVAL секунд',
+        )
+
+    def handle(self, *args, **options):
+        flushed = presence_buffer.flush()
+        expired = expire_presence()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано статусов: {flushed}, переведено в офлайн: {expired}'
+        ))
+
+        while options['follow']:
+            time.sleep(PRESENCE_EXPIRE_INTERVAL)
+            close_old_connections()
+            flushed = presence_buffer.flush()
+            expired = expire_presence()
+            self.stdout.write(f'Записано статусов: {flushed}, переведено в офлайн: {expired}')
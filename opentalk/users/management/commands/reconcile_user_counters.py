@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from users.counters import reconcile_user_counters
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики подписчиков, подписок и постов пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='ID пользователя (по умолчанию - все пользователи)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        updated = reconcile_user_counters(users)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано пользователей: {updated}'))
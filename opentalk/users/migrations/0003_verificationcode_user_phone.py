@@ -6,26 +6,10 @@ from django.db import migrations, models
 class Migration(migrations.Migration):
 
     dependencies = [
-        ('users', '0002_alter_user_avatar'),
+        ('users', '0003_verificationcode'),
     ]
 
     operations = [
-        migrations.CreateModel(
-            name='VerificationCode',
-            fields=[
-                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('phone', models.CharField(max_length=15, verbose_name='Номер телефона')),
-                ('code', models.CharField(max_length=6, verbose_name='Код подтверждения')),
-                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
-                ('expires_at', models.DateTimeField(null=True, verbose_name='Истекает')),
-                ('is_used', models.BooleanField(default=False, verbose_name='Использован')),
-            ],
-            options={
-                'verbose_name': 'Код верификации',
-                'verbose_name_plural': 'Коды верификации',
-                'ordering': ['-created_at'],
-            },
-        ),
         migrations.AddField(
             model_name='user',
             name='phone',
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscription = apps.get_model('users', 'Subscription')
+    Post = apps.get_model('posts', 'Post')
+    
+    def count(queryset, field):
+        return Coalesce(Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(count=Count('id')).values('count')
+        ), 0)
+    
+    User.objects.update(
+        followers_count=count(Subscription.objects, 'followed'),
+        following_count=count(Subscription.objects, 'follower'),
+        posts_count=count(Post.objects, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_merge_20250322_1448'),
+        ('posts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество постов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
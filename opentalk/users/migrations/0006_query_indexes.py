@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['followed', '-created_at', '-id'], name='subscription_followed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['follower', '-created_at', '-id'], name='subscription_follower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationcode',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['phone', 'expires_at'], name='verification_active_idx'),
+        ),
+    ]
@@ -32,12 +32,32 @@ class User(AbstractUser):
     is_verified = models.BooleanField(_("Верификация"), default=False)
     theme_preference = models.CharField(_("Тема оформления"), max_length=10, choices=THEME_CHOICES, default='light')
     
+    # Денормализованные счетчики (обновляются сигналами, сверяются командой reconcile_user_counters)
+    followers_count = models.PositiveIntegerField(_("Количество подписчиков"), default=0)
+    following_count = models.PositiveIntegerField(_("Количество подписок"), default=0)
+    posts_count = models.PositiveIntegerField(_("Количество постов"), default=0)
+    
+    COUNTER_FIELDS = ('followers_count', 'following_count', 'posts_count')
+    
     class Meta:
         verbose_name = _("Пользователь")
         verbose_name_plural = _("Пользователи")
     
     def __str__(self):
         return self.username
+    
+    def save(self, *args, **kwargs):
+        # Счетчики меняются только атомарным UPDATE (users.counters). Полное сохранение
+        # загруженного ранее экземпляра не должно перезаписывать их устаревшими значениями
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            skipped = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+                and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
 
 
 class Subscription(models.Model):
@@ -58,6 +78,11 @@ class Subscription(models.Model):
         verbose_name = _("Подписка")
         verbose_name_plural = _("Подписки")
         unique_together = ('follower', 'followed')  # Пользователь может подписаться на другого только один раз
+        indexes = [
+            # Списки подписчиков и подписок: курсорная пагинация по (created_at, id)
+            models.Index(fields=['followed', '-created_at', '-id'], name='subscription_followed_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='subscription_follower_idx'),
+        ]
     
     def __str__(self):
         return f"{self.follower.username} -> {self.followed.username}"
@@ -73,6 +98,15 @@ class VerificationCode(models.Model):
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Поиск действующего кода для номера телефона
+            models.Index(
+                fields=['phone', 'expires_at'], condition=models.Q(is_used=False),
+                name='verification_active_idx',
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.phone}: {self.code}"
     
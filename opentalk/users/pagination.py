@@ -0,0 +1,9 @@
+from opentalk.pagination import KeysetPagination
+
+
+class SubscriptionCursorPagination(KeysetPagination):
+    """
+    Курсорная пагинация подписчиков и подписок по ключу (created_at, id) подписки
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
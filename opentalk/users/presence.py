@@ -0,0 +1,154 @@
+"""
+Сервис присутствия пользователей (онлайн / офлайн / не беспокоить).
+
+Текущий статус хранится в кеше с ключом presence:<id> и временем жизни
+PRESENCE_TTL. Клиент продлевает его heartbeat-запросами (или ping по WebSocket);
+если heartbeat не приходит, ключ истекает и пользователь считается офлайн.
+Поэтому статусы для списка пользователей - это один get_many без запросов к базе.
+
+Колонка User.status - долговременная копия статуса. Изменения накапливаются
+в буфере процесса и записываются пачкой: один UPDATE только колонки status
+на каждое значение статуса, без сохранения всей строки пользователя через save().
+Пользователи с истекшим присутствием переводятся в офлайн функцией expire_presence
+(команда flush_presence).
+"""
+import atexit
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from opentalk.buffers import WriteBehindBuffer
+
+User = get_user_model()
+
+# Время жизни статуса без heartbeat, секунды
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 90)
+
+# Отложенная запись статусов в базу
+PRESENCE_FLUSH_INTERVAL_MS = getattr(settings, 'PRESENCE_FLUSH_INTERVAL_MS', 5000)
+PRESENCE_FLUSH_EVENTS = getattr(settings, 'PRESENCE_FLUSH_EVENTS', 500)
+
+# Период перевода в офлайн пользователей без heartbeat (manage.py flush_presence --follow), секунды
+PRESENCE_EXPIRE_INTERVAL = getattr(settings, 'PRESENCE_EXPIRE_INTERVAL', 30)
+
+# Максимальное количество пользователей в одном запросе статусов
+PRESENCE_MAX_IDS = getattr(settings, 'PRESENCE_MAX_IDS', 5000)
+
+# Сколько хранится снимок статусов для ответов с изменениями (since), секунды
+PRESENCE_SNAPSHOT_TIMEOUT = getattr(settings, 'PRESENCE_SNAPSHOT_TIMEOUT', 10 * 60)
+
+PRESENCE_CACHE_KEY = 'presence:{user_id}'
+PRESENCE_SNAPSHOT_CACHE_KEY = 'presence:snapshot:{version}'
+OFFLINE = 'offline'
+ONLINE = 'online'
+
+
+def _key(user_id):
+    return PRESENCE_CACHE_KEY.format(user_id=user_id)
+
+
+def set_status(user_id, status):
+    """Устанавливает статус, выбранный пользователем"""
+    cache.set(_key(user_id), status, PRESENCE_TTL)
+    presence_buffer.add(user_id, status)
+
+
+def heartbeat(user_id):
+    """
+    Продлевает присутствие пользователя. Выбранный статус (например, "не беспокоить")
+    сохраняется, после истечения присутствия пользователь снова становится онлайн.
+    """
+    status = cache.get(_key(user_id))
+    cache.set(_key(user_id), status or ONLINE, PRESENCE_TTL)
+    if status is None:
+        presence_buffer.add(user_id, ONLINE)
+    return status or ONLINE
+
+
+def get_status(user_id):
+    return cache.get(_key(user_id)) or OFFLINE
+
+
+def get_statuses(user_ids):
+    """Возвращает статусы пользователей {id: статус} одним запросом к кешу"""
+    keys = {_key(user_id): user_id for user_id in user_ids}
+    found = cache.get_many(keys.keys())
+    return {user_id: found.get(key) or OFFLINE for key, user_id in keys.items()}
+
+
+def statuses_version(statuses):
+    """
+    Версия набора статусов - хеш его содержимого. Одинаковые наборы статусов
+    у разных клиентов дают одну версию и один снимок в кеше.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for user_id in sorted(statuses):
+        digest.update(f'{user_id}:{statuses[user_id]};'.encode('ascii'))
+    return digest.hexdigest()
+
+
+def save_snapshot(version, statuses):
+    """Сохраняет набор статусов, чтобы следующий запрос мог получить только изменения"""
+    cache.set(PRESENCE_SNAPSHOT_CACHE_KEY.format(version=version), statuses, PRESENCE_SNAPSHOT_TIMEOUT)
+
+
+def get_changes(statuses, version):
+    """
+    Возвращает статусы, изменившиеся с версии version,
+    или None, если снимок этой версии уже недоступен
+    """
+    previous = cache.get(PRESENCE_SNAPSHOT_CACHE_KEY.format(version=version))
+    if previous is None:
+        return None
+    return {
+        user_id: status for user_id, status in statuses.items()
+        if previous.get(user_id) != status
+    }
+
+
+def expire_presence():
+    """
+    Переводит в офлайн в базе пользователей, присутствие которых истекло.
+    Возвращает количество таких пользователей.
+    """
+    active_ids = list(User.objects.exclude(status=OFFLINE).values_list('id', flat=True))
+    statuses = get_statuses(active_ids)
+    expired = [user_id for user_id, status in statuses.items() if status == OFFLINE]
+    if expired:
+        User.objects.filter(id__in=expired).update(status=OFFLINE)
+    return len(expired)
+
+
+class PresenceBuffer(WriteBehindBuffer):
+    """
+    Буфер отложенной записи статусов в базу.
+    
+    Для каждого пользователя хранится только последний статус, сброс выполняется
+    одним UPDATE на каждое значение статуса.
+    """
+    def empty(self):
+        return {}  # id пользователя -> статус
+    
+    def record(self, pending, user_id, status):
+        pending[user_id] = status
+    
+    def restore(self, pending):
+        # Статусы, которые успели перезаписать более новые, не возвращаем
+        for user_id, status in pending.items():
+            self._pending.setdefault(user_id, status)
+    
+    def write(self, pending):
+        by_status = defaultdict(list)
+        for user_id, status in pending.items():
+            by_status[status].append(user_id)
+        
+        for status, user_ids in by_status.items():
+            User.objects.filter(id__in=user_ids).update(status=status)
+        return len(pending)
+
+
+presence_buffer = PresenceBuffer(PRESENCE_FLUSH_INTERVAL_MS, PRESENCE_FLUSH_EVENTS)
+atexit.register(presence_buffer.flush)
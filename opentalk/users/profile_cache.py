@@ -0,0 +1,53 @@
+"""
+Кеш мини-профилей пользователей (id, username, full_name, avatar, is_verified).
+
+Мини-профиль вложен почти в каждый ответ API: автор поста и комментария,
+отправитель сообщения, участники подписки. Кеш сквозного чтения отдает профили
+пачкой через get_many и дочитывает из базы одним запросом только отсутствующие.
+
+Профиль сбрасывается при сохранении пользователя (users/signals.py);
+изменения через QuerySet.update() кеш не сбрасывают.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+User = get_user_model()
+
+MINI_PROFILE_FIELDS = ('id', 'username', 'full_name', 'avatar', 'is_verified')
+
+# Время жизни мини-профиля в кеше, секунды
+MINI_PROFILE_TIMEOUT = getattr(settings, 'MINI_PROFILE_TIMEOUT', 60 * 60)
+
+MINI_PROFILE_CACHE_KEY = 'user:mini:{user_id}'
+
+
+def get_mini_profiles(user_ids):
+    """
+    Возвращает {ID: пользователь} для списка ID. Пользователи содержат
+    только поля мини-профиля и предназначены для сериализации, а не для сохранения.
+    """
+    keys = {MINI_PROFILE_CACHE_KEY.format(user_id=user_id): user_id for user_id in set(user_ids)}
+    if not keys:
+        return {}
+
+    profiles = {keys[key]: data for key, data in cache.get_many(list(keys)).items()}
+    missing = set(keys.values()) - profiles.keys()
+    if missing:
+        # Читаем из основной базы: отставшая реплика закешировала бы устаревший профиль
+        loaded = {
+            row['id']: row
+            for row in User.objects.using(DEFAULT_DB_ALIAS).filter(id__in=missing).values(*MINI_PROFILE_FIELDS)
+        }
+        cache.set_many({
+            MINI_PROFILE_CACHE_KEY.format(user_id=user_id): row for user_id, row in loaded.items()
+        }, MINI_PROFILE_TIMEOUT)
+        profiles.update(loaded)
+
+    return {user_id: User(**data) for user_id, data in profiles.items()}
+
+
+def invalidate_mini_profile(user_id):
+    """Удаляет мини-профиль пользователя из кеша"""
+    cache.delete(MINI_PROFILE_CACHE_KEY.format(user_id=user_id))
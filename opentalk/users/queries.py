@@ -0,0 +1,29 @@
+"""
+Запросы подписок и кодов подтверждения, которые выполняются при открытии
+профиля и при входе по коду.
+
+Представления и сериализаторы строят выборки только через эти функции: по ним же
+команда check_query_plans проверяет планы выполнения.
+"""
+from django.utils import timezone
+
+from .models import Subscription, VerificationCode
+
+
+def followers(user):
+    """Подписки на пользователя вместе с подписчиками"""
+    return Subscription.objects.filter(followed=user).select_related('follower')
+
+
+def following(user):
+    """Подписки пользователя вместе с пользователями, на которых он подписан"""
+    return Subscription.objects.filter(follower=user).select_related('followed')
+
+
+def active_verification_code(phone):
+    """Последний неиспользованный и не истекший код подтверждения для телефона"""
+    return VerificationCode.objects.filter(
+        phone=phone,
+        is_used=False,
+        expires_at__gt=timezone.now()
+    ).order_by('-created_at').first()
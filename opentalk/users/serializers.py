@@ -4,7 +4,11 @@ from django.contrib.auth.password_validation import validate_password
 from django.utils import timezone
 import random
 import datetime
+from django.db import models
 from .models import Subscription, VerificationCode
+from . import counters, presence
+from .profile_cache import get_mini_profiles
+from .queries import active_verification_code
 
 User = get_user_model()
 
@@ -23,13 +27,22 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'last_login', 'is_premium', 'is_verified']
 
 
+class UserProfileListSerializer(serializers.ListSerializer):
+    """
+    Списочный сериализатор профилей: подписки текущего пользователя
+    на всех пользователей списка загружаются одним запросом.
+    """
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.preload(users)
+        return super().to_representation(users)
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     """
-    Расширенный сериализатор для профиля пользователя
+    Расширенный сериализатор для профиля пользователя.
+    Счетчики берутся из денормализованных колонок User (см. users/counters.py).
     """
-    followers_count = serializers.SerializerMethodField(read_only=True)
-    following_count = serializers.SerializerMethodField(read_only=True)
-    posts_count = serializers.SerializerMethodField(read_only=True)
     is_following = serializers.SerializerMethodField(read_only=True)
     
     class Meta:
@@ -40,18 +53,26 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'is_premium', 'is_verified', 'theme_preference',
             'followers_count', 'following_count', 'posts_count', 'is_following'
         ]
-        read_only_fields = ['id', 'created_at', 'last_login', 'is_premium', 'is_verified']
-    
-    def get_followers_count(self, obj):
-        return obj.followers.count()
-    
-    def get_following_count(self, obj):
-        return obj.following.count()
+        read_only_fields = [
+            'id', 'created_at', 'last_login', 'is_premium', 'is_verified',
+            'followers_count', 'following_count', 'posts_count'
+        ]
+        list_serializer_class = UserProfileListSerializer
     
-    def get_posts_count(self, obj):
-        return obj.posts.count()
+    def preload(self, users):
+        """
+        Загружает подписки текущего пользователя для списка пользователей
+        """
+        request = self.context.get('request')
+        self._following_ids = counters.following_ids(
+            request.user if request else None, [user.id for user in users]
+        )
     
     def get_is_following(self, obj):
+        following_ids = getattr(self, '_following_ids', None)
+        if following_ids is not None:
+            return obj.id in following_ids
+        
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Subscription.objects.filter(follower=request.user, followed=obj).exists()
@@ -60,11 +81,58 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class UserMiniSerializer(serializers.ModelSerializer):
     """
-    Упрощенный сериализатор пользователя для вложенных представлений
+    Упрощенный сериализатор пользователя для вложенных представлений.
+    
+    Во вложенном поле (user = UserMiniSerializer()) пользователь не загружается
+    по внешнему ключу: мини-профили для всех объектов сериализуемого списка
+    берутся из кеша одним запросом (см. users/profile_cache.py).
+    Если пользователь уже загружен (select_related), используется он.
     """
     class Meta:
         model = User
         fields = ['id', 'username', 'full_name', 'avatar', 'is_verified']
+    
+    def get_attribute(self, instance):
+        field = self._user_foreign_key(instance)
+        if field is None or field.is_cached(instance):
+            return super().get_attribute(instance)
+        
+        user_id = getattr(instance, field.attname)
+        if user_id is None:
+            return None
+        profiles = getattr(self, '_profiles', None)
+        if profiles is None or user_id not in profiles:
+            profiles = self._profiles = {**(profiles or {}), **get_mini_profiles(self._user_ids(instance, field))}
+        if user_id not in profiles:
+            return super().get_attribute(instance)
+        return profiles[user_id]
+    
+    def _user_foreign_key(self, instance):
+        """Внешний ключ на пользователя, из которого берется значение поля, или None"""
+        if len(self.source_attrs) != 1 or not isinstance(instance, models.Model):
+            return None
+        try:
+            field = instance._meta.get_field(self.source)
+        except Exception:
+            return None
+        if field.many_to_one and issubclass(field.related_model, User):
+            return field
+        return None
+    
+    def _user_ids(self, instance, field):
+        """ID пользователей всех объектов списка, который сериализует корневой сериализатор"""
+        user_ids = {getattr(instance, field.attname)}
+        parents = getattr(self.root, 'instance', None)
+        if isinstance(parents, models.QuerySet):
+            # Повторно обходим только уже загруженный QuerySet, чтобы не выполнить его заново
+            parents = parents._result_cache
+        if isinstance(parents, (list, tuple)):
+            user_ids.update(
+                getattr(parent, field.attname) for parent in parents
+                if type(parent) is type(instance)
+            )
+        user_ids.discard(None)
+        return user_ids
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -233,11 +301,7 @@ class PhoneLoginSerializer(serializers.Serializer):
         code = attrs['code']
         
         # Находим последний действительный код для данного телефона
-        verification = VerificationCode.objects.filter(
-            phone=phone,
-            is_used=False,
-            expires_at__gt=timezone.now()
-        ).order_by('-created_at').first()
+        verification = active_verification_code(phone)
         
         if not verification:
             raise serializers.ValidationError("Код подтверждения не найден или истек срок его действия.")
@@ -271,6 +335,55 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class SubscriptionUserListSerializer(serializers.ListSerializer):
+    """
+    Списочный сериализатор подписчиков/подписок: подписки текущего пользователя
+    на всех пользователей страницы загружаются одним запросом.
+    """
+    def to_representation(self, data):
+        subscriptions = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.preload(subscriptions)
+        return super().to_representation(subscriptions)
+
+
+class SubscriptionUserSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор подписки для списков подписчиков и подписок.
+    Возвращает только второго участника подписки: поле модели задается
+    в контексте ('follower' для списка подписчиков, 'followed' для списка подписок).
+    """
+    user = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Subscription
+        fields = ['id', 'user', 'is_following', 'created_at']
+        list_serializer_class = SubscriptionUserListSerializer
+    
+    def _user(self, obj):
+        return getattr(obj, self.context['user_field'])
+    
+    def preload(self, subscriptions):
+        """
+        Загружает подписки текущего пользователя на пользователей списка
+        """
+        request = self.context.get('request')
+        self._following_ids = counters.following_ids(
+            request.user if request else None,
+            [getattr(subscription, self.context['user_field'] + '_id') for subscription in subscriptions]
+        )
+    
+    def get_user(self, obj):
+        return UserMiniSerializer(self._user(obj), context=self.context).data
+    
+    def get_is_following(self, obj):
+        following_ids = getattr(self, '_following_ids', None)
+        if following_ids is None:
+            request = self.context.get('request')
+            following_ids = counters.following_ids(request.user if request else None, [self._user(obj).id])
+        return self._user(obj).id in following_ids
+
+
 class ChangePasswordSerializer(serializers.Serializer):
     """
     Сериализатор для изменения пароля
@@ -298,7 +411,7 @@ class UserStatusSerializer(serializers.Serializer):
     
     def update(self, instance, validated_data):
         instance.status = validated_data.get('status', instance.status)
-        instance.save()
+        presence.set_status(instance.id, instance.status)
         return instance 
 
 
@@ -334,6 +447,6 @@ class CreateUserByPhoneSerializer(serializers.ModelSerializer):
         # Устанавливаем случайный пароль
         password = ''.join(random.choices('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=12))
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password'])
         
         return user 
\ No newline at end of file
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from opentalk.response_cache import invalidate
+from .models import Subscription, User
+from . import counters
+from .profile_cache import invalidate_mini_profile
+
+
+@receiver(post_save, sender=Subscription)
+def count_new_subscription(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счетчики подписчиков и подписок"""
+    if created and not raw:
+        counters.increment(instance.followed_id, 'followers_count')
+        counters.increment(instance.follower_id, 'following_count')
+
+
+@receiver(post_delete, sender=Subscription)
+def count_deleted_subscription(sender, instance, **kwargs):
+    """Уменьшает счетчики подписчиков и подписок"""
+    counters.decrement(instance.followed_id, 'followers_count')
+    counters.decrement(instance.follower_id, 'following_count')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_responses(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кеш ответов профиля пользователя"""
+    if not raw:
+        invalidate(f'user:{instance.id}')
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_users(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кеш профилей: изменились счетчики и признак подписки"""
+    if not raw:
+        invalidate(f'user:{instance.followed_id}', f'user:{instance.follower_id}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_mini_profile(sender, instance, raw=False, **kwargs):
+    """Сбрасывает мини-профиль пользователя в кеше после фиксации транзакции"""
+    if not raw:
+        user_id = instance.id
+        transaction.on_commit(lambda: invalidate_mini_profile(user_id))
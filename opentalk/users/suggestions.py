@@ -0,0 +1,96 @@
+"""
+Рекомендации пользователей для подписки.
+
+Кандидаты - "друзья друзей": пользователи, на которых подписаны те, на кого
+подписан пользователь, упорядоченные по количеству таких общих связей.
+Список кандидатов считается одним запросом по графу подписок, кешируется
+на SUGGESTIONS_TIMEOUT и может предварительно рассчитываться пачками
+командой compute_suggestions. Запрос рекомендаций - чтение из кеша.
+
+Новым пользователям без подписок (и если кандидатов мало) рекомендации
+дополняются случайной выборкой из популярных пользователей, без ORDER BY RANDOM().
+"""
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Subscription
+from .counters import following_ids
+
+User = get_user_model()
+
+# Сколько кандидатов хранится в кеше для одного пользователя
+SUGGESTIONS_CANDIDATES = getattr(settings, 'SUGGESTIONS_CANDIDATES', 50)
+
+# Время жизни списка кандидатов, секунды
+SUGGESTIONS_TIMEOUT = getattr(settings, 'SUGGESTIONS_TIMEOUT', 6 * 60 * 60)
+
+# Размер пула популярных пользователей для случайной выборки
+SUGGESTIONS_POPULAR_POOL = getattr(settings, 'SUGGESTIONS_POPULAR_POOL', 500)
+SUGGESTIONS_POPULAR_TIMEOUT = 60 * 60  # час
+
+SUGGESTIONS_CACHE_KEY = 'suggestions:{user_id}'
+POPULAR_CACHE_KEY = 'suggestions:popular'
+
+
+def friends_of_friends(user_id, limit=SUGGESTIONS_CANDIDATES):
+    """Возвращает ID кандидатов, упорядоченные по количеству общих связей"""
+    followed = Subscription.objects.filter(follower_id=user_id).values('followed_id')
+    return list(
+        Subscription.objects.filter(follower_id__in=followed)
+        .exclude(followed_id__in=followed)
+        .exclude(followed_id=user_id)
+        .values('followed_id')
+        .annotate(mutual=Count('follower_id'))
+        .order_by('-mutual', '-followed__followers_count', 'followed_id')
+        .values_list('followed_id', flat=True)[:limit]
+    )
+
+
+def popular_user_ids():
+    """Пул популярных пользователей для рекомендаций новичкам"""
+    pool = cache.get(POPULAR_CACHE_KEY)
+    if pool is None:
+        pool = list(
+            User.objects.filter(is_active=True).order_by('-followers_count', '-id')
+            .values_list('id', flat=True)[:SUGGESTIONS_POPULAR_POOL]
+        )
+        cache.set(POPULAR_CACHE_KEY, pool, SUGGESTIONS_POPULAR_TIMEOUT)
+    return pool
+
+
+def compute_suggestions(user_id):
+    """Рассчитывает и кеширует список кандидатов для пользователя"""
+    candidates = friends_of_friends(user_id)
+    cache.set(SUGGESTIONS_CACHE_KEY.format(user_id=user_id), candidates, SUGGESTIONS_TIMEOUT)
+    return candidates
+
+
+def precompute_suggestions(user_ids):
+    """Рассчитывает рекомендации для списка пользователей. Возвращает их количество"""
+    computed = 0
+    for user_id in user_ids:
+        compute_suggestions(user_id)
+        computed += 1
+    return computed
+
+
+def get_suggestions(user, count=10):
+    """
+    Возвращает до count ID пользователей, рекомендованных для подписки:
+    сначала кандидаты из графа подписок, затем случайные популярные пользователи
+    """
+    candidates = cache.get(SUGGESTIONS_CACHE_KEY.format(user_id=user.id))
+    if candidates is None:
+        candidates = compute_suggestions(user.id)
+    
+    if len(candidates) < count:
+        pool = [user_id for user_id in popular_user_ids() if user_id not in candidates]
+        candidates = candidates + random.sample(pool, min(len(pool), count * 3))
+    
+    # С момента расчета пользователь мог подписаться на кого-то из кандидатов
+    excluded = following_ids(user, candidates) | {user.id}
+    return [user_id for user_id in candidates if user_id not in excluded][:count]
@@ -1,3 +1,301 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+
+from opentalk.testing import OpenTalkTestCase, PresenceTestCase
+from .counters import reconcile_user_counters
+from .models import Subscription, User
+from .profile_cache import get_mini_profiles
+from . import presence, suggestions
+
+
+class PresenceTests(PresenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='x')
+        self.others = [User.objects.create_user(f'other{i}', password='x') for i in range(5)]
+        self.client = self.client_for(self.user)
+
+    def test_statuses_are_read_from_cache(self):
+        response = self.client.patch('/api/update-status/', {'status': 'dnd'}, format='json')
+        self.assertEqual(response.json()['status'], 'dnd')
+        presence.heartbeat(self.others[0].id)
+
+        with CaptureQueriesContext(connection) as queries:
+            statuses = self.client.post(
+                '/api/online-status/', {'userIds': [self.user.id] + [other.id for other in self.others]}, format='json'
+            ).json()
+        self.assertEqual(len(queries), 0)
+        self.assertFalse(statuses['delta'])
+        self.assertEqual(statuses['online'], {str(self.user.id): 'dnd', str(self.others[0].id): 'online'})
+        self.assertEqual(statuses['offline'], [other.id for other in self.others[1:]])
+        # Heartbeat сохраняет выбранный статус
+        self.assertEqual(self.client.post('/api/heartbeat/').json()['status'], 'dnd')
+
+    def test_statuses_are_written_behind(self):
+        self.client.patch('/api/update-status/', {'status': 'dnd'}, format='json')
+        presence.heartbeat(self.others[0].id)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.status, 'offline')
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.status, 'dnd')
+
+        cache.delete(presence.PRESENCE_CACHE_KEY.format(user_id=self.user.id))
+        self.assertEqual(presence.expire_presence(), 1)
+        self.user.refresh_from_db()
+        self.others[0].refresh_from_db()
+        self.assertEqual((self.user.status, self.others[0].status), ('offline', 'online'))
+
+    def test_failed_flush_keeps_newest_statuses(self):
+        presence.set_status(self.user.id, 'dnd')
+        with mock.patch.object(presence.User.objects, 'filter', side_effect=DatabaseError), \
+                self.assertLogs('opentalk.buffers', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        # Более новый статус не перезаписывается возвращенным в буфер
+        presence.set_status(self.user.id, 'online')
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.status, 'online')
+
+
+class PresenceDeltaTests(PresenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(User.objects.create_user('user', password='x'))
+        self.user_ids = list(range(1, 3001))
+        for user_id in (5, 6, 7):
+            presence.heartbeat(user_id)
+
+    def lookup(self, since=None, **headers):
+        data = {'userIds': self.user_ids}
+        if since:
+            data['since'] = since
+        return self.client.post('/api/online-status/', data, format='json', headers=headers)
+
+    def test_unchanged_statuses_return_not_modified(self):
+        response = self.lookup()
+        self.assertEqual(response.json()['version'], response['ETag'].strip('"'))
+        self.assertEqual(len(response.json()['offline']), 2997)
+        etag = response['ETag']
+
+        self.assertEqual(self.lookup(**{'If-None-Match': etag}).status_code, 304)
+        response = self.lookup(since=etag.strip('"'))
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_delta_contains_only_changes(self):
+        version = self.lookup()['ETag'].strip('"')
+        presence.set_status(5, 'dnd')
+        presence.heartbeat(8)
+
+        response = self.lookup(since=version).json()
+        self.assertTrue(response['delta'])
+        self.assertEqual((response['online'], response['offline']), ({'5': 'dnd', '8': 'online'}, []))
+        self.assertNotEqual(response['version'], version)
+
+        # Ушедший в офлайн попадает в список offline изменений
+        version = response['version']
+        presence.set_status(6, 'offline')
+        response = self.lookup(since=version).json()
+        self.assertEqual((response['online'], response['offline']), ({}, [6]))
+
+    def test_unknown_version_returns_all_statuses(self):
+        response = self.lookup(since='unknown').json()
+        self.assertFalse(response['delta'])
+        self.assertEqual(response['online'], {'5': 'online', '6': 'online', '7': 'online'})
+        self.assertEqual(len(response['offline']), 2997)
+
+    def test_too_many_ids(self):
+        with mock.patch.object(presence, 'PRESENCE_MAX_IDS', 100):
+            self.assertEqual(self.lookup().status_code, 400)
+
+
+class UserCounterTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('user', password='x')
+        self.author = User.objects.create_user('author', password='x')
+        self.client = self.client_for(self.user)
+
+    def counts(self, user):
+        user.refresh_from_db()
+        return user.followers_count, user.following_count, user.posts_count
+
+    def test_counters_follow_subscriptions_and_posts(self):
+        from posts.models import Post
+
+        self.client.post(f'/api/users/{self.author.id}/follow/')
+        post = Post.objects.create(user=self.author, content='hello')
+        self.assertEqual(self.counts(self.author), (1, 0, 1))
+        self.assertEqual(self.counts(self.user), (0, 1, 0))
+        self.assertEqual(self.client.get('/api/users/me/').json()['following_count'], 1)
+
+        self.client.delete(f'/api/users/{self.author.id}/unfollow/')
+        post.delete()
+        self.assertEqual(self.counts(self.author), (0, 0, 0))
+        self.assertEqual(self.counts(self.user), (0, 0, 0))
+
+    def test_reconcile_fixes_bulk_changes(self):
+        Subscription.objects.bulk_create([Subscription(follower=self.user, followed=self.author)])
+        self.assertEqual(self.counts(self.author), (0, 0, 0))
+        self.assertEqual(reconcile_user_counters(), 2)
+        self.assertEqual(self.counts(self.author), (1, 0, 0))
+        self.assertEqual(self.counts(self.user), (0, 1, 0))
+
+    def test_stale_instance_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Subscription.objects.create(follower=self.user, followed=self.author)
+
+        stale.bio = 'bio'
+        stale.save()
+        self.assertEqual(self.counts(self.author), (1, 0, 0))
+        self.assertEqual(self.author.bio, 'bio')
+
+        # Обновление профиля и пароля текущего пользователя тоже не трогает счетчики
+        self.client.put('/api/users/update_me/', {'bio': 'me'}, format='json')
+        self.client.put('/api/change-password/', {'old_password': 'x', 'new_password': 'N3w-passw0rd!'}, format='json')
+        self.assertEqual(self.counts(self.user), (0, 1, 0))
+        self.assertEqual(self.user.bio, 'me')
+
+
+class SuggestionTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, a, b, self.c, self.d = [
+            User.objects.create_user(name, password='x') for name in ('user', 'a', 'b', 'c', 'd')
+        ]
+        for follower, followed in ((self.user, a), (self.user, b), (a, self.c), (a, self.d), (b, self.c),
+                                   (a, self.user), (self.d, a)):
+            Subscription.objects.create(follower=follower, followed=followed)
+        self.client = self.client_for(self.user)
+
+    def suggested(self):
+        return [user['id'] for user in self.client.get('/api/users/suggested/').json()]
+
+    def test_friends_of_friends_come_first(self):
+        self.assertEqual(suggestions.friends_of_friends(self.user.id), [self.c.id, self.d.id])
+        self.assertEqual(self.suggested()[:2], [self.c.id, self.d.id])
+
+        # Кеш кандидатов не мешает исключить новую подписку
+        self.client.post(f'/api/users/{self.c.id}/follow/')
+        self.assertEqual(self.suggested()[0], self.d.id)
+        self.assertNotIn(self.c.id, self.suggested())
+
+    def test_new_users_get_popular_users(self):
+        newcomer = User.objects.create_user('newcomer', password='x')
+        found = suggestions.get_suggestions(newcomer)
+        # Без подписок рекомендуются популярные пользователи, кроме самого новичка
+        self.assertEqual(set(found), set(User.objects.exclude(pk=newcomer.pk).values_list('id', flat=True)))
+
+    def test_compute_suggestions_command(self):
+        call_command('compute_suggestions', stdout=StringIO())
+        self.assertEqual(cache.get(suggestions.SUGGESTIONS_CACHE_KEY.format(user_id=self.user.id)),
+                         [self.c.id, self.d.id])
+
+
+class SubscriptionListTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.star = User.objects.create_user('star', password='x')
+        self.fans = [User.objects.create(username=f'fan{i}') for i in range(45)]
+        for fan in self.fans:
+            Subscription.objects.create(follower=fan, followed=self.star)
+        # Текущий пользователь подписан на часть подписчиков
+        self.viewer = self.fans[0]
+        for fan in self.fans[1:6]:
+            Subscription.objects.create(follower=self.viewer, followed=fan)
+        self.client = self.client_for(self.viewer)
+
+    def test_followers_are_paged_by_cursor(self):
+        url, usernames, following = f'/api/users/{self.star.id}/followers/', [], set()
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            self.assertLessEqual(len(queries), 4)
+            usernames += [item['user']['username'] for item in page['results']]
+            following |= {item['user']['username'] for item in page['results'] if item['is_following']}
+            url = page['next']
+        self.assertEqual(usernames, [fan.username for fan in reversed(self.fans)])
+        self.assertEqual(following, {f'fan{i}' for i in range(1, 6)})
+
+    def test_following_returns_followed_users(self):
+        page = self.client.get(f'/api/users/{self.viewer.id}/following/').json()
+        self.assertEqual([item['user']['username'] for item in page['results']],
+                         ['fan5', 'fan4', 'fan3', 'fan2', 'fan1', 'star'])
+        self.assertIsNone(page['next'])
+        self.assertEqual(self.client.get(f'/api/users/{self.star.id}/followers/', {'cursor': 'x'}).status_code, 404)
+
+
+class QueryPlanTests(OpenTalkTestCase):
+    def test_hot_queries_use_indexes(self):
+        output = StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertIn('Все запросы используют индексы', output.getvalue())
+
+    def test_full_scans_are_detected(self):
+        from opentalk.query_plans import check_plan
+
+        self.assertEqual(check_plan('SCAN posts_post'), (['posts_post'], False))
+        plan = 'SCAN posts_post USING INDEX post_created_idx\nUSE TEMP B-TREE FOR ORDER BY'
+        self.assertEqual(check_plan(plan), (['posts_post'], True))
+        # Обход индекса с LIMIT останавливается на первой странице
+        self.assertEqual(check_plan(plan, limited=True), ([], True))
+        self.assertEqual(check_plan('SEARCH posts_post USING INDEX post_user_idx (user_id=?)'), ([], False))
+
+    def test_checked_queries_come_from_view_helpers(self):
+        from opentalk.query_plans import captured_queries, hot_queries
+
+        queries = dict(hot_queries())
+        sql = captured_queries(queries['Список чатов'])
+        self.assertEqual(len(sql), 1)
+        self.assertIn('"messages_api_inboxstate"."unread_count"', sql[0])
+        self.assertIn('LIMIT 21', sql[0])
+        # Проверяются все запросы функции: страница истории и признак более новых сообщений
+        self.assertEqual(len(captured_queries(queries['История чата'])), 2)
+
+    def test_unsupported_database_is_reported(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            with self.assertRaisesMessage(CommandError, 'текущая база: mysql'):
+                call_command('check_query_plans', stdout=StringIO())
+
+
+class MiniProfileTests(OpenTalkTestCase):
+    def setUp(self):
+        super().setUp()
+        from posts.models import Post
+
+        self.users = [User.objects.create(username=f'user{i}', full_name=f'Name {i}') for i in range(5)]
+        for user in self.users:
+            for i in range(3):
+                Post.objects.create(user=user, content=f'post{i}')
+        self.client = self.client_for(self.users[0])
+
+    def test_authors_are_read_from_cache(self):
+        first = self.client.get('/api/posts/').json()
+        self.assertEqual(first['results'][0]['user']['username'], 'user4')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/posts/').json(), first)
+        self.assertFalse([query['sql'] for query in queries if 'FROM "users_user"' in query['sql']])
+
+        # Авторы страницы уже в кеше, недостающий профиль дочитывается одним запросом
+        with CaptureQueriesContext(connection) as queries:
+            profiles = get_mini_profiles({post['user']['id'] for post in first['results']})
+        self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            profiles = get_mini_profiles([user.id for user in self.users])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(profiles[self.users[0].id].full_name, 'Name 0')
+
+    def test_saved_user_leaves_the_cache(self):
+        get_mini_profiles([self.users[4].id])
+        self.users[4].full_name = 'Changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[4].save()
+        self.assertEqual(self.client.get('/api/posts/').json()['results'][0]['user']['full_name'], 'Changed')
+        self.assertEqual(get_mini_profiles([self.users[4].id])[self.users[4].id].full_name, 'Changed')
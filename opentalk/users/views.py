@@ -5,16 +5,23 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from .models import Subscription, VerificationCode
+from . import presence, queries
+from .suggestions import get_suggestions
 from .serializers import (
     UserSerializer, UserProfileSerializer, UserMiniSerializer,
-    RegisterSerializer, SubscriptionSerializer, ChangePasswordSerializer,
+    RegisterSerializer, SubscriptionUserSerializer, ChangePasswordSerializer,
     SendVerificationCodeSerializer, VerifyCodeSerializer, PhoneLoginSerializer,
     CreateUserByPhoneSerializer
 )
 from posts.serializers import PostSerializer
+from posts.queries import user_posts
+from posts.pagination import PostCursorPagination
+from opentalk.pagination import ActionPaginationMixin
+from opentalk.response_cache import cache_response
+from opentalk.routers import ReplicaReadMixin
+from .pagination import SubscriptionCursorPagination
 import io
 import qrcode
 from django.http import HttpResponse
@@ -69,7 +76,7 @@ class ChangePasswordView(generics.UpdateAPIView):
         
         # Устанавливаем новый пароль
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         
         return Response(
             {"message": "Пароль успешно изменен"},
@@ -249,46 +256,40 @@ class UpdateStatusView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     
     def patch(self, request, *args, **kwargs):
-        # Логирование для диагностики
-        print(f"UpdateStatusView.patch: получен запрос от пользователя {request.user.id}")
-        print(f"UpdateStatusView.patch: данные запроса - {request.data}")
-        
         user = request.user
         status_value = request.data.get('status')
         
         # Проверка валидности статуса
         valid_statuses = dict(User.STATUS_CHOICES).keys()
-        print(f"UpdateStatusView.patch: допустимые статусы - {valid_statuses}")
         
         # Обработка статуса "do_not_disturb" -> "dnd"
         if status_value == 'do_not_disturb':
             status_value = 'dnd'
         
-        print(f"UpdateStatusView.patch: проверяем статус {status_value}")
-        
         if status_value not in valid_statuses:
-            print(f"UpdateStatusView.patch: недопустимый статус {status_value}")
             return Response(
                 {"error": f"Неверный статус. Допустимые значения: {', '.join(valid_statuses)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Обновление статуса
-        user.status = status_value
-        user.save()
-        
-        print(f"UpdateStatusView.patch: статус успешно обновлен на {user.status}")
+        # Обновление статуса (в базу записывается пакетно сервисом присутствия)
+        presence.set_status(user.id, status_value)
         
-        return Response({"status": user.status, "message": "Статус успешно обновлен"})
+        return Response({"status": status_value, "message": "Статус успешно обновлен"})
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, ActionPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с пользователями
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    action_pagination_classes = {
+        'posts': PostCursorPagination,
+        'followers': SubscriptionCursorPagination,
+        'following': SubscriptionCursorPagination,
+    }
     filter_backends = [filters.SearchFilter]
     search_fields = ['username', 'full_name', 'bio']
     
@@ -302,6 +303,10 @@ class UserViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [permissions.IsAdminUser()]
     
+    @cache_response('user:{pk}')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         """Получение данных текущего пользователя"""
@@ -322,24 +327,24 @@ class UserViewSet(viewsets.ModelViewSet):
     def followers(self, request, pk=None):
         """Получение списка подписчиков пользователя"""
         user = self.get_object()
-        subscriptions = Subscription.objects.filter(followed=user)
-        page = self.paginate_queryset(subscriptions)
-        if page is not None:
-            serializer = SubscriptionSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = SubscriptionSerializer(subscriptions, many=True)
-        return Response(serializer.data)
+        subscriptions = queries.followers(user)
+        return self._subscription_users(subscriptions, 'follower')
     
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def following(self, request, pk=None):
         """Получение списка подписок пользователя"""
         user = self.get_object()
-        subscriptions = Subscription.objects.filter(follower=user)
+        subscriptions = queries.following(user)
+        return self._subscription_users(subscriptions, 'followed')
+    
+    def _subscription_users(self, subscriptions, user_field):
+        """Страница подписок, в которой сериализуется только второй участник подписки"""
+        context = {**self.get_serializer_context(), 'user_field': user_field}
         page = self.paginate_queryset(subscriptions)
         if page is not None:
-            serializer = SubscriptionSerializer(page, many=True)
+            serializer = SubscriptionUserSerializer(page, many=True, context=context)
             return self.get_paginated_response(serializer.data)
-        serializer = SubscriptionSerializer(subscriptions, many=True)
+        serializer = SubscriptionUserSerializer(subscriptions, many=True, context=context)
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
@@ -392,7 +397,7 @@ class UserViewSet(viewsets.ModelViewSet):
     def posts(self, request, pk=None):
         """Получение постов пользователя"""
         user = self.get_object()
-        posts = user.posts.all()
+        posts = user_posts(user)
         page = self.paginate_queryset(posts)
         if page is not None:
             serializer = PostSerializer(page, many=True, context={'request': request})
@@ -403,17 +408,11 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def suggested(self, request):
         """Получение рекомендуемых пользователей для подписки"""
-        current_user = request.user
-        
-        # Находим пользователей, на которых подписан текущий пользователь
-        following_ids = Subscription.objects.filter(
-            follower=current_user
-        ).values_list('followed_id', flat=True)
+        suggested_ids = get_suggestions(request.user, count=10)
         
-        # Исключаем их и текущего пользователя из результатов
-        suggested_users = User.objects.exclude(
-            Q(id=current_user.id) | Q(id__in=following_ids)
-        ).order_by('?')[:10]  # Случайная выборка 10 пользователей
+        # Сохраняем порядок рекомендаций
+        users_by_id = User.objects.in_bulk(suggested_ids)
+        suggested_users = [users_by_id[user_id] for user_id in suggested_ids if user_id in users_by_id]
         
         serializer = UserMiniSerializer(suggested_users, many=True)
         return Response(serializer.data)
@@ -437,11 +436,10 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Обновление статуса
-        user.status = status_value
-        user.save()
+        # Обновление статуса (в базу записывается пакетно сервисом присутствия)
+        presence.set_status(user.id, status_value)
         
-        return Response({"status": user.status, "message": "Статус успешно обновлен"})
+        return Response({"status": status_value, "message": "Статус успешно обновлен"})
 
 
 class LogoutView(generics.GenericAPIView):
@@ -478,7 +476,15 @@ class LogoutView(generics.GenericAPIView):
 
 class OnlineStatusView(generics.GenericAPIView):
     """
-    View для получения статусов онлайн пользователей
+    View для получения статусов онлайн пользователей.
+    
+    Ответ всегда имеет вид {version, delta, online, offline}: online - статусы
+    пользователей не в офлайне ({id: статус}), offline - список ID офлайн.
+    Без since (или если снимок версии since уже не хранится) возвращается полный
+    набор (delta: false), с since - только изменившиеся статусы (delta: true).
+    
+    Ответ содержит заголовок ETag с версией набора статусов. Если версия совпадает
+    с переданной в If-None-Match или since, возвращается 304.
     """
     permission_classes = [IsAuthenticated]
     
@@ -491,18 +497,54 @@ class OnlineStatusView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Получение статусов пользователей
-        users = User.objects.filter(id__in=user_ids)
+        if len(user_ids) > presence.PRESENCE_MAX_IDS:
+            return Response(
+                {"detail": f"Можно запросить не более {presence.PRESENCE_MAX_IDS} пользователей."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Формирование ответа
-        statuses = {}
-        for user in users:
-            statuses[str(user.id)] = {
-                'status': user.status,
-                'is_online': user.status == 'online'
-            }
+        # Получение статусов пользователей из кеша присутствия
+        try:
+            user_ids = [int(user_id) for user_id in user_ids]
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "userIds должен быть списком целых чисел."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        statuses = presence.get_statuses(user_ids)
+        version = presence.statuses_version(statuses)
+        etag = f'"{version}"'
+        since = request.data.get('since')
+        
+        # Статусы не изменились с прошлого запроса клиента
+        if since == version or request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        presence.save_snapshot(version, statuses)
+        
+        changes = presence.get_changes(statuses, since) if since else None
         
-        return Response(statuses)
+        # Формирование ответа: полный набор или только изменения
+        result = {'version': version, 'delta': changes is not None, 'online': {}, 'offline': []}
+        for user_id, user_status in (statuses if changes is None else changes).items():
+            if user_status == presence.OFFLINE:
+                result['offline'].append(user_id)
+            else:
+                result['online'][str(user_id)] = user_status
+        
+        return Response(result, headers={'ETag': etag})
+
+
+class HeartbeatView(generics.GenericAPIView):
+    """
+    View для продления присутствия пользователя онлайн
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        user_status = presence.heartbeat(request.user.id)
+        return Response({"status": user_status, "ttl": presence.PRESENCE_TTL})
 
 
 class QRCodeView(generics.GenericAPIView):